@@ -0,0 +1,42 @@
+"""
+Compares the cost of the image hashing strategies (imgui_cv.HashStrategy) across image sizes,
+together with the former implementation of the fast hash
+(new random indices at each call + hash of a python tuple).
+
+Run it with:
+    python -m benchmarks.bench_hash    (from the root of the repository)
+"""
+import timeit
+import numpy as np
+from imgui_datascience import imgui_cv
+
+
+def _former_fast_hash(image):
+    rng = np.random.RandomState(89)
+    inds = rng.randint(low=0, high=image.size, size=100)
+    b = image.flat[inds]
+    return hash(tuple(b.data))
+
+
+def _time_per_call_ms(function, nb_calls):
+    return timeit.timeit(function, number=nb_calls) / nb_calls * 1000.
+
+
+def main():
+    sizes = [(640, 480), (1920, 1080), (4000, 3000), (8000, 6000)]
+    strategies = list(imgui_cv.HashStrategy)
+    column_names = ["former fast"] + [strategy.value for strategy in strategies]
+    header = "{0:<12}".format("image") + "".join("{0:>16}".format(name) for name in column_names)
+    print(header + "    (ms per call)")
+    rng = np.random.RandomState(0)
+    for width, height in sizes:
+        image = rng.randint(0, 256, (height, width, 3)).astype(np.uint8)
+        nb_calls = max(3, int(2E8 / image.size) // 100)
+        timings = [_time_per_call_ms(lambda: _former_fast_hash(image), nb_calls)]
+        for strategy in strategies:
+            timings.append(_time_per_call_ms(lambda: imgui_cv._hash_image(image, strategy), nb_calls))
+        print("{0:<12}".format("{0}x{1}".format(width, height)) + "".join("{0:>16.3f}".format(t) for t in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures the memory allocated by one texture refresh (i.e. the preparation of the image that is
+transferred to the GPU), with the current pipeline and with the former one
+(copy.deepcopy of the image, then adjustment, then conversion to BGR).
+
+Run it with:
+    python -m benchmarks.bench_refresh_allocations    (from the root of the repository)
+"""
+import copy
+import tracemalloc
+import numpy as np
+from imgui_datascience import imgui_cv
+
+
+def _former_refresh(image_and_adjustments):
+    image_and_adjustments_copy = copy.deepcopy(image_and_adjustments)
+    image = image_and_adjustments_copy.image
+    adjustments = image_and_adjustments_copy.image_adjustments
+    if adjustments.is_none():
+        img_adjusted = image
+    else:
+        img_adjusted = ((image + adjustments.delta) * adjustments.factor).astype(image.dtype)
+    return imgui_cv._to_rgb_image(img_adjusted)
+
+
+def _current_refresh(image_and_adjustments):
+    img_upload, _ = imgui_cv._image_for_upload(image_and_adjustments)
+    return img_upload
+
+
+def _peak_allocated_bytes(refresh_function, image_and_adjustments):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = refresh_function(image_and_adjustments)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def _make_images(width=4000, height=3000):
+    rng = np.random.RandomState(0)
+    bgr = rng.randint(0, 256, (height, width, 3)).astype(np.uint8)
+    return {
+        "uint8 grey": bgr[:, :, 0].copy(),
+        "uint8 BGR": bgr,
+        "uint8 BGRA": np.dstack([bgr, bgr[:, :, :1]]),
+        "float32": bgr[:, :, 0].astype(np.float32) / 255.,
+        "float64": bgr[:, :, 0].astype(np.float64) / 255.,
+    }
+
+
+def main():
+    all_adjustments = {
+        "no adjustment": imgui_cv.ImageAdjustments(),
+        "adjusted": imgui_cv.ImageAdjustments(factor=2., delta=0.1),
+    }
+    print("{0:<12} {1:<14} {2:>12} {3:>12} {4:>12}".format(
+        "image", "adjustments", "image (MB)", "former (MB)", "current (MB)"))
+    for image_name, image in _make_images().items():
+        for adjustments_name, adjustments in all_adjustments.items():
+            image_and_adjustments = imgui_cv.ImageAndAdjustments(image, adjustments)
+            former = _peak_allocated_bytes(_former_refresh, image_and_adjustments)
+            current = _peak_allocated_bytes(_current_refresh, image_and_adjustments)
+            print("{0:<12} {1:<14} {2:>12.1f} {3:>12.1f} {4:>12.1f}".format(
+                image_name, adjustments_name, image.nbytes / 1E6, former / 1E6, current / 1E6))
+
+
+if __name__ == "__main__":
+    main()
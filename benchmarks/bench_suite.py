@@ -0,0 +1,309 @@
+"""
+Benchmark suite for the hot paths of imgui_cv, image_explorer, imgui_fig and the image lister,
+on synthetic images of several sizes (0.3 to 100 MPixels) and dtypes.
+
+The results are written as json, and can be compared to a saved baseline
+(the run fails if a benchmark is slower than its baseline by more than the tolerance).
+
+Run it with (from the root of the repository):
+    python -m benchmarks.bench_suite --save-baseline              # saves benchmarks/baseline.json
+    python -m benchmarks.bench_suite --compare                    # compares to benchmarks/baseline.json
+    python -m benchmarks.bench_suite --quick --output results.json
+
+The baseline depends on the machine: save it on the machine where the comparisons are made.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import *
+
+import cv2
+import imgui
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot
+
+from imgui_datascience import imgui_cv, imgui_fig, imgui_plot, imgui_runner, imgui_scatter
+from imgui_datascience.imgui_cv import SizePixel
+from imgui_datascience.imgui_image_lister import _ImguiImageLister
+from imgui_datascience._imgui_cv_zoom import ImageWithZoomInfo, image_explorer_autostore_zoominfo, compute_zoom_matrix
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# name -> (width, height)
+IMAGE_SIZES = {
+    "0.3MP": (640, 480),
+    "2MP": (1920, 1080),
+    "12MP": (4000, 3000),
+    "100MP": (10000, 10000),
+}
+QUICK_IMAGE_SIZES = ["0.3MP", "2MP"]
+
+# name -> (nb channels, dtype)
+IMAGE_TYPES = {
+    "gray_u8": (1, np.uint8),
+    "bgr_u8": (3, np.uint8),
+    "bgra_u8": (4, np.uint8),
+    "gray_f32": (1, np.float32),
+    "gray_f64": (1, np.float64),
+}
+
+VIEWPORT_SIZE = SizePixel(800, 600)
+
+
+def synthetic_image(width, height, nb_channels, dtype, seed=0):
+    shape = (height, width) if nb_channels == 1 else (height, width, nb_channels)
+    nb_values = int(np.prod(shape))
+    values = np.frombuffer(np.random.RandomState(seed).bytes(nb_values), np.uint8).reshape(shape)
+    if dtype == np.uint8:
+        return values.copy()
+    return values.astype(dtype) / 255.
+
+
+def measure(function, min_duration=0.2, nb_repeats=5) -> Dict[str, float]:
+    """
+    Returns the median and min duration of a call (in ms), over nb_repeats measures of at least min_duration
+    """
+    timer = timeit.Timer(function)
+    nb_calls = 1
+    while True:
+        duration = timer.timeit(nb_calls)
+        if duration >= min_duration / nb_repeats or nb_calls >= 1000000:
+            break
+        nb_calls *= 2
+    durations = [duration / nb_calls] + [timer.timeit(nb_calls) / nb_calls for _ in range(nb_repeats - 1)]
+    return {"median_ms": float(np.median(durations)) * 1000., "min_ms": float(np.min(durations)) * 1000.}
+
+
+def bench_images(size_names, min_duration) -> Dict[str, Dict[str, float]]:
+    results = {}
+    adjustments = imgui_cv.ImageAdjustments(factor=2., delta=10.)
+    for size_name in size_names:
+        width, height = IMAGE_SIZES[size_name]
+        for type_name, (nb_channels, dtype) in IMAGE_TYPES.items():
+            image = synthetic_image(width, height, nb_channels, dtype)
+            suffix = f"[{size_name},{type_name}]"
+            print(f"  images {suffix}", file=sys.stderr)
+
+            for strategy in imgui_cv.HashStrategy:
+                results[f"hash_image[{strategy.value}]{suffix}"] = measure(
+                    lambda: imgui_cv._hash_image(image, strategy), min_duration)
+
+            if dtype == np.uint8 or nb_channels == 1:
+                results["to_rgb_image" + suffix] = measure(lambda: imgui_cv._to_rgb_image(image), min_duration)
+                _, upload_dtype = imgui_cv._native_texture_format(image)
+                results["adjust" + suffix] = measure(lambda: adjustments.adjust(image, upload_dtype), min_duration)
+
+            im = ImageWithZoomInfo(image, VIEWPORT_SIZE)
+            results["zoomed_image" + suffix] = measure(im.zoomed_image, min_duration)
+            del image, im
+    return results
+
+
+def bench_explorer_bookkeeping(nb_frames) -> Dict[str, Dict[str, float]]:
+    """
+    Per frame cost of 10 image explorers whose textures are already cached:
+    this is dominated by the zoom / adjustments bookkeeping of image_explorer_autostore_zoominfo
+    """
+    images = [synthetic_image(640, 480, 3, np.uint8, seed) for seed in range(10)]
+
+    def gui():
+        for i, image in enumerate(images):
+            image_explorer_autostore_zoominfo(
+                image, SizePixel(320, 240), f"explorer {i}", "", imgui_cv.ImageAdjustments(),
+                hide_buttons=False, always_refresh=False)
+
+    stats = imgui_runner.run_headless(gui, nb_frames=nb_frames + 1)
+    # (the first frame transfers the images)
+    durations_ms = np.array(stats.frame_durations[1:]) * 1000.
+    return {"explorer_bookkeeping[10 explorers]": {
+        "median_ms": float(np.median(durations_ms)), "min_ms": float(durations_ms.min())}}
+
+
+def bench_fig_to_image(nb_figures) -> Dict[str, Dict[str, float]]:
+    durations = []
+    cached_durations = []
+    for i in range(nb_figures):
+        figure, ax = matplotlib.pyplot.subplots(figsize=(6, 4))
+        x = np.linspace(0., 10., 1000)
+        ax.plot(x, np.sin(x + i))
+        start = timeit.default_timer()
+        imgui_fig._fig_to_image(figure)
+        durations.append(timeit.default_timer() - start)
+        # the figure is unchanged: its cached image is returned
+        start = timeit.default_timer()
+        imgui_fig._fig_to_image(figure)
+        cached_durations.append(timeit.default_timer() - start)
+        matplotlib.pyplot.close(figure)
+    durations_ms = np.array(durations) * 1000.
+    cached_durations_ms = np.array(cached_durations) * 1000.
+    return {
+        "fig_to_image[600x400]": {"median_ms": float(np.median(durations_ms)), "min_ms": float(durations_ms.min())},
+        "fig_to_image_cached[600x400]": {
+            "median_ms": float(np.median(cached_durations_ms)), "min_ms": float(cached_durations_ms.min())},
+    }
+
+
+def bench_image_lister(nb_entries, nb_frames) -> Dict[str, Dict[str, float]]:
+    lister = _ImguiImageLister()
+    lister.opened = True
+    images = [synthetic_image(64, 48, 3, np.uint8, seed) for seed in range(16)]
+
+    def push_all():
+        for i in range(nb_entries):
+            lister.push_image(f"image {i}", images[i % len(images)])
+
+    start = timeit.default_timer()
+    push_all()
+    push_duration_ms = (timeit.default_timer() - start) * 1000.
+
+    frame_index = [0]
+
+    def gui():
+        # scroll through the images
+        lister.current_image = f"image {(frame_index[0] * 37) % nb_entries}"
+        frame_index[0] += 1
+        lister._heartbeat()
+
+    stats = imgui_runner.run_headless(gui, params=imgui_runner.Params(win_size=(1600, 1000)), nb_frames=nb_frames)
+    durations_ms = np.array(stats.frame_durations) * 1000.
+    return {
+        f"image_lister_push[{nb_entries} entries]": {"median_ms": push_duration_ms, "min_ms": push_duration_ms},
+        f"image_lister_frame[{nb_entries} entries]": {
+            "median_ms": float(np.median(durations_ms)), "min_ms": float(durations_ms.min())},
+    }
+
+
+def bench_scatter(nb_points, min_duration) -> Dict[str, Dict[str, float]]:
+    random_state = np.random.RandomState(0)
+    x = random_state.randn(nb_points)
+    y = random_state.randn(nb_points) * 0.5 + x * 0.3
+    start = timeit.default_timer()
+    data = imgui_scatter.ScatterData(x, y)
+    index_duration_ms = (timeit.default_timer() - start) * 1000.
+    suffix = f"[{nb_points // 1000000}M points]"
+    results = {"scatter_index" + suffix: {"median_ms": index_duration_ms, "min_ms": index_duration_ms}}
+    center = imgui.Vec2(VIEWPORT_SIZE.width / 2, VIEWPORT_SIZE.height / 2)
+    for zoom in [1., 4., 16.]:
+        affine_transform = np.dot(compute_zoom_matrix(center, zoom), data.full_view(VIEWPORT_SIZE))
+        results[f"scatter_density[zoom {zoom:g}]{suffix}"] = measure(
+            lambda: imgui_scatter.colorize_density(
+                imgui_scatter.density_image(data, affine_transform, VIEWPORT_SIZE)), min_duration)
+    return results
+
+
+def bench_plot_lines(nb_samples, min_duration) -> Dict[str, Dict[str, float]]:
+    values = np.random.RandomState(0).randn(nb_samples).astype(np.float32)
+    start = timeit.default_timer()
+    series = imgui_plot.DecimatedSeries(values)
+    index_duration_ms = (timeit.default_timer() - start) * 1000.
+    suffix = f"[{nb_samples // 1000000}M samples]"
+    results = {"plot_index" + suffix: {"median_ms": index_duration_ms, "min_ms": index_duration_ms}}
+    for visible_fraction in [1., 0.01, 0.0001]:
+        visible_start = int(nb_samples * (1. - visible_fraction) / 2)
+        visible_end = visible_start + int(nb_samples * visible_fraction)
+        results[f"plot_envelope[{visible_fraction:g} visible]{suffix}"] = measure(
+            lambda: series.envelope(visible_start, visible_end, VIEWPORT_SIZE.width), min_duration)
+    return results
+
+
+def bench_streaming_plot(capacity, min_duration) -> Dict[str, Dict[str, float]]:
+    series = imgui_plot.StreamingSeries(capacity)
+    chunk = np.random.RandomState(0).randn(100)
+    # fill the history, so that the ring buffers wrap
+    series.append(np.random.RandomState(1).randn(capacity + capacity // 3))
+    suffix = f"[{capacity // 1000}k capacity]"
+    return {
+        "streaming_append[100 samples]" + suffix: measure(lambda: series.append(chunk), min_duration),
+        "streaming_envelope" + suffix: measure(
+            lambda: series.envelope(series.first_index, series.nb_appended, VIEWPORT_SIZE.width), min_duration),
+    }
+
+
+def run_suite(quick: bool) -> Dict:
+    size_names = QUICK_IMAGE_SIZES if quick else list(IMAGE_SIZES.keys())
+    min_duration = 0.05 if quick else 0.2
+    results = {}
+    results.update(bench_images(size_names, min_duration))
+    print("  explorer bookkeeping", file=sys.stderr)
+    results.update(bench_explorer_bookkeeping(nb_frames=20 if quick else 100))
+    print("  fig_to_image", file=sys.stderr)
+    results.update(bench_fig_to_image(nb_figures=5 if quick else 20))
+    print("  scatter", file=sys.stderr)
+    results.update(bench_scatter(nb_points=1000000 if quick else 10000000, min_duration=min_duration))
+    print("  plot lines", file=sys.stderr)
+    results.update(bench_plot_lines(nb_samples=5000000 if quick else 50000000, min_duration=min_duration))
+    print("  streaming plot", file=sys.stderr)
+    results.update(bench_streaming_plot(capacity=1000000, min_duration=min_duration))
+    print("  image lister", file=sys.stderr)
+    results.update(bench_image_lister(nb_entries=10000, nb_frames=20 if quick else 100))
+    return {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Prints the ratio current / baseline for each benchmark, and returns the names of the regressions
+    """
+    regressions = []
+    print("{0:<52}{1:>14}{2:>14}{3:>9}".format("benchmark", "baseline ms", "current ms", "ratio"))
+    for name, current in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        baseline_ms = baseline["results"][name]["median_ms"]
+        current_ms = current["median_ms"]
+        ratio = current_ms / baseline_ms if baseline_ms > 0. else 1.
+        flag = ""
+        if ratio > 1. + tolerance:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print("{0:<52}{1:>14.3f}{2:>14.3f}{3:>9.2f}{4}".format(name, baseline_ms, current_ms, ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="only small images, shorter measures")
+    parser.add_argument("--output", help="json file for the results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline json file")
+    parser.add_argument("--save-baseline", action="store_true", help="saves the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compares the results to the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown vs the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run_suite(args.quick)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regression(s)")
+            sys.exit(1)
+    if not args.output and not args.save_baseline and not args.compare:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import imgui
 from . import imgui_ext
 from . import imgui_cv
 from . import imgui_fig
+from . import imgui_scatter
+from . import imgui_plot
 from .imgui_image_lister import ImGuiImageLister
 from . import imgui_runner
 from .imgui_runner import ImGuiLister_ShowStandalone
@@ -0,0 +1,278 @@
+"""
+Tile providers: images that are read tile by tile by image_explorer (for example out-of-core images),
+so that the memory usage depends on the viewport size, and not on the image size.
+"""
+import abc
+import logging
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+import numpy as np
+import cv2
+from . import imgui_profiler
+from . import _invalidation
+
+_LOGGER = logging.getLogger(__name__)
+
+TileKey = Tuple[int, int, int] # level, tile_y, tile_x
+
+
+class TileProvider(abc.ABC):
+    """
+    Interface for the images that are displayed tile by tile by image_explorer.
+
+    Subclasses shall implement read_tile() and read_pixel().
+    Level k of the image is 2^k times smaller than the image: a tile of level k covers
+    (tile_size * 2^k) pixels of the image in each direction.
+    The tiles are read asynchronously (by a thread pool), and kept in a LRU cache bounded by cache_max_bytes.
+    The tiles that could not be read are listed in read_errors (they are not read again).
+    Call close() (or use the provider as a context manager) in order to stop the thread pool.
+    """
+    def __init__(self, shape, dtype, tile_size: int = 256, cache_max_bytes: int = 256 * 1024 * 1024,
+                 nb_threads: int = 4):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.tile_size = tile_size
+        self.cache_max_bytes = cache_max_bytes
+        self.generation = 0 # incremented each time a tile is added to the cache
+        self._cache: "OrderedDict[TileKey, np.ndarray]" = OrderedDict()
+        self._cache_nb_bytes = 0
+        self._pending: Set[TileKey] = set()
+        self.read_errors: Dict[TileKey, Exception] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=nb_threads)
+        self._closed = False
+        # last canvas composed by compose_tiles(), and its key (@see _compose_key)
+        self._composed_key = None
+        self._composed: Optional[Tuple[np.ndarray, int]] = None
+
+    def close(self):
+        """
+        Stops the thread pool (after the reads in progress) and clears the cache
+        """
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._cache.clear()
+            self._cache_nb_bytes = 0
+            self._composed_key = None
+            self._composed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def nb_levels(self):
+        """
+        The coarsest level fits in a single tile
+        """
+        max_dim = max(self.shape[0], self.shape[1])
+        return max(1, int(math.ceil(math.log2(max(max_dim / self.tile_size, 1.)))) + 1)
+
+    @abc.abstractmethod
+    def read_tile(self, level: int, tile_y: int, tile_x: int) -> np.ndarray:
+        """
+        Reads a tile (called from a worker thread). The tiles at the right / bottom border may be smaller
+        """
+
+    @abc.abstractmethod
+    def read_pixel(self, y: int, x: int):
+        """
+        Reads a pixel of the image (level 0)
+        """
+
+    def __getitem__(self, yx):
+        y, x = yx
+        return self.read_pixel(y, x)
+
+    def tile_span(self, level: int) -> int:
+        """
+        Number of image pixels covered by a tile of this level (in each direction)
+        """
+        return self.tile_size * (2 ** level)
+
+    def get_tile(self, level: int, tile_y: int, tile_x: int) -> Optional[np.ndarray]:
+        """
+        Returns the tile if it is in the cache; otherwise, schedules its reading and returns None
+        """
+        key = (level, tile_y, tile_x)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if key not in self._pending and key not in self.read_errors and not self._closed:
+                self._pending.add(key)
+                self._executor.submit(self._fetch_tile, key)
+        return None
+
+    def _fetch_tile(self, key: TileKey):
+        try:
+            with imgui_profiler.scope("read_tile"):
+                tile = self.read_tile(*key)
+        except Exception as e:
+            _LOGGER.warning("could not read tile %s: %s", key, e)
+            with self._lock:
+                self._pending.discard(key)
+                self.read_errors[key] = e
+            return
+        with self._lock:
+            self._pending.discard(key)
+            if self._closed:
+                return
+            self._cache[key] = tile
+            self._cache_nb_bytes += tile.nbytes
+            while self._cache_nb_bytes > self.cache_max_bytes and len(self._cache) > 1:
+                _, evicted_tile = self._cache.popitem(last=False)
+                self._cache_nb_bytes -= evicted_tile.nbytes
+            self.generation += 1
+        _invalidation.invalidate()
+
+    def has_pending_tiles(self):
+        with self._lock:
+            return len(self._pending) > 0
+
+
+class MemmapTileProvider(TileProvider):
+    """
+    A TileProvider for raw or .npy files, read via np.memmap: opening a file is instant,
+    and only the visible tiles are read.
+    Coarse levels are read by subsampling the image (one pixel out of 2^level)
+
+    :param filename: a .npy file (shape and dtype are then read from the file), or a raw file
+    :param shape: shape of the image (for raw files)
+    :param dtype: dtype of the image (for raw files)
+    :param offset: offset of the image data inside the file (for raw files)
+    """
+    def __init__(self, filename: str, shape=None, dtype=None, offset: int = 0, tile_size: int = 256,
+                 cache_max_bytes: int = 256 * 1024 * 1024):
+        if filename.endswith(".npy"):
+            self.memmap = np.load(filename, mmap_mode="r")
+        else:
+            if shape is None or dtype is None:
+                raise ValueError("MemmapTileProvider: shape and dtype are required for raw files")
+            self.memmap = np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+        super().__init__(self.memmap.shape, self.memmap.dtype, tile_size, cache_max_bytes)
+
+    def read_tile(self, level, tile_y, tile_x):
+        step = 2 ** level
+        span = self.tile_span(level)
+        y0 = tile_y * span
+        x0 = tile_x * span
+        return np.ascontiguousarray(self.memmap[y0:y0 + span:step, x0:x0 + span:step])
+
+    def read_pixel(self, y, x):
+        return np.array(self.memmap[y, x])
+
+
+def _tile_matrix(affine_transform: np.ndarray, x0: float, y0: float, step: float) -> np.ndarray:
+    """
+    Transform from the pixels of a tile (whose origin is at (x0, y0) in the image, with a pixel size of step)
+    to the viewport
+    """
+    tile_to_image = np.array([[step, 0., x0], [0., step, y0], [0., 0., 1.]])
+    return np.dot(affine_transform, tile_to_image)
+
+
+def _draw_tile(canvas: np.ndarray, tile: np.ndarray, tile_to_viewport: np.ndarray):
+    """
+    Warps a tile into the canvas (only the part of the canvas covered by the tile is processed)
+    """
+    tile_h, tile_w = tile.shape[:2]
+    corners = np.array([[-0.5, -0.5, 1.], [tile_w - 0.5, -0.5, 1.],
+                        [-0.5, tile_h - 0.5, 1.], [tile_w - 0.5, tile_h - 0.5, 1.]]).T
+    corners_viewport = np.dot(tile_to_viewport, corners)
+    canvas_h, canvas_w = canvas.shape[:2]
+    bx0 = max(int(math.floor(corners_viewport[0].min())), 0)
+    by0 = max(int(math.floor(corners_viewport[1].min())), 0)
+    bx1 = min(int(math.ceil(corners_viewport[0].max())) + 1, canvas_w)
+    by1 = min(int(math.ceil(corners_viewport[1].max())) + 1, canvas_h)
+    if bx1 <= bx0 or by1 <= by0:
+        return
+    roi_matrix = np.dot(np.array([[1., 0., -bx0], [0., 1., -by0], [0., 0., 1.]]), tile_to_viewport)
+    roi = canvas[by0:by1, bx0:bx1].copy()
+    cv2.warpAffine(tile, roi_matrix[:2, :], (bx1 - bx0, by1 - by0), dst=roi,
+                   flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_TRANSPARENT)
+    canvas[by0:by1, bx0:bx1] = roi
+
+
+def visible_tiles(provider: TileProvider, affine_transform: np.ndarray, viewport_size, level: int) \
+        -> List[Tuple[int, int]]:
+    """
+    Returns the (tile_y, tile_x) of the tiles of a level that are visible in the viewport
+    """
+    inv = np.linalg.inv(affine_transform)
+    w, h = viewport_size.width, viewport_size.height
+    corners = np.dot(inv, np.array([[0., w, 0., w], [0., 0., h, h], [1., 1., 1., 1.]]))
+    x_min = max(corners[0].min(), 0.)
+    y_min = max(corners[1].min(), 0.)
+    x_max = min(corners[0].max(), provider.shape[1] - 1)
+    y_max = min(corners[1].max(), provider.shape[0] - 1)
+    if x_max < x_min or y_max < y_min:
+        return []
+    span = provider.tile_span(level)
+    return [(tile_y, tile_x)
+            for tile_y in range(int(y_min // span), int(y_max // span) + 1)
+            for tile_x in range(int(x_min // span), int(x_max // span) + 1)]
+
+
+def level_for_zoom(provider: TileProvider, zoom: float) -> int:
+    """
+    Returns the coarsest level that still has at least one pixel per viewport pixel
+    """
+    if zoom >= 1. or zoom <= 0.:
+        return 0
+    # (with a tolerance: a zoom of exactly 1 / 2^k, up to the rounding errors, selects the level k)
+    return max(0, min(int(math.floor(math.log2(1. / zoom) + 1E-6)), provider.nb_levels() - 1))
+
+
+@imgui_profiler.profiled("compose_tiles")
+def compose_tiles(provider: TileProvider, affine_transform: np.ndarray, viewport_size) -> Tuple[np.ndarray, int]:
+    """
+    Returns the viewport image (affine_transform maps the image to the viewport), composed from the cached tiles,
+    and the level that was used.
+    The missing tiles are requested, and replaced by the coarsest level while they are being read.
+    The canvas is composed again only when the transform, the viewport size or the set of drawn tiles change:
+    otherwise, the previous canvas is returned (it shall not be modified by the caller).
+    """
+    zoom = math.sqrt(math.fabs(np.linalg.det(affine_transform[:2, :2])))
+    level = level_for_zoom(provider, zoom)
+
+    def loaded_tiles(level_to_draw):
+        tiles = [((level_to_draw,) + tile_yx, provider.get_tile(level_to_draw, *tile_yx))
+                 for tile_yx in visible_tiles(provider, affine_transform, viewport_size, level_to_draw)]
+        return tiles, [(key, tile) for key, tile in tiles if tile is not None]
+
+    tiles, tiles_to_draw = loaded_tiles(level)
+    coarsest_level = provider.nb_levels() - 1
+    if level != coarsest_level and len(tiles_to_draw) < len(tiles):
+        _, placeholder_tiles = loaded_tiles(coarsest_level)
+        tiles_to_draw = placeholder_tiles + tiles_to_draw
+
+    compose_key = (affine_transform.tobytes(), viewport_size.width, viewport_size.height,
+                   tuple(key for key, _ in tiles_to_draw))
+    if provider._composed is not None and provider._composed_key == compose_key:
+        return provider._composed
+
+    canvas = np.zeros((viewport_size.height, viewport_size.width) + provider.shape[2:], provider.dtype)
+    for (level_to_draw, tile_y, tile_x), tile in tiles_to_draw:
+        step = 2 ** level_to_draw
+        span = provider.tile_span(level_to_draw)
+        # pixel (i, j) of the tile is the pixel (x0 + i * step, y0 + j * step) of the image
+        tile_to_viewport = _tile_matrix(affine_transform, tile_x * span, tile_y * span, step)
+        _draw_tile(canvas, tile, tile_to_viewport)
+    provider._composed_key = compose_key
+    provider._composed = canvas, level
+    return provider._composed
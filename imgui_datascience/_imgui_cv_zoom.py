@@ -6,11 +6,14 @@ import imgui
 from . import imgui_ext
 from . import imgui_cv
 from .imgui_cv import SizePixel
+from ._imgui_cv_tiles import TileProvider, compose_tiles
 from .static_vars import *
 from typing import *
 import cv2
 import math
 import copy
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
 
 def _is_close(a, b):
@@ -90,6 +93,115 @@ class ZoomInfo:
         return imgui.Vec2(pt_original[0, 0], pt_original[1, 0])
 
 
+@static_vars(executor=None)
+def _pyramid_build_executor() -> ThreadPoolExecutor:
+    """
+    The pyramids are built one at a time, by a single thread (@see shutdown_pyramid_builds)
+    """
+    statics = _pyramid_build_executor.statics
+    if statics.executor is None:
+        statics.executor = ThreadPoolExecutor(1, thread_name_prefix="image_pyramid")
+    return statics.executor
+
+
+# The pyramids whose build was submitted, and is not finished
+_PYRAMIDS_BEING_BUILT: "weakref.WeakSet[ImagePyramid]" = weakref.WeakSet()
+
+
+def shutdown_pyramid_builds():
+    """
+    Cancels the pyramid builds, and waits until the build in progress stops (called by imgui_runner at exit,
+    so that no build is running inside OpenCV while the interpreter shuts down)
+    """
+    for pyramid in list(_PYRAMIDS_BEING_BUILT):
+        pyramid.cancel()
+    statics = _pyramid_build_executor.statics
+    if statics.executor is not None:
+        statics.executor.shutdown(wait=True)
+        statics.executor = None
+
+
+class ImagePyramid:
+    """
+    Area-downsampled versions of an image: level k is 2^k times smaller than the image (level 0).
+    The levels are built lazily (on the first call to level_for_zoom() that needs them), in a background thread.
+    Only the coarsest levels whose total size fits in max_bytes are kept.
+    """
+    MIN_LEVEL_SIZE = 256 # the coarsest level is smaller than this in both dimensions
+
+    def __init__(self, image, source_token, max_bytes):
+        self.source_token = source_token # identifies the image content from which the pyramid was built
+        self.level_sizes = [SizePixel.from_image(image)]
+        while max(self.level_sizes[-1].width, self.level_sizes[-1].height) > self.MIN_LEVEL_SIZE:
+            previous = self.level_sizes[-1]
+            self.level_sizes.append(SizePixel(math.ceil(previous.width / 2), math.ceil(previous.height / 2)))
+        # decide which levels are kept, starting from the coarsest ones
+        bytes_per_pixel = image.itemsize * (image.shape[2] if len(image.shape) >= 3 else 1)
+        self.kept_levels = set()
+        nb_bytes = 0
+        for level in reversed(range(1, len(self.level_sizes))):
+            nb_bytes += self.level_sizes[level].width * self.level_sizes[level].height * bytes_per_pixel
+            if nb_bytes > max_bytes:
+                break
+            self.kept_levels.add(level)
+        self.levels = [image] + [None] * (len(self.level_sizes) - 1)
+        self._future = None
+        self._cancelled = False
+
+    def nb_levels(self):
+        return len(self.levels)
+
+    def level_scale(self, level):
+        """
+        Returns the (x, y) scale between the original image and a level
+        """
+        return self.level_sizes[level].width / self.level_sizes[0].width, \
+            self.level_sizes[level].height / self.level_sizes[0].height
+
+    def level_for_zoom(self, zoom: float) -> int:
+        """
+        Returns the coarsest level that still has at least one pixel per viewport pixel at this zoom.
+        If this level is not kept (@see max_bytes), or while it is being built, the next finer available level
+        is returned (the image itself, i.e. level 0, if no finer level is available)
+        """
+        if zoom <= 0.:
+            return 0
+        # (with a tolerance: a zoom of exactly 1 / 2^k, up to the rounding errors, selects the level k)
+        wanted_level = int(math.floor(math.log2(1. / zoom) + 1E-6)) if zoom < 1. else 0
+        wanted_level = max(0, min(wanted_level, self.nb_levels() - 1))
+        if wanted_level == 0:
+            return 0
+        self._start_build()
+        return max(level for level in range(wanted_level + 1) if self.levels[level] is not None)
+
+    def cancel(self):
+        self._cancelled = True
+        if self._future is not None:
+            self._future.cancel()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def _start_build(self):
+        if self._future is None and not self._cancelled and len(self.kept_levels) > 0:
+            _PYRAMIDS_BEING_BUILT.add(self)
+            self._future = _pyramid_build_executor().submit(self._build)
+            self._future.add_done_callback(lambda _: _PYRAMIDS_BEING_BUILT.discard(self))
+
+    def _build(self):
+        # cv2.resize releases the GIL: the build does not block the gui.
+        # The levels that are not kept are not computed (so that the memory stays within max_bytes):
+        # the finest kept level is resized directly from the image, and each coarser level from the previous one
+        previous = self.levels[0]
+        for level in sorted(self.kept_levels):
+            if self._cancelled:
+                return
+            current = cv2.resize(
+                previous, self.level_sizes[level].as_tuple_width_height(), interpolation=cv2.INTER_AREA)
+            self.levels[level] = current
+            previous = current
+
+
 class ImageWithZoomInfo:
     def __init__(self, image, viewport_size, zoom_info=None, hide_buttons=False,
                  image_adjustments=None):
@@ -103,6 +215,12 @@ class ImageWithZoomInfo:
         self.show_adjustments = False
         self.filename = ""
         self.zoom_info = ZoomInfo()
+        self.last_zoom_used_uv = None
+        self.pyramid = None
+        # the content of the image, and the number of consecutive frames during which it was displayed
+        # (the pyramid is built once the content is stable, @see imgui_cv.PYRAMID_STABLE_FRAMES)
+        self.stable_source_token = None
+        self.nb_stable_frames = 0
 
         if zoom_info is None:
             self.reset_zoom_info()
@@ -137,12 +255,121 @@ class ImageWithZoomInfo:
         self.force_viewport_size = value
         self.reset_zoom_info()
 
-    def zoomed_image(self):
-        m = m33_to_m23(self.zoom_info.affine_transform)
-        zoomed = cv2.warpAffine(self.image, m, self.current_viewport_size().as_tuple_width_height(),
+    def is_tiled(self):
+        return isinstance(self.image, TileProvider)
+
+    @imgui_cv._metered("warp")
+    def zoomed_image(self, level=0):
+        """
+        Returns the zoomed image, computed from a level of the image pyramid (@see displayed_level()),
+        or from the visible tiles for a TileProvider
+        """
+        m = self.zoom_info.affine_transform
+        if self.is_tiled():
+            zoomed, _ = compose_tiles(self.image, m, self.current_viewport_size())
+            return zoomed
+        source = self.image
+        if level > 0:
+            source = self.pyramid.levels[level]
+            scale_x, scale_y = self.pyramid.level_scale(level)
+            m = np.dot(m, np.diag([1. / scale_x, 1. / scale_y, 1.]))
+        zoomed = cv2.warpAffine(source, m33_to_m23(m), self.current_viewport_size().as_tuple_width_height(),
                                 flags=cv2.INTER_NEAREST)
         return zoomed
 
+    def uses_pyramid(self):
+        if self.is_tiled():
+            return False # the TileProvider handles its levels
+        image_size = SizePixel.from_image(self.image)
+        return imgui_cv.USE_IMAGE_PYRAMID and image_size.width * image_size.height >= imgui_cv.PYRAMID_MIN_PIXELS
+
+    def displayed_level(self, image_and_adjustments: imgui_cv.ImageAndAdjustments) -> int:
+        """
+        Returns the level of the image pyramid that shall be displayed with the current zoom
+        (0 means the original image). The pyramid is rebuilt when the image content changes, once the new content
+        was displayed during PYRAMID_STABLE_FRAMES frames (a streamed image is never downsampled)
+        (image_and_adjustments is the image of this frame: its content hash is computed at most once per frame)
+        """
+        if not self.uses_pyramid():
+            return 0
+        m = self.zoom_info.affine_transform
+        zoom = math.sqrt(math.fabs(numpy.linalg.det(m[:2, :2])))
+        if zoom >= 0.5 and self.pyramid is None:
+            return 0
+        source_token = image_and_adjustments.content_hash()
+        if self.pyramid is not None and (self.pyramid.source_token != source_token or self.pyramid.is_cancelled()):
+            self.cancel_pyramid()
+        if self.pyramid is not None and self.pyramid.levels[0] is not self.image:
+            # (the pyramid of a previous array with the same content, @see adopt_pyramid: it shall not retain it)
+            self.pyramid.levels[0] = self.image
+        if self.pyramid is None:
+            if source_token == self.stable_source_token:
+                self.nb_stable_frames += 1
+            else:
+                self.stable_source_token = source_token
+                self.nb_stable_frames = 1
+            if self.nb_stable_frames < imgui_cv.PYRAMID_STABLE_FRAMES:
+                return 0
+            self.pyramid = ImagePyramid(self.image, source_token, imgui_cv.PYRAMID_MAX_BYTES)
+        return self.pyramid.level_for_zoom(zoom)
+
+    def cancel_pyramid(self):
+        if self.pyramid is not None:
+            self.pyramid.cancel()
+            self.pyramid = None
+
+    def adopt_pyramid(self, previous: "ImageWithZoomInfo"):
+        """
+        Takes the pyramid of the ImageWithZoomInfo of the previous array displayed by the same explorer:
+        it is kept if the content is the same, and cancelled otherwise (@see displayed_level)
+        """
+        self.pyramid, previous.pyramid = previous.pyramid, None
+        if self.pyramid is not None and self.image.shape != previous.image.shape:
+            self.cancel_pyramid()
+        self.stable_source_token = previous.stable_source_token
+        self.nb_stable_frames = previous.nb_stable_frames
+
+    def can_zoom_with_uv(self):
+        """
+        Returns True if the zoom can be performed by the GPU, via the texture uv coordinates.
+        This is possible unless the affine transform contains a rotation / shear
+        (in which case we fall back to zoomed_image())
+        """
+        if not imgui_cv.USE_GPU_ZOOM or self.is_tiled():
+            return False
+        m = self.zoom_info.affine_transform
+        is_scale_and_translate = _is_close(m[0, 1], 0.) and _is_close(m[1, 0], 0.) \
+            and _is_close(m[2, 0], 0.) and _is_close(m[2, 1], 0.) and _is_close(m[2, 2], 1.)
+        return is_scale_and_translate
+
+    def zoom_uv(self):
+        """
+        Returns the texture coordinates (uv0, uv1) of the viewport corners.
+        Pixel centers are handled the same way as in zoomed_image()
+        """
+        m_inv = numpy.linalg.inv(self.zoom_info.affine_transform)
+        image_size = SizePixel.from_image(self.image)
+        viewport_size = self.current_viewport_size()
+
+        def corner_uv(x, y):
+            pt_original = np.dot(m_inv, np.array([x - 0.5, y - 0.5, 1.]))
+            return (pt_original[0] + 0.5) / image_size.width, (pt_original[1] + 0.5) / image_size.height
+
+        uv0 = corner_uv(0., 0.)
+        uv1 = corner_uv(viewport_size.width, viewport_size.height)
+        return uv0, uv1
+
+    def pixel_color(self, pt_original):
+        """
+        Returns the color of the original image at pt_original (black if outside the image)
+        """
+        x = int(round(pt_original.x))
+        y = int(round(pt_original.y))
+        if 0 <= x < self.image.shape[1] and 0 <= y < self.image.shape[0]:
+            return self.image[y, x]
+        else:
+            return np.zeros_like(self.image[0, 0])
+
     def viewport_center_original_image(self):  # -> imgui.Vec2:
         center = np.array([[self.current_viewport_size().width / 2.], [self.current_viewport_size().height / 2.], [1.]])
         center_original = np.dot(
@@ -185,31 +412,77 @@ def color_msg(color):
 
 # noinspection PyArgumentList,PyArgumentList
 def image_explorer_impl(
-    im: ImageWithZoomInfo, title:str = "", always_refresh:bool = False) \
+    im: ImageWithZoomInfo, title:str = "", always_refresh:bool = False,
+    hash_strategy: Optional[imgui_cv.HashStrategy] = None,
+    version: Optional[Hashable] = None) \
     -> Optional[imgui.Vec2]:
 
     """
     :return: imgui.Vec2 (mouse_location_original_image) or None (if not on image)
     """
-    linked_user_image_address = id(im.image)
-
     if im.image.size == 0:
         imgui.text("empty image !")
         return imgui.Vec2(0, 0)
 
-    zoomed_image = im.zoomed_image()
+    use_uv = im.can_zoom_with_uv()
+    if use_uv != im.last_zoom_used_uv:
+        # the texture content differs between the two modes (original vs zoomed image)
+        always_refresh = True
+        im.last_zoom_used_uv = use_uv
+
+    # (the hash of the image is computed at most once per frame, and shared by the pyramid and the texture cache)
+    image_and_adjustments = imgui_cv.ImageAndAdjustments(im.image, im.image_adjustments, hash_strategy, version)
+    level = im.displayed_level(image_and_adjustments)
+    if use_uv:
+        zoomed_image = None
+    else:
+        zoomed_image = im.zoomed_image(level)
 
     if not im.hide_buttons:
         _display_zoom_or_pan_buttons(im)
         if title != "":
             imgui.same_line()
             imgui.text("     " + title)
-    mouse_location = imgui_cv.image(
-        zoomed_image,
-        image_adjustments=im.image_adjustments,
-        always_refresh=always_refresh,
-        linked_user_image_address=linked_user_image_address
-        )
+    if use_uv and level > 0:
+        # the texture contains a level of the pyramid; its content is identified by the pyramid source and level
+        displayed_image = im.pyramid.levels[level]
+        displayed_image_and_adjustments = imgui_cv.ImageAndAdjustments(
+            displayed_image, im.image_adjustments, hash_strategy, (im.pyramid.source_token, level))
+        linked_user_image_address = id(displayed_image)
+    elif use_uv:
+        # the texture contains the original image: it can be shared with the other explorers of im.image
+        displayed_image_and_adjustments = image_and_adjustments
+        linked_user_image_address = id(im.image)
+    else:
+        # the texture contains the zoomed image, which is specific to this explorer
+        linked_user_image_address = id(im)
+
+    if use_uv:
+        uv0, uv1 = im.zoom_uv()
+        mouse_location = imgui_cv._image_uv(
+            displayed_image_and_adjustments,
+            im.current_viewport_size(),
+            uv0, uv1,
+            always_refresh=always_refresh,
+            linked_user_image_address=linked_user_image_address
+            )
+    else:
+        # the zoomed image content depends on the image version and on the zoom
+        if im.is_tiled():
+            # (and for a TileProvider, on the tiles that were read so far)
+            zoomed_version = (id(im.image), version, im.image.generation, im.zoom_info.affine_transform.tobytes(),
+                              im.current_viewport_size().as_tuple_width_height())
+        elif version is not None:
+            zoomed_version = (version, level, im.zoom_info.affine_transform.tobytes())
+        else:
+            zoomed_version = None
+        # (the zoomed images are new arrays at each frame: the cache entry lives as long as the explorer)
+        mouse_location = imgui_cv._image_impl(
+            imgui_cv.ImageAndAdjustments(zoomed_image, im.image_adjustments, hash_strategy, zoomed_version),
+            always_refresh=always_refresh,
+            linked_user_image_address=linked_user_image_address,
+            image_owner=im
+            )
     mouse_location_original_image = None
     viewport_center_original_image = im.viewport_center_original_image()
 
@@ -337,17 +610,20 @@ def image_explorer_impl(
             imgui.new_line()
         # Save button
         # imgui.same_line()
-        imgui.push_item_width(60)
-        changed, im.filename = imgui.input_text(imgui_ext.make_unique_label(""), im.filename, 1000)
-        imgui.same_line()
-        if imgui.small_button(imgui_ext.make_unique_label("save")):
-            cv2.imwrite(im.filename, im.image)
+        if not im.is_tiled():
+            imgui.push_item_width(60)
+            changed, im.filename = imgui.input_text(imgui_ext.make_unique_label(""), im.filename, 1000)
+            imgui.same_line()
+            if imgui.small_button(imgui_ext.make_unique_label("save")):
+                cv2.imwrite(im.filename, im.image)
         # Show pixel color info
         if mouse_location is not None:
-            color = zoomed_image[int(round(mouse_location.y)), int(round(mouse_location.x))]
-
             mouse2 = np.array([[mouse_location.x], [mouse_location.y], [1.]])
             pt_original = np.dot(numpy.linalg.inv(im.zoom_info.affine_transform), mouse2)
+            if use_uv:
+                color = im.pixel_color(imgui.Vec2(pt_original[0, 0], pt_original[1, 0]))
+            else:
+                color = zoomed_image[int(round(mouse_location.y)), int(round(mouse_location.x))]
             position_msg = "({0},{1})".format(int(round(pt_original[0, 0])), int(round(pt_original[1, 0])))
             imgui.text(position_msg + " " + color_msg(color))
         else:
@@ -371,7 +647,9 @@ def image_explorer_autostore_zoominfo(
     zoom_key,
     image_adjustments,
     hide_buttons,
-    always_refresh
+    always_refresh,
+    hash_strategy=None,
+    version=None
     ):
     image_address = id(image)
 
@@ -391,16 +669,19 @@ def image_explorer_autostore_zoominfo(
         flag_need_store_image = True
 
     if flag_need_store_image:
+        previous = statics.all_ImageWithZoomInfo.get(image_key)
         statics.all_ImageWithZoomInfo[image_key] = ImageWithZoomInfo(
             image,
             viewport_size,
             statics.all_zoom_info[zoom_key],
             hide_buttons=hide_buttons,
             image_adjustments=image_adjustments)
+        if previous is not None:
+            statics.all_ImageWithZoomInfo[image_key].adopt_pyramid(previous)
 
     imageWithZoomInfo = statics.all_ImageWithZoomInfo[image_key]
 
-    def did_user_change_something():
+    def did_user_change_zoom():
         changed = False
         if     zoom_key not in statics.all_zoom_info \
             or image_address not in statics.previous_all_zoom_info:
@@ -410,7 +691,10 @@ def image_explorer_autostore_zoominfo(
             current_zoom = statics.all_zoom_info[zoom_key]
             if old_zoom != current_zoom:
                 changed = True
+        return changed
 
+    def did_user_change_adjustments():
+        changed = False
         if image_address not in statics.all_previous_image_adjustments:
             changed = True
         else:
@@ -421,10 +705,13 @@ def image_explorer_autostore_zoominfo(
 
         return changed
 
-    if did_user_change_something():
+    # When the zoom is performed by the GPU, a zoom change does not require to refresh the texture
+    zoom_needs_refresh = not imageWithZoomInfo.can_zoom_with_uv()
+    if did_user_change_adjustments() or (zoom_needs_refresh and did_user_change_zoom()):
         always_refresh = True
 
     statics.previous_all_zoom_info[image_address] = copy.deepcopy(statics.all_zoom_info[zoom_key])
     statics.all_previous_image_adjustments[image_address] = copy.deepcopy(imageWithZoomInfo.image_adjustments)
-    return image_explorer_impl(statics.all_ImageWithZoomInfo[image_key], title, always_refresh=always_refresh)
+    return image_explorer_impl(statics.all_ImageWithZoomInfo[image_key], title,
+                               always_refresh=always_refresh, hash_strategy=hash_strategy, version=version)
 
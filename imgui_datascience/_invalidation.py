@@ -0,0 +1,33 @@
+"""
+Frame requests, for the idle mode of imgui_runner (@see imgui_runner.Params.idle_rendering).
+
+The modules that produce data in the background (tile providers, figure cache, image lister, streaming plots)
+call invalidate() when they have something new to display. This module has no dependency,
+so that they do not depend on the runner (nor on pygame): the runner reads INVALIDATED,
+and registers the function that wakes up its event loop.
+"""
+import threading
+from typing import *
+
+# Set by invalidate() (from any thread): the next frame shall be rendered, even in idle mode
+INVALIDATED = threading.Event()
+
+# Called by invalidate() after INVALIDATED is set (@see set_wakeup_function)
+_WAKEUP_FUNCTION: Optional[Callable[[], None]] = None
+
+
+def set_wakeup_function(wakeup_function: Optional[Callable[[], None]]):
+    global _WAKEUP_FUNCTION
+    _WAKEUP_FUNCTION = wakeup_function
+
+
+def invalidate():
+    """
+    Requests a new frame when imgui_runner.Params.idle_rendering is True (this is thread safe)
+    """
+    if INVALIDATED.is_set():
+        return  # (a frame was already requested: do not flood the event queue, e.g. with high rate producers)
+    INVALIDATED.set()
+    wakeup_function = _WAKEUP_FUNCTION
+    if wakeup_function is not None:
+        wakeup_function()
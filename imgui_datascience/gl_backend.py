@@ -0,0 +1,190 @@
+"""
+The OpenGL calls performed by imgui_cv for its textures go through a GlBackend (@see imgui_cv.GL_BACKEND):
+  - PyOpenGlBackend sends them to OpenGL
+  - RecordingGlBackend only records them (calls, uploaded bytes, live textures): it makes it possible to test
+    and benchmark the texture cache without a GPU
+All the calls apply to the GL_TEXTURE_2D target.
+"""
+import abc
+from collections import Counter
+from typing import *
+import numpy as np
+import OpenGL.GL as gl
+
+TextureId = int
+
+
+class GlBackend(abc.ABC):
+    """
+    Interface for the texture operations used by imgui_cv (all the methods shall be implemented)
+    """
+    @abc.abstractmethod
+    def gen_texture(self) -> TextureId:
+        pass
+
+    @abc.abstractmethod
+    def delete_textures(self, texture_ids: List[TextureId]):
+        pass
+
+    @abc.abstractmethod
+    def bind_texture(self, texture_id: TextureId):
+        pass
+
+    @abc.abstractmethod
+    def pixel_store_i(self, parameter: int, value: int):
+        pass
+
+    @abc.abstractmethod
+    def tex_parameter_i(self, parameter: int, value: int):
+        pass
+
+    @abc.abstractmethod
+    def tex_parameter_iv(self, parameter: int, values: List[int]):
+        pass
+
+    @abc.abstractmethod
+    def tex_parameter_fv(self, parameter: int, values: Tuple[float, ...]):
+        pass
+
+    @abc.abstractmethod
+    def tex_image_2d(self, internal_format: int, width: int, height: int,
+                     pixel_format: int, pixel_type: int, data: np.ndarray):
+        """
+        Allocates the storage of the bound texture, and fills it with data
+        """
+
+    @abc.abstractmethod
+    def tex_sub_image_2d(self, x: int, y: int, width: int, height: int,
+                         pixel_format: int, pixel_type: int, data: np.ndarray):
+        """
+        Fills a part of the bound texture with data
+        """
+
+    @abc.abstractmethod
+    def max_texture_size(self) -> int:
+        pass
+
+
+class PyOpenGlBackend(GlBackend):
+    def __init__(self):
+        self._max_texture_size = None
+
+    def gen_texture(self):
+        return gl.glGenTextures(1)
+
+    def delete_textures(self, texture_ids):
+        gl.glDeleteTextures(texture_ids)
+
+    def bind_texture(self, texture_id):
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture_id)
+
+    def pixel_store_i(self, parameter, value):
+        gl.glPixelStorei(parameter, value)
+
+    def tex_parameter_i(self, parameter, value):
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, parameter, value)
+
+    def tex_parameter_iv(self, parameter, values):
+        gl.glTexParameteriv(gl.GL_TEXTURE_2D, parameter, values)
+
+    def tex_parameter_fv(self, parameter, values):
+        gl.glTexParameterfv(gl.GL_TEXTURE_2D, parameter, values)
+
+    def tex_image_2d(self, internal_format, width, height, pixel_format, pixel_type, data):
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, internal_format, width, height, 0, pixel_format, pixel_type, data)
+
+    def tex_sub_image_2d(self, x, y, width, height, pixel_format, pixel_type, data):
+        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, x, y, width, height, pixel_format, pixel_type, data)
+
+    def max_texture_size(self):
+        # (queried once: this requires a GL context)
+        if self._max_texture_size is None:
+            self._max_texture_size = int(gl.glGetIntegerv(gl.GL_MAX_TEXTURE_SIZE))
+        return self._max_texture_size
+
+
+class RecordingGlBackend(GlBackend):
+    """
+    A GlBackend without GPU: counts the calls, the uploaded bytes and the live textures (and their storage size).
+
+    :param max_texture_size: the value returned by max_texture_size()
+    :param keep_calls: if True, the calls are also stored in self.calls, as (name, args) tuples
+                       (the image data is replaced by its size in bytes)
+    """
+    def __init__(self, max_texture_size: int = 16384, keep_calls: bool = False):
+        self._max_texture_size = max_texture_size
+        self.keep_calls = keep_calls
+        self.calls: List[Tuple[str, tuple]] = []
+        self.nb_calls: Counter = Counter()
+        self.bytes_uploaded = 0
+        self.live_textures: Dict[TextureId, int] = {} # texture_id -> size of its storage in bytes
+        self.bound_texture: TextureId = 0
+        self._next_texture_id = 1
+
+    def _record(self, name, *args):
+        self.nb_calls[name] += 1
+        if self.keep_calls:
+            self.calls.append((name, args))
+
+    def reset_counters(self):
+        """
+        Resets the calls and uploaded bytes counters (the live textures are kept)
+        """
+        self.calls = []
+        self.nb_calls = Counter()
+        self.bytes_uploaded = 0
+
+    def calls_to(self, name: str) -> List[tuple]:
+        return [args for call_name, args in self.calls if call_name == name]
+
+    @property
+    def nb_live_textures(self) -> int:
+        return len(self.live_textures)
+
+    @property
+    def live_texture_bytes(self) -> int:
+        return sum(self.live_textures.values())
+
+    def gen_texture(self):
+        texture_id = self._next_texture_id
+        self._next_texture_id += 1
+        self.live_textures[texture_id] = 0
+        self._record("gen_texture")
+        return texture_id
+
+    def delete_textures(self, texture_ids):
+        for texture_id in texture_ids:
+            if texture_id not in self.live_textures:
+                raise ValueError(f"RecordingGlBackend: texture {texture_id} is deleted, but it does not exist")
+            del self.live_textures[texture_id]
+        self._record("delete_textures", list(texture_ids))
+
+    def bind_texture(self, texture_id):
+        if texture_id != 0 and texture_id not in self.live_textures:
+            raise ValueError(f"RecordingGlBackend: texture {texture_id} is bound, but it does not exist")
+        self.bound_texture = texture_id
+        self._record("bind_texture", texture_id)
+
+    def pixel_store_i(self, parameter, value):
+        self._record("pixel_store_i", parameter, value)
+
+    def tex_parameter_i(self, parameter, value):
+        self._record("tex_parameter_i", parameter, value)
+
+    def tex_parameter_iv(self, parameter, values):
+        self._record("tex_parameter_iv", parameter, tuple(values))
+
+    def tex_parameter_fv(self, parameter, values):
+        self._record("tex_parameter_fv", parameter, tuple(values))
+
+    def tex_image_2d(self, internal_format, width, height, pixel_format, pixel_type, data):
+        self.live_textures[self.bound_texture] = data.nbytes
+        self.bytes_uploaded += data.nbytes
+        self._record("tex_image_2d", internal_format, width, height, pixel_format, pixel_type, data.nbytes)
+
+    def tex_sub_image_2d(self, x, y, width, height, pixel_format, pixel_type, data):
+        self.bytes_uploaded += data.nbytes
+        self._record("tex_sub_image_2d", x, y, width, height, pixel_format, pixel_type, data.nbytes)
+
+    def max_texture_size(self):
+        return self._max_texture_size
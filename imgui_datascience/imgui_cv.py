@@ -1,5 +1,4 @@
 import cv2
-import copy
 import xxhash
 import numpy as np
 import imgui
@@ -9,14 +8,85 @@ from timeit import default_timer as timer
 from . import imgui_ext
 import math
 from typing import *
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, fields, asdict
+import functools
+import weakref
+from enum import Enum
+from ._imgui_cv_tiles import TileProvider, MemmapTileProvider
+from .gl_backend import GlBackend, PyOpenGlBackend
+from . import imgui_profiler
 
 _start = timer()
 
 USE_FAST_HASH = True
 
+# If True, when an image is displayed with an unchanged version (@see imgui_cv.image(version=)),
+# its content is checked against the content of the last upload, and a message is printed if it changed
+DEBUG_CHECK_IMAGE_VERSIONS = False
+NB_VERSION_MISMATCHES = 0
+
+# If True, image_explorer uploads the original image once and performs zoom & pan on the GPU
+# (via the texture uv coordinates). Otherwise, the zoomed image is computed with cv2.warpAffine
+USE_GPU_ZOOM = True
+
+# When image_explorer is zoomed out on an image bigger than PYRAMID_MIN_PIXELS, it displays an area-downsampled
+# version of the image, taken from an image pyramid built in a background thread.
+# The levels kept in memory are bounded by PYRAMID_MAX_BYTES (the coarsest levels are kept first).
+# The pyramid is built once the image content did not change during PYRAMID_STABLE_FRAMES frames
+# (a streamed image, which changes at each frame, is displayed without pyramid)
+USE_IMAGE_PYRAMID = True
+PYRAMID_MIN_PIXELS = 16 * 1024 * 1024
+PYRAMID_MAX_BYTES = 512 * 1024 * 1024
+PYRAMID_STABLE_FRAMES = 3
+
+# image_explorer can display a TileProvider (out-of-core image): only the visible tiles are read.
+# When no width / height is given, its viewport is at most TILED_IMAGE_VIEWPORT_MAX_SIZE pixels wide / high
+TILED_IMAGE_VIEWPORT_MAX_SIZE = 800
+
 LOG_GPU_USAGE = False
 
+# If True, the images are split into tiles of DIRTY_TILE_SIZE pixels: when a texture is refreshed,
+# only the tiles whose content changed are sent to the GPU (via glTexSubImage2D)
+USE_DIRTY_TILES = True
+DIRTY_TILE_SIZE = 256
+
+# The textures that are not used anymore are kept in a pool (grouped by size and format),
+# so that they can be recycled without calling glGenTextures / reallocating their storage.
+# The least recently used textures are deleted when the pool exceeds TEXTURE_POOL_MAX_BYTES
+TEXTURE_POOL_MAX_BYTES = 256 * 1024 * 1024
+
+# If True, the images are transferred to the GPU in their native format (GL_RED + swizzle for grey images,
+# GL_BGRA for images with alpha, GL_R32F for float images), without any conversion on the CPU.
+# Otherwise, they are converted to uint8 BGR images before the transfer (@see _to_rgb_image)
+USE_NATIVE_TEXTURE_FORMATS = True
+
+# If True, the entries of ALL_TEXTURES that display the same content (same pixels and same adjustments)
+# share a single texture: identical images are transferred and stored on the GPU only once
+USE_SHARED_TEXTURES = True
+
+# If True, the images displayed by imgui_cv.image() with a size smaller than their original size (thumbnails)
+# are resized (cv2.INTER_AREA) before their transfer to the GPU.
+# The full resolution image is transferred only when the user clicks on the image to show its original size
+DOWNSCALE_THUMBNAILS = True
+
+# VRAM budget: when the textures in ALL_TEXTURES plus TEXTURE_POOL exceed this size,
+# the least recently used textures are evicted (the textures used during the current frame are never evicted).
+# Otherwise, the entry of an image is kept as long as the image is alive (a widget that is hidden for a while
+# does not need to transfer its image again); when the image is garbage collected (e.g. the previous frame
+# of a video), its texture goes back to TEXTURE_POOL, where it can be recycled by a new image of the same size
+TEXTURE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# The images whose width or height exceeds MAX_TEXTURE_SIZE are stored as a grid of textures
+# of TEXTURE_TILE_SIZE pixels (only the tiles that are visible in the viewport are transferred and drawn).
+# If MAX_TEXTURE_SIZE is None, the driver limit (GL_MAX_TEXTURE_SIZE) is used
+MAX_TEXTURE_SIZE: Optional[int] = None
+TEXTURE_TILE_SIZE = 4096
+
+# All the texture operations go through GL_BACKEND: replace it by a RecordingGlBackend
+# in order to test or benchmark imgui_cv without GPU (@see gl_backend.py)
+GL_BACKEND: GlBackend = PyOpenGlBackend()
+
 """
 Some type synonyms in order to make the code easier to understand
 """
@@ -41,12 +111,25 @@ class ImageAdjustments:
     def is_none(self):
         return _is_close(self.factor, 1.) and _is_close(self.delta, 0.)
 
-    def adjust(self, image):
+    def adjust(self, image, dtype=None):
+        """
+        Returns (image + delta) * factor, with the given dtype (by default, the dtype of the image).
+        The image is never copied: it is returned as is if there is nothing to do,
+        otherwise a single output buffer is allocated (uint8 results are saturated)
+        """
+        if dtype is None:
+            dtype = image.dtype
         if self.is_none():
-            return image
-        else:
-            adjusted = ((image + self.delta) * self.factor).astype(image.dtype)
-            return adjusted
+            if image.dtype == dtype:
+                return image
+            else:
+                return image.astype(dtype)
+        if dtype == np.uint8:
+            return cv2.convertScaleAbs(image, alpha=self.factor, beta=self.delta * self.factor)
+        adjusted = np.empty(image.shape, dtype)
+        np.add(image, self.delta, out=adjusted, casting="unsafe")
+        np.multiply(adjusted, self.factor, out=adjusted, casting="unsafe")
+        return adjusted
 
     def __hash__(self):
         return hash((self.factor, self.delta))
@@ -55,44 +138,170 @@ class ImageAdjustments:
         return self.factor == other.factor and self.delta == other.delta
 
 
-def _hash_image(image):
+class HashStrategy(Enum):
     """
-    Two hash variant are possible :
-    - if imgui_cv.USE_FAST_HASH is True : select 100 random pixels and hash them
-    - otherwise : compute the hash of the whole image (using xxhash for performance)
-    :param image:
-    :return:hash
+    Strategies used to detect whether an image changed (@see _hash_image)
     """
+    SampledPixels = "SampledPixels" # hash of 100 pixels (fast, but may miss some changes)
+    StridedRows = "StridedRows" # hash of NB_HASHED_ROWS rows, evenly spaced
+    Full = "Full" # hash of the whole image (using xxh3)
+
+
+NB_HASHED_PIXELS = 100
+NB_HASHED_ROWS = 64
+# Number of image sizes for which the indices of the sampled pixels are kept (@see _sample_indices)
+SAMPLE_INDICES_CACHE_SIZE = 64
+
+
+def _default_hash_strategy() -> HashStrategy:
     if USE_FAST_HASH:
+        return HashStrategy.SampledPixels
+    else:
+        return HashStrategy.Full
+
+
+@dataclass
+class CvMetrics:
+    """
+    Counters of imgui_cv, for one frame or since the start (@see stats()). Durations are in seconds.
+    bytes_full_upload is what the uploads would have cost without dirty tiles detection (@see USE_DIRTY_TILES)
+    """
+    nb_textures_created: int = 0
+    nb_textures_deleted: int = 0
+    nb_textures_recycled: int = 0 # textures taken from TEXTURE_POOL instead of being created
+    nb_uploads: int = 0
+    nb_tiles_sent: int = 0
+    nb_tiles_total: int = 0
+    bytes_uploaded: int = 0
+    bytes_full_upload: int = 0
+    nb_cache_hits: int = 0
+    nb_cache_misses: int = 0
+    nb_cache_evictions: int = 0
+    nb_shared_textures: int = 0 # refreshes that reused a texture with the same content (@see USE_SHARED_TEXTURES)
+    hash_duration: float = 0.
+    conversion_duration: float = 0.
+    upload_duration: float = 0.
+    warp_duration: float = 0.
+
+    def add(self, other: "CvMetrics"):
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+
+# Metrics of the current frame, of the last complete frame, and of all the complete frames
+# (they are rotated by _clear_all_cv_textures(), once per frame)
+_FRAME_METRICS = CvMetrics()
+LAST_FRAME_METRICS = CvMetrics()
+_TOTAL_METRICS = CvMetrics()
+
+
+def _metered(name: str):
+    """
+    Decorator that adds the duration of each call to the metric {name}_duration,
+    and times it with the profiler (@see imgui_profiler)
+    """
+    metric_name = name + "_duration"
+
+    def decorate(function):
+        profiled_function = imgui_profiler.profiled(name)(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = timer()
+            try:
+                return profiled_function(*args, **kwargs)
+            finally:
+                setattr(_FRAME_METRICS, metric_name, getattr(_FRAME_METRICS, metric_name) + timer() - start)
+        return wrapper
+    return decorate
+
+
+@static_vars(sample_indices=OrderedDict())
+def _sample_indices(image_size: int) -> np.ndarray:
+    """
+    The indices of the sampled pixels are computed once per image size
+    (they are kept for the SAMPLE_INDICES_CACHE_SIZE most recently used sizes)
+    """
+    sample_indices = _sample_indices.statics.sample_indices
+    if image_size in sample_indices:
+        sample_indices.move_to_end(image_size)
+    else:
         rng = np.random.RandomState(89)
-        inds = rng.randint(low=0, high=image.size, size=100)
-        b = image.flat[inds]
-        result = hash(tuple(b.data))
-        return result
+        sample_indices[image_size] = rng.randint(low=0, high=image_size, size=NB_HASHED_PIXELS)
+        while len(sample_indices) > SAMPLE_INDICES_CACHE_SIZE:
+            sample_indices.popitem(last=False)
+    return sample_indices[image_size]
+
+
+@_metered("hash")
+def _hash_image(image, hash_strategy: Optional[HashStrategy] = None):
+    """
+    Three hash variants are possible (@see HashStrategy) :
+    - SampledPixels : select 100 random pixels and hash them
+    - StridedRows : hash one row out of N
+    - Full : compute the hash of the whole image (using xxhash for performance)
+    If hash_strategy is None, SampledPixels is used if imgui_cv.USE_FAST_HASH is True, Full otherwise
+    :param image:
+    :param hash_strategy:
+    :return:hash
+    """
+    if hash_strategy is None:
+        hash_strategy = _default_hash_strategy()
+    if image.size == 0:
+        return hash(image.shape)
+    if hash_strategy == HashStrategy.SampledPixels:
+        inds = _sample_indices(image.size)
+        hashed_data = image.flat[inds]
+    elif hash_strategy == HashStrategy.StridedRows:
+        row_step = max(1, image.shape[0] // NB_HASHED_ROWS)
+        hashed_data = np.ascontiguousarray(image[::row_step])
     else:
         # cf https://stackoverflow.com/questions/16589791/most-efficient-property-to-hash-for-numpy-array
-        h = xxhash.xxh64()
-        h.update(image)
-        result = h.intdigest()
-        h.reset()
-        return result
+        hashed_data = np.ascontiguousarray(image)
+    result = hash((image.shape, xxhash.xxh3_64_intdigest(hashed_data)))
+    return result
 
 
 class ImageAndAdjustments:
+    """
+    If version is not None, it is used instead of the image content in order to detect changes:
+    the caller shall provide a new version whenever the image content changes (the image is then never hashed).
+    Otherwise, the image is hashed (once per frame when it is displayed) in order to detect in-place changes
+    """
     image: Image_AnyType
     image_adjustment: ImageAdjustments
-    def __init__(self, image, image_adjustments):
+    hash_strategy: Optional[HashStrategy]
+    version: Optional[Hashable]
+    def __init__(self, image, image_adjustments, hash_strategy: Optional[HashStrategy] = None,
+                 version: Optional[Hashable] = None):
         self.image = image
         self.image_adjustments = image_adjustments
+        self.hash_strategy = hash_strategy
+        self.version = version
+        self._hash = None
+        self._content_hash = None
 
     def adjusted_image(self):
         return self.image_adjustments.adjust(self.image)
 
+    def content_hash(self):
+        """
+        Hash of the image content (without the adjustments), computed once and then cached
+        """
+        if self._content_hash is None:
+            if self.version is not None:
+                self._content_hash = hash((self.image.shape, self.version))
+            else:
+                self._content_hash = _hash_image(self.image, self.hash_strategy)
+        return self._content_hash
+
     def __hash__(self):
-        hash_adjust = hash(self.image_adjustments)
-        hash_image = _hash_image(self.image)
-        result = hash((hash_adjust, hash_image))
-        return result
+        """
+        The hash is computed once, and then cached
+        """
+        if self._hash is None:
+            self._hash = hash((hash(self.image_adjustments), self.content_hash()))
+        return self._hash
 
     def __eq__(self, other):
         """
@@ -122,34 +331,218 @@ class SizePixel:
         return self.width, self.height
 
 # ALL_TEXTURES contains a dict of all the images that were transferred to the GPU
-# plus their last access time
+# plus their last access time (the images themselves are not retained, only their hash).
+# It is ordered from the least recently used to the most recently used
 
 TimeSecond = float
 
 
-NB_GEN_TEXTURES = 0
-
 def _generate_texture_id() -> TextureId:
-    texture_id = gl.glGenTextures(1)
+    texture_id = GL_BACKEND.gen_texture()
+    _FRAME_METRICS.nb_textures_created += 1
     if LOG_GPU_USAGE:
-        global NB_GEN_TEXTURES
-        NB_GEN_TEXTURES = NB_GEN_TEXTURES + 1
-        print(f"NB_GEN_TEXTURES = {NB_GEN_TEXTURES}")
+        print(f"nb_textures_created = {_TOTAL_METRICS.nb_textures_created + _FRAME_METRICS.nb_textures_created}")
     return texture_id
 
 
+def _delete_textures(texture_ids: List[TextureId]):
+    GL_BACKEND.delete_textures(texture_ids)
+    _FRAME_METRICS.nb_textures_deleted += len(texture_ids)
+
+
+TexturePoolKey = Tuple[int, int, int] # width, height, internal format
+
+
+class _TexturePool:
+    """
+    Textures whose storage is already allocated, and which can be recycled
+    (@see TEXTURE_POOL_MAX_BYTES)
+    """
+    def __init__(self):
+        self.textures_by_key: Dict[TexturePoolKey, List[TextureId]] = {}
+        # texture_id -> (key, nb_bytes), in least recently used order
+        self.lru: "OrderedDict[TextureId, Tuple[TexturePoolKey, int]]" = OrderedDict()
+        self.nb_bytes = 0
+
+    def acquire(self, key: TexturePoolKey) -> Optional[TextureId]:
+        textures = self.textures_by_key.get(key)
+        if not textures:
+            return None
+        texture_id = textures.pop()
+        if len(textures) == 0:
+            del self.textures_by_key[key]
+        _, nb_bytes = self.lru.pop(texture_id)
+        self.nb_bytes -= nb_bytes
+        _FRAME_METRICS.nb_textures_recycled += 1
+        return texture_id
+
+    def release(self, texture_id: TextureId, key: TexturePoolKey, nb_bytes: int):
+        self.textures_by_key.setdefault(key, []).append(texture_id)
+        self.lru[texture_id] = (key, nb_bytes)
+        self.nb_bytes += nb_bytes
+        self._evict(TEXTURE_POOL_MAX_BYTES)
+
+    def _evict(self, max_bytes: int):
+        textures_to_delete = []
+        while self.nb_bytes > max_bytes and len(self.lru) > 0:
+            texture_id, (key, nb_bytes) = self.lru.popitem(last=False)
+            self.textures_by_key[key].remove(texture_id)
+            if len(self.textures_by_key[key]) == 0:
+                del self.textures_by_key[key]
+            self.nb_bytes -= nb_bytes
+            textures_to_delete.append(texture_id)
+        if len(textures_to_delete) > 0:
+            _delete_textures(textures_to_delete)
+
+    def clear(self):
+        self._evict(-1)
+
+
+TEXTURE_POOL = _TexturePool()
+
+
+# size, format, dtype and hash of an uploaded image, and sampling of its texture (@see _set_texture_sampling)
+ContentKey = Tuple[int, int, int, int, bool, str, int, bool]
+
+
+@dataclass
+class GpuTexture:
+    """
+    A texture stored on the GPU.
+    It can be shared by several entries of ALL_TEXTURES that display the same content (@see USE_SHARED_TEXTURES)
+    """
+    texture_id: TextureId = 0
+    texture_size: Optional[SizePixel] = None # size of the storage allocated by glTexImage2D
+    texture_internal_format: int = 0
+    texture_nb_bytes: int = 0
+    tile_hashes: Optional[np.ndarray] = None # hash of each tile, as of the last upload (@see USE_DIRTY_TILES)
+    content_key: Optional[ContentKey] = None # key of this texture inside SHARED_TEXTURES
+    nb_refs: int = 0 # number of entries of ALL_TEXTURES that use this texture
+    # sampling parameters currently set on the texture (None if unknown, @see _set_texture_sampling)
+    zoom_sampling: Optional[bool] = None
+
+    def texture_pool_key(self) -> TexturePoolKey:
+        return self.texture_size.width, self.texture_size.height, self.texture_internal_format
+
+    def acquire_texture(self, texture_size: SizePixel, internal_format: int):
+        """
+        Acquires a texture from TEXTURE_POOL if possible (its storage is then already allocated),
+        or generates a new one
+        """
+        self.release_texture()
+        texture_id = TEXTURE_POOL.acquire((texture_size.width, texture_size.height, internal_format))
+        if texture_id is not None:
+            self.texture_id = texture_id
+            self.texture_size = texture_size
+            self.texture_internal_format = internal_format
+        else:
+            self.texture_id = _generate_texture_id()
+
+    def release_texture(self):
+        """
+        Gives the texture back to TEXTURE_POOL
+        """
+        if self.texture_id == 0:
+            return
+        if self.texture_size is not None:
+            TEXTURE_POOL.release(self.texture_id, self.texture_pool_key(), self.texture_nb_bytes)
+        else:
+            _delete_textures([self.texture_id])
+        self.texture_id = 0
+        self.texture_size = None
+        self.tile_hashes = None
+        self.zoom_sampling = None
+
+    def unshare(self):
+        """
+        Removes this texture from SHARED_TEXTURES (its content is about to change)
+        """
+        if self.content_key is not None and SHARED_TEXTURES.get(self.content_key) is self:
+            del SHARED_TEXTURES[self.content_key]
+        self.content_key = None
+
+
+# SHARED_TEXTURES contains the textures of ALL_TEXTURES, indexed by their content
+SHARED_TEXTURES: Dict[ContentKey, GpuTexture] = {}
+
+
 @dataclass
 class ImageStoredOnGpu:
-    image_and_adjustments: ImageAndAdjustments
-    texture_id: TextureId
     time_last_access: TimeSecond = -10000.
-    def __init__(self, image_and_adjustments: ImageAndAdjustments, time_last_access):
-        self.image_and_adjustments = image_and_adjustments
+    frame_last_access: int = -1
+    gpu_texture: Optional[GpuTexture] = None # acquired on the first upload
+    image_hash: Optional[int] = None # hash of the ImageAndAdjustments, as of the last upload
+    content_hash: Optional[int] = None # full hash of the image, as of the last upload (@see DEBUG_CHECK_IMAGE_VERSIONS)
+    # removes this entry when the object that owns it (usually the image) is garbage collected
+    owner_finalizer: Optional[weakref.finalize] = None
+    def __init__(self, time_last_access):
         self.time_last_access = time_last_access
-        self.texture_id = _generate_texture_id()
+        self.frame_last_access = -1
+        self.gpu_texture = None
+        self.image_hash = None
+        self.content_hash = None
+        self.owner_finalizer = None
+
+    @property
+    def texture_id(self) -> TextureId:
+        if self.gpu_texture is None:
+            return 0
+        return self.gpu_texture.texture_id
+
+    def set_gpu_texture(self, gpu_texture: Optional[GpuTexture]):
+        if gpu_texture is self.gpu_texture:
+            return
+        self.release_gpu_texture()
+        if gpu_texture is not None:
+            gpu_texture.nb_refs += 1
+        self.gpu_texture = gpu_texture
+
+    def release_gpu_texture(self):
+        """
+        Releases the reference to the texture. The texture is given back to TEXTURE_POOL
+        when it is not used anymore
+        """
+        gpu_texture = self.gpu_texture
+        if gpu_texture is None:
+            return
+        self.gpu_texture = None
+        gpu_texture.nb_refs -= 1
+        if gpu_texture.nb_refs == 0:
+            gpu_texture.unshare()
+            gpu_texture.release_texture()
+
+    def watch_owner(self, owner, image_address):
+        """
+        Schedules the removal of this entry when owner is garbage collected (@see _DEAD_CACHE_ENTRIES).
+        An entry keeps its owner until the owner dies: then, a new image may reuse its address (and the entry)
+        """
+        if self.owner_finalizer is not None and self.owner_finalizer.alive:
+            return
+        try:
+            self.owner_finalizer = weakref.finalize(owner, _DEAD_CACHE_ENTRIES.append, (image_address, self))
+        except TypeError:
+            return # (owner does not support weak references)
+        self.owner_finalizer.atexit = False
+
+    def stop_watching_owner(self):
+        if self.owner_finalizer is not None:
+            self.owner_finalizer.detach()
+            self.owner_finalizer = None
+
+    def is_owner_dead(self) -> bool:
+        return self.owner_finalizer is not None and not self.owner_finalizer.alive
+
+# (the key is either an image address, or (image address, width, height) for a resized image,
+#  or (image address, "zoom") for an image zoomed via the texture coordinates, @see _image_to_texture)
+AllTexturesDict = "OrderedDict[Union[ImageAddress, Tuple[ImageAddress, int, int]], ImageStoredOnGpu]"
+ALL_TEXTURES: AllTexturesDict = OrderedDict()
 
-AllTexturesDict = Dict[ImageAddress, ImageStoredOnGpu]
-ALL_TEXTURES: AllTexturesDict = {}
+# The entries of ALL_TEXTURES whose owner was garbage collected, as (key, entry).
+# An image may be released by any thread: they are removed once per frame, by _clear_all_cv_textures()
+_DEAD_CACHE_ENTRIES: List[Tuple[Any, ImageStoredOnGpu]] = []
+
+
+_FRAME_INDEX = 0
 
 
 def _to_rgb_image(img: Image_AnyType) -> Image_RGB:
@@ -175,89 +568,614 @@ def _to_rgb_image(img: Image_AnyType) -> Image_RGB:
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
     return img_rgb
 
-NB_REFRESH_TEXTURES = 0
-def _image_rgb_to_texture_impl(img_rgb: Image_RGB, texture_id: TextureId):
+
+@dataclass
+class TextureFormat:
+    """
+    Parameters of glTexImage2D for a given image type
+    """
+    internal_format: int
+    pixel_format: int
+    pixel_type: int
+    swizzle_grey: bool = False # if True, the red channel is displayed as grey
+
+
+TEXTURE_FORMAT_BGR = TextureFormat(gl.GL_RGB, gl.GL_BGR, gl.GL_UNSIGNED_BYTE)
+TEXTURE_FORMAT_BGRA = TextureFormat(gl.GL_RGBA8, gl.GL_BGRA, gl.GL_UNSIGNED_BYTE)
+TEXTURE_FORMAT_GREY = TextureFormat(gl.GL_R8, gl.GL_RED, gl.GL_UNSIGNED_BYTE, swizzle_grey=True)
+TEXTURE_FORMAT_GREY_FLOAT = TextureFormat(gl.GL_R32F, gl.GL_RED, gl.GL_FLOAT, swizzle_grey=True)
+
+
+def _native_texture_format(img: Image_AnyType) -> Tuple[TextureFormat, np.dtype]:
+    """
+    Returns the texture format of an image, and the dtype of the image that shall be transferred.
+    The dtype is the image dtype, except for float64 images (transferred as float32)
+    """
+    if len(img.shape) >= 3:
+        channels = img.shape[2]
+    else:
+        channels = 1
+    if channels == 1:
+        if img.dtype == np.uint8:
+            return TEXTURE_FORMAT_GREY, np.dtype(np.uint8)
+        elif img.dtype in [np.float32, np.float64]:
+            return TEXTURE_FORMAT_GREY_FLOAT, np.dtype(np.float32)
+        else:
+            raise ValueError("imgui_cv does only support uint8, float32 and float64 images with one channel")
+    elif channels == 3:
+        if not img.dtype == np.uint8:
+            raise ValueError("imgui_cv does only support uint8 images with multiple channels")
+        return TEXTURE_FORMAT_BGR, np.dtype(np.uint8)
+    elif channels == 4:
+        if not img.dtype == np.uint8:
+            raise ValueError("imgui_cv does only support uint8 images with multiple channels")
+        return TEXTURE_FORMAT_BGRA, np.dtype(np.uint8)
+    else:
+        raise ValueError("imgui_cv does only support images with 1, 3 or 4 channels")
+
+
+@_metered("conversion")
+def _image_for_upload(
+    image_and_adjustments: ImageAndAdjustments,
+    target_size: Optional[SizePixel] = None
+    ) -> Tuple[Image_AnyType, TextureFormat]:
+    """
+    Returns the image that shall be transferred to the GPU, and its format.
+    The user image is read directly: at most one output buffer is allocated
+    (when adjustments or a conversion are needed), plus the resized image if target_size is given
+    """
+    image = image_and_adjustments.image
+    if target_size is not None:
+        image = cv2.resize(image, target_size.as_tuple_width_height(), interpolation=cv2.INTER_AREA)
+    image_adjustments = image_and_adjustments.image_adjustments
+    if USE_NATIVE_TEXTURE_FORMATS:
+        texture_format, dtype = _native_texture_format(image)
+        return image_adjustments.adjust(image, dtype), texture_format
+    else:
+        return _to_rgb_image(image_adjustments.adjust(image)), TEXTURE_FORMAT_BGR
+
+
+def _tile_slices(image_size: SizePixel, tile_size: int):
+    """
+    Yields (tile_y, tile_x, slice_y, slice_x) for each tile of an image
+    """
+    for tile_y, y0 in enumerate(range(0, image_size.height, tile_size)):
+        for tile_x, x0 in enumerate(range(0, image_size.width, tile_size)):
+            yield tile_y, tile_x, slice(y0, min(y0 + tile_size, image_size.height)), \
+                slice(x0, min(x0 + tile_size, image_size.width))
+
+
+@imgui_profiler.profiled("tile_hashes")
+def _tile_hashes(image: Image_AnyType, tile_size: int) -> np.ndarray:
+    image_size = SizePixel.from_image(image)
+    nb_tiles_y = int(math.ceil(image_size.height / tile_size))
+    nb_tiles_x = int(math.ceil(image_size.width / tile_size))
+    hashes = np.zeros((nb_tiles_y, nb_tiles_x), np.uint64)
+    for tile_y, tile_x, slice_y, slice_x in _tile_slices(image_size, tile_size):
+        tile = np.ascontiguousarray(image[slice_y, slice_x])
+        hashes[tile_y, tile_x] = xxhash.xxh3_64_intdigest(tile)
+    return hashes
+
+
+@_metered("upload")
+def _image_to_texture_impl(
+    img: Image_AnyType,
+    texture_format: TextureFormat,
+    gpu_texture: GpuTexture,
+    tile_hashes: Optional[np.ndarray]):
     """
     Performs the actual transfer to the gpu and returns a texture_id
+
+    The texture storage is allocated (glTexImage2D) only when the image size changes.
+    Otherwise, only the tiles that changed since the last upload are transferred (glTexSubImage2D)
     """
     # inspired from https://www.programcreek.com/python/example/95539/OpenGL.GL.glPixelStorei (example 3)
+    image_size = SizePixel.from_image(img)
+    width = image_size.width
+    height = image_size.height
+    internal_format = texture_format.internal_format
+    pixel_format = texture_format.pixel_format
+    pixel_type = texture_format.pixel_type
+    bytes_full_upload = img.nbytes
+
+    def is_storage_ok():
+        return gpu_texture.texture_id != 0 \
+            and gpu_texture.texture_size is not None \
+            and gpu_texture.texture_pool_key() == (width, height, internal_format)
+
+    texture_acquired = not is_storage_ok()
+    if texture_acquired:
+        gpu_texture.acquire_texture(image_size, internal_format)
+    storage_ok = is_storage_ok()
+    texture_id = gpu_texture.texture_id
+    if USE_DIRTY_TILES:
+        if storage_ok and gpu_texture.tile_hashes is not None:
+            dirty_tiles = tile_hashes != gpu_texture.tile_hashes
+        else:
+            dirty_tiles = np.ones(tile_hashes.shape, bool)
+    else:
+        tile_hashes = None
+        dirty_tiles = np.ones((1, 1), bool)
+
+    GL_BACKEND.bind_texture(texture_id)
+    GL_BACKEND.pixel_store_i(gl.GL_UNPACK_ALIGNMENT, 1)
+    if texture_acquired:
+        # the texture parameters are set once per texture: the sampling parameters are set
+        # by _set_texture_sampling() (a recycled texture might have been used with other parameters)
+        if texture_format.swizzle_grey:
+            swizzle = [gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_ONE]
+        else:
+            swizzle = [gl.GL_RED, gl.GL_GREEN, gl.GL_BLUE, gl.GL_ALPHA]
+        GL_BACKEND.tex_parameter_iv(gl.GL_TEXTURE_SWIZZLE_RGBA, swizzle)
+    if not storage_ok:
+        GL_BACKEND.tex_image_2d(internal_format, width, height, pixel_format, pixel_type, img)
+        bytes_sent = bytes_full_upload
+    elif dirty_tiles.all():
+        GL_BACKEND.tex_sub_image_2d(0, 0, width, height, pixel_format, pixel_type, img)
+        bytes_sent = bytes_full_upload
+    else:
+        bytes_sent = 0
+        for tile_y, tile_x, slice_y, slice_x in _tile_slices(image_size, DIRTY_TILE_SIZE):
+            if dirty_tiles[tile_y, tile_x]:
+                tile = np.ascontiguousarray(img[slice_y, slice_x])
+                GL_BACKEND.tex_sub_image_2d(slice_x.start, slice_y.start, tile.shape[1], tile.shape[0],
+                                            pixel_format, pixel_type, tile)
+                bytes_sent += tile.nbytes
+    GL_BACKEND.bind_texture(0)
+
+    gpu_texture.texture_size = image_size
+    gpu_texture.texture_internal_format = internal_format
+    gpu_texture.texture_nb_bytes = bytes_full_upload
+    gpu_texture.tile_hashes = tile_hashes
+    _FRAME_METRICS.nb_uploads += 1
+    _FRAME_METRICS.nb_tiles_sent += int(dirty_tiles.sum())
+    _FRAME_METRICS.nb_tiles_total += dirty_tiles.size
+    _FRAME_METRICS.bytes_uploaded += bytes_sent
+    _FRAME_METRICS.bytes_full_upload += bytes_full_upload
     if LOG_GPU_USAGE:
-        global NB_REFRESH_TEXTURES
-        NB_REFRESH_TEXTURES = NB_REFRESH_TEXTURES + 1
-        print(f"NB_REFRESH_TEXTURES = {NB_REFRESH_TEXTURES}")
-    width = img_rgb.shape[1]
-    height = img_rgb.shape[0]
-
-    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
-    gl.glBindTexture(gl.GL_TEXTURE_2D, texture_id)
-    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
-    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
-    gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, width, height, 0, gl.GL_BGR, gl.GL_UNSIGNED_BYTE, img_rgb)
-    gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        print(f"nb_uploads = {_TOTAL_METRICS.nb_uploads + _FRAME_METRICS.nb_uploads}")
     return texture_id
 
 
+def _content_key(img: Image_AnyType, texture_format: TextureFormat, tile_hashes: np.ndarray,
+                 zoom_sampling: bool) -> ContentKey:
+    return (img.shape[1], img.shape[0],
+            texture_format.internal_format, texture_format.pixel_format, texture_format.swizzle_grey,
+            img.dtype.str, xxhash.xxh3_128_intdigest(tile_hashes), zoom_sampling)
+
+
+def _update_gpu_texture(img: Image_AnyType, texture_format: TextureFormat, image_stored_on_gpu: ImageStoredOnGpu,
+                        zoom_sampling: bool):
+    """
+    Transfers img into the texture of image_stored_on_gpu,
+    unless a texture with the same content and the same sampling is already on the GPU (in which case it is shared:
+    a texture has a single sampling mode, since all the draws of a frame are performed after its widgets)
+    """
+    if USE_DIRTY_TILES or USE_SHARED_TEXTURES:
+        tile_hashes = _tile_hashes(img, DIRTY_TILE_SIZE)
+    else:
+        tile_hashes = None
+    gpu_texture = image_stored_on_gpu.gpu_texture
+
+    content_key = None
+    if USE_SHARED_TEXTURES:
+        content_key = _content_key(img, texture_format, tile_hashes, zoom_sampling)
+        if gpu_texture is not None and gpu_texture.content_key == content_key:
+            return
+        shared_texture = SHARED_TEXTURES.get(content_key)
+        if shared_texture is not None:
+            image_stored_on_gpu.set_gpu_texture(shared_texture)
+            _FRAME_METRICS.nb_shared_textures += 1
+            return
+
+    if gpu_texture is None or gpu_texture.nb_refs > 1:
+        # a shared texture shall not be modified: use a texture of our own
+        gpu_texture = GpuTexture()
+        image_stored_on_gpu.set_gpu_texture(gpu_texture)
+    gpu_texture.unshare()
+    _image_to_texture_impl(img, texture_format, gpu_texture, tile_hashes if USE_DIRTY_TILES else None)
+    if content_key is not None:
+        gpu_texture.content_key = content_key
+        SHARED_TEXTURES[content_key] = gpu_texture
+
+
+def _debug_check_image_version(
+    image_and_adjustments: ImageAndAdjustments,
+    image_stored_on_gpu: ImageStoredOnGpu,
+    shall_refresh: bool):
+    """
+    Reports when an image version was reused while the image content changed (@see DEBUG_CHECK_IMAGE_VERSIONS)
+    """
+    global NB_VERSION_MISMATCHES
+    content_hash = _hash_image(image_and_adjustments.image, HashStrategy.Full)
+    if not shall_refresh and image_stored_on_gpu.content_hash is not None \
+            and content_hash != image_stored_on_gpu.content_hash:
+        NB_VERSION_MISMATCHES = NB_VERSION_MISMATCHES + 1
+        print(f"imgui_cv: image version {image_and_adjustments.version!r} was reused, "
+              f"but the image content changed (NB_VERSION_MISMATCHES = {NB_VERSION_MISMATCHES})")
+    image_stored_on_gpu.content_hash = content_hash
+
+
+def _image_address(image_and_adjustments: ImageAndAdjustments, linked_user_image_address: ImageAddress):
+    if linked_user_image_address == 0:
+        return id(image_and_adjustments.image)
+    else:
+        return linked_user_image_address
+
+
+def _image_owner(image_and_adjustments: ImageAndAdjustments, linked_user_image_address: ImageAddress, image_owner):
+    """
+    Returns the object whose garbage collection removes the cache entry of an image: image_owner if given,
+    otherwise the image itself, unless its entry is linked by the user to another address (None in this case)
+    """
+    if image_owner is not None:
+        return image_owner
+    if _image_address(image_and_adjustments, linked_user_image_address) == id(image_and_adjustments.image):
+        return image_and_adjustments.image
+    return None
+
+
+def _texture_cache_entry(
+    image_address,
+    image_and_adjustments: ImageAndAdjustments,
+    always_refresh: bool,
+    image_owner = None
+    ) -> Tuple[ImageStoredOnGpu, bool]:
+    """
+    Returns the entry of ALL_TEXTURES for image_address (it is created if needed, and marked as used),
+    and whether its texture shall be refreshed.
+    The entry is removed when image_owner (if not None) is garbage collected
+    """
+    shall_refresh = False
+
+    if image_address not in ALL_TEXTURES:
+        ALL_TEXTURES[image_address] = ImageStoredOnGpu(timer())
+        _FRAME_METRICS.nb_cache_misses += 1
+        shall_refresh = True
+    else:
+        ALL_TEXTURES.move_to_end(image_address)
+        _FRAME_METRICS.nb_cache_hits += 1
+
+    image_stored_on_gpu: ImageStoredOnGpu = ALL_TEXTURES[image_address]
+    image_stored_on_gpu.time_last_access = timer()
+    image_stored_on_gpu.frame_last_access = _FRAME_INDEX
+    if image_owner is not None:
+        image_stored_on_gpu.watch_owner(image_owner, image_address)
+
+    if always_refresh:
+        shall_refresh = True
+    elif hash(image_and_adjustments) != image_stored_on_gpu.image_hash:
+        shall_refresh = True
+    return image_stored_on_gpu, shall_refresh
 
 
 def _image_to_texture(
     image_and_adjustments: ImageAndAdjustments,
     always_refresh: bool,
-    linked_user_image_address: ImageAddress
+    linked_user_image_address: ImageAddress,
+    target_size: Optional[SizePixel] = None,
+    zoom_sampling: bool = False,
+    image_owner = None
     ):
     """
     _image_to_texture will transfer the image to the GPU and return a texture Id
     Some GPU might choke if too many textures are transferred.
     For this reason :
-      - a cache is maintained (ALL_TEXTURES)
+      - a cache is maintained (ALL_TEXTURES), within a VRAM budget (TEXTURE_CACHE_MAX_BYTES)
+      - identical contents share the same texture (@see USE_SHARED_TEXTURES)
       - a quick comparison is made before the transfer:
-      @see _hash_image()
+      @see _hash_image() and HashStrategy
       @see ImageAndAdjustments.__eq__() : for performance reasons, the __eq__ operator
       is made to take only the hash into account.
     :param image_and_adjustments:
+    :param target_size: if not None, the image is resized to this size before the transfer
+                        (it is then stored in a separate entry of ALL_TEXTURES)
+    :param zoom_sampling: sampling parameters of the texture (@see _set_texture_sampling)
+    :param image_owner: the entry is removed when this object is garbage collected (@see _image_owner)
     :return: texture_id
     """
-    now = timer()
-    if linked_user_image_address == 0:
-        image_address = id(image_and_adjustments.image)
+    image_address = _image_address(image_and_adjustments, linked_user_image_address)
+    if target_size is not None:
+        image_address = (image_address, target_size.width, target_size.height)
+    if zoom_sampling:
+        # (the sampling is set on the texture: it cannot be shared with imgui_cv.image(), which samples it linearly)
+        image_address = (image_address, "zoom")
+
+    image_stored_on_gpu, shall_refresh = _texture_cache_entry(
+        image_address, image_and_adjustments, always_refresh,
+        _image_owner(image_and_adjustments, linked_user_image_address, image_owner))
+
+    if DEBUG_CHECK_IMAGE_VERSIONS and image_and_adjustments.version is not None:
+        _debug_check_image_version(image_and_adjustments, image_stored_on_gpu, shall_refresh)
+
+    if shall_refresh:
+        img_upload, texture_format = _image_for_upload(image_and_adjustments, target_size)
+        _update_gpu_texture(img_upload, texture_format, image_stored_on_gpu, zoom_sampling)
+        # (the hash is not computed when always_refresh is set)
+        image_stored_on_gpu.image_hash = image_and_adjustments._hash
+    _set_texture_sampling(image_stored_on_gpu.gpu_texture, zoom_sampling)
+    return image_stored_on_gpu.texture_id
+
+
+def _set_texture_sampling(gpu_texture: Optional[GpuTexture], zoom_sampling: bool):
+    """
+    Sets the sampling parameters of a texture, unless they are already set:
+      - if zoom_sampling is False: linear filtering, clamped to the edge
+      - if zoom_sampling is True (textures that are zoomed via their uv coordinates):
+        nearest pixel (in order to inspect individual pixels), and black outside of the image
+        (same look as cv2.warpAffine)
+    """
+    if gpu_texture is None or gpu_texture.texture_id == 0 or gpu_texture.zoom_sampling == zoom_sampling:
+        return
+    if zoom_sampling:
+        texture_filter, texture_wrap = gl.GL_NEAREST, gl.GL_CLAMP_TO_BORDER
     else:
-        image_address = linked_user_image_address
+        texture_filter, texture_wrap = gl.GL_LINEAR, gl.GL_CLAMP_TO_EDGE
+    GL_BACKEND.bind_texture(gpu_texture.texture_id)
+    GL_BACKEND.tex_parameter_i(gl.GL_TEXTURE_MAG_FILTER, texture_filter)
+    GL_BACKEND.tex_parameter_i(gl.GL_TEXTURE_MIN_FILTER, texture_filter)
+    GL_BACKEND.tex_parameter_i(gl.GL_TEXTURE_WRAP_S, texture_wrap)
+    GL_BACKEND.tex_parameter_i(gl.GL_TEXTURE_WRAP_T, texture_wrap)
+    if zoom_sampling:
+        GL_BACKEND.tex_parameter_fv(gl.GL_TEXTURE_BORDER_COLOR, (0., 0., 0., 1.))
+    GL_BACKEND.bind_texture(0)
+    gpu_texture.zoom_sampling = zoom_sampling
+
+
+def _max_texture_size() -> int:
+    """
+    Returns MAX_TEXTURE_SIZE, or the driver limit if it is None
+    """
+    if MAX_TEXTURE_SIZE is not None:
+        return MAX_TEXTURE_SIZE
+    return GL_BACKEND.max_texture_size()
 
-    shall_refresh = False
 
-    if image_address not in ALL_TEXTURES:
-        ALL_TEXTURES[image_address] = ImageStoredOnGpu(image_and_adjustments, now)
-        shall_refresh = True
+def _needs_texture_tiles(image_size: SizePixel) -> bool:
+    max_texture_size = _max_texture_size()
+    return image_size.width > max_texture_size or image_size.height > max_texture_size
 
-    if always_refresh:
-        shall_refresh = True
 
-    image_stored_on_gpu: ImageStoredOnGpu = ALL_TEXTURES[image_address]
-    image_stored_on_gpu.time_last_access = now
+@dataclass
+class TextureTile:
+    """
+    A tile of an image stored as a grid of textures, and the part of it that is displayed:
+    [uv0, uv1] (in the tile texture coordinates) is drawn at [viewport_p0, viewport_p1] (in the viewport)
+    """
+    tile_y: int
+    tile_x: int
+    slice_y: slice
+    slice_x: slice
+    viewport_p0: Tuple[float, float]
+    viewport_p1: Tuple[float, float]
+    uv0: Tuple[float, float]
+    uv1: Tuple[float, float]
+
+
+def _visible_texture_tiles(
+    image_size: SizePixel,
+    tile_size: int,
+    viewport_size: SizePixel,
+    uv0=(0., 0.), uv1=(1., 1.)
+    ) -> List[TextureTile]:
+    """
+    Splits an image into a grid of tiles of tile_size pixels, and returns the tiles that are visible
+    when the [uv0, uv1] part of the image is displayed inside viewport_size
+    """
+    # visible part of the image, in pixels
+    x0, y0 = uv0[0] * image_size.width, uv0[1] * image_size.height
+    x1, y1 = uv1[0] * image_size.width, uv1[1] * image_size.height
+    if x1 <= x0 or y1 <= y0:
+        return []
+    visible_x0, visible_x1 = max(x0, 0.), min(x1, float(image_size.width))
+    visible_y0, visible_y1 = max(y0, 0.), min(y1, float(image_size.height))
+    if visible_x1 <= visible_x0 or visible_y1 <= visible_y0:
+        return []
+    # viewport pixels per image pixel
+    scale_x = viewport_size.width / (x1 - x0)
+    scale_y = viewport_size.height / (y1 - y0)
+
+    tiles = []
+    for tile_y in range(int(visible_y0 // tile_size), int(math.ceil(visible_y1 / tile_size))):
+        for tile_x in range(int(visible_x0 // tile_size), int(math.ceil(visible_x1 / tile_size))):
+            slice_y = slice(tile_y * tile_size, min((tile_y + 1) * tile_size, image_size.height))
+            slice_x = slice(tile_x * tile_size, min((tile_x + 1) * tile_size, image_size.width))
+            tile_w = slice_x.stop - slice_x.start
+            tile_h = slice_y.stop - slice_y.start
+            # displayed part of the tile, in image pixels
+            part_x0, part_x1 = max(slice_x.start, visible_x0), min(slice_x.stop, visible_x1)
+            part_y0, part_y1 = max(slice_y.start, visible_y0), min(slice_y.stop, visible_y1)
+            tiles.append(TextureTile(
+                tile_y=tile_y, tile_x=tile_x, slice_y=slice_y, slice_x=slice_x,
+                viewport_p0=((part_x0 - x0) * scale_x, (part_y0 - y0) * scale_y),
+                viewport_p1=((part_x1 - x0) * scale_x, (part_y1 - y0) * scale_y),
+                uv0=((part_x0 - slice_x.start) / tile_w, (part_y0 - slice_y.start) / tile_h),
+                uv1=((part_x1 - slice_x.start) / tile_w, (part_y1 - slice_y.start) / tile_h)))
+    return tiles
+
+
+def _tiled_image_to_textures(
+    image_and_adjustments: ImageAndAdjustments,
+    viewport_size: SizePixel,
+    uv0, uv1,
+    always_refresh: bool,
+    linked_user_image_address: ImageAddress,
+    zoom_sampling: bool,
+    image_owner = None
+    ) -> List[Tuple[TextureTile, TextureId]]:
+    """
+    Transfers the visible tiles of an image to the GPU (@see MAX_TEXTURE_SIZE).
+    Each tile is stored in its own entry of ALL_TEXTURES, so that the tiles that are not visible anymore
+    can be evicted like any other texture.
+    :return: the visible tiles and their texture id
+    """
+    image = image_and_adjustments.image
+    image_address = _image_address(image_and_adjustments, linked_user_image_address)
+    image_owner = _image_owner(image_and_adjustments, linked_user_image_address, image_owner)
+    tile_size = min(TEXTURE_TILE_SIZE, _max_texture_size())
+    result = []
+    for tile in _visible_texture_tiles(SizePixel.from_image(image), tile_size, viewport_size, uv0, uv1):
+        tile_address = (image_address, "tile", tile.tile_y, tile.tile_x, zoom_sampling)
+        # (the tiles are compared via the hash of the whole image, which is computed only once)
+        image_stored_on_gpu, shall_refresh = _texture_cache_entry(
+            tile_address, image_and_adjustments, always_refresh, image_owner)
+        if shall_refresh:
+            tile_image = np.ascontiguousarray(image[tile.slice_y, tile.slice_x])
+            img_upload, texture_format = _image_for_upload(
+                ImageAndAdjustments(tile_image, image_and_adjustments.image_adjustments))
+            _update_gpu_texture(np.ascontiguousarray(img_upload), texture_format, image_stored_on_gpu, zoom_sampling)
+            image_stored_on_gpu.image_hash = image_and_adjustments._hash
+        _set_texture_sampling(image_stored_on_gpu.gpu_texture, zoom_sampling)
+        result.append((tile, image_stored_on_gpu.texture_id))
+    return result
+
+
+def _draw_tiled_image(
+    image_and_adjustments: ImageAndAdjustments,
+    viewport_size: SizePixel,
+    uv0=(0., 0.), uv1=(1., 1.),
+    always_refresh: bool = False,
+    linked_user_image_address: ImageAddress = 0,
+    zoom_sampling: bool = False,
+    image_owner = None
+    ):
+    """
+    Displays the [uv0, uv1] part of an image that is stored as a grid of textures.
+    The space is reserved by an invisible button (so that the mouse handling is the same as with
+    imgui.image_button), and the visible tiles are drawn side by side with the window draw list
+    """
+    tiles_and_textures = _tiled_image_to_textures(
+        image_and_adjustments, viewport_size, uv0, uv1, always_refresh, linked_user_image_address, zoom_sampling,
+        image_owner)
+    origin = imgui.get_cursor_screen_pos()
+    imgui.invisible_button(imgui_ext.make_unique_label("tiled_image"), viewport_size.width, viewport_size.height)
+    draw_list = imgui.get_window_draw_list()
+    if zoom_sampling:
+        # black outside of the image, as with _set_texture_sampling()
+        draw_list.add_rect_filled(origin.x, origin.y, origin.x + viewport_size.width,
+                                  origin.y + viewport_size.height, imgui.get_color_u32_rgba(0., 0., 0., 1.))
+    for tile, texture_id in tiles_and_textures:
+        draw_list.add_image(
+            texture_id,
+            (origin.x + tile.viewport_p0[0], origin.y + tile.viewport_p0[1]),
+            (origin.x + tile.viewport_p1[0], origin.y + tile.viewport_p1[1]),
+            tile.uv0, tile.uv1)
+
+
+def _cache_gpu_textures() -> List[GpuTexture]:
+    """
+    Returns the textures used by ALL_TEXTURES (the shared textures are listed once)
+    """
+    all_gpu_textures = {
+        id(image_stored_on_gpu.gpu_texture): image_stored_on_gpu.gpu_texture
+        for image_stored_on_gpu in ALL_TEXTURES.values() if image_stored_on_gpu.gpu_texture is not None}
+    return list(all_gpu_textures.values())
 
-    if shall_refresh:
-        image_and_adjustments_copy = copy.deepcopy(image_and_adjustments)
-        img_adjusted = image_and_adjustments_copy.adjusted_image()
-        img_rgb = _to_rgb_image(img_adjusted)
-        _image_rgb_to_texture_impl(img_rgb, image_stored_on_gpu.texture_id)
-    return image_stored_on_gpu.texture_id
+
+def _evict_least_recently_used_entry() -> int:
+    """
+    Removes the least recently used entry of ALL_TEXTURES (its texture goes back to TEXTURE_POOL
+    if no other entry uses it), and returns the number of bytes that were freed in the cache
+    """
+    _, image_stored_on_gpu = ALL_TEXTURES.popitem(last=False)
+    image_stored_on_gpu.stop_watching_owner()
+    gpu_texture = image_stored_on_gpu.gpu_texture
+    nb_bytes_freed = 0
+    if gpu_texture is not None and gpu_texture.nb_refs == 1:
+        nb_bytes_freed = gpu_texture.texture_nb_bytes
+    image_stored_on_gpu.release_gpu_texture()
+    _FRAME_METRICS.nb_cache_evictions += 1
+    return nb_bytes_freed
+
+
+def _remove_dead_entries():
+    """
+    Gives the textures of the entries whose owner was garbage collected back to TEXTURE_POOL
+    (unless their address was reused by a new image in the meantime)
+    """
+    while len(_DEAD_CACHE_ENTRIES) > 0:
+        image_address, image_stored_on_gpu = _DEAD_CACHE_ENTRIES.pop()
+        if ALL_TEXTURES.get(image_address) is image_stored_on_gpu and image_stored_on_gpu.is_owner_dead():
+            del ALL_TEXTURES[image_address]
+            image_stored_on_gpu.release_gpu_texture()
+            _FRAME_METRICS.nb_cache_evictions += 1
 
 
 def _clear_all_cv_textures():
-    global ALL_TEXTURES
-    all_textures_updated = {}
-    textures_to_delete = []
-    now = timer()
-    for image_address, image_stored_on_gpu in ALL_TEXTURES.items():
-        age_seconds = now - image_stored_on_gpu.time_last_access
-        if age_seconds < 0.3:
-            all_textures_updated[image_address] = image_stored_on_gpu
-        else:
-            textures_to_delete.append(image_stored_on_gpu.texture_id)
-    ALL_TEXTURES = all_textures_updated
-    if len(textures_to_delete) > 0:
-        gl.glDeleteTextures(textures_to_delete)
-        # print("Delete {0} old texture(s), len={1}".format(len(textures_to_delete), len(ALL_TEXTURES)))
+    """
+    Called once per frame (by imgui_runner): gives the textures of the entries whose image was garbage collected
+    back to TEXTURE_POOL, then, if the VRAM budget (TEXTURE_CACHE_MAX_BYTES) is exceeded, the textures
+    of the least recently used entries, and trims the pool.
+    Also publishes the metrics of this frame into LAST_FRAME_METRICS (@see stats())
+    """
+    global LAST_FRAME_METRICS, _FRAME_METRICS, _FRAME_INDEX
+    _remove_dead_entries()
+    # (ALL_TEXTURES is ordered from the least recently used entry)
+    nb_bytes = sum(gpu_texture.texture_nb_bytes for gpu_texture in _cache_gpu_textures())
+    while nb_bytes > TEXTURE_CACHE_MAX_BYTES and len(ALL_TEXTURES) > 0:
+        if next(iter(ALL_TEXTURES.values())).frame_last_access == _FRAME_INDEX:
+            break # all the remaining textures are in use
+        nb_bytes -= _evict_least_recently_used_entry()
+    TEXTURE_POOL._evict(min(TEXTURE_POOL_MAX_BYTES, max(TEXTURE_CACHE_MAX_BYTES - nb_bytes, 0)))
+
+    _TOTAL_METRICS.add(_FRAME_METRICS)
+    LAST_FRAME_METRICS = _FRAME_METRICS
+    _FRAME_METRICS = CvMetrics()
+    _FRAME_INDEX += 1
+
+
+def _release_all_textures():
+    """
+    Releases all the textures (ALL_TEXTURES, SHARED_TEXTURES and TEXTURE_POOL),
+    for example before GL_BACKEND is replaced
+    """
+    for image_stored_on_gpu in ALL_TEXTURES.values():
+        image_stored_on_gpu.stop_watching_owner()
+        image_stored_on_gpu.release_gpu_texture()
+    ALL_TEXTURES.clear()
+    _DEAD_CACHE_ENTRIES.clear()
+    SHARED_TEXTURES.clear()
+    TEXTURE_POOL.clear()
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Returns a snapshot of the imgui_cv metrics:
+      - "total": counters since the start (or since reset_stats()), including the current frame
+      - "last_frame": counters of the last complete frame
+      - "gauges": current state of the texture cache, of TEXTURE_POOL and of the figure cache
+    @see CvMetrics for the counters
+    """
+    from . import imgui_fig
+    total = CvMetrics()
+    total.add(_TOTAL_METRICS)
+    total.add(_FRAME_METRICS)
+    cache_gpu_textures = _cache_gpu_textures()
+    cache_nb_bytes = sum(gpu_texture.texture_nb_bytes for gpu_texture in cache_gpu_textures)
+    return {
+        "frame_index": _FRAME_INDEX,
+        "total": asdict(total),
+        "last_frame": asdict(LAST_FRAME_METRICS),
+        "gauges": {
+            "nb_cache_entries": len(ALL_TEXTURES),
+            "nb_live_textures": len(cache_gpu_textures) + len(TEXTURE_POOL.lru),
+            "live_texture_bytes": cache_nb_bytes + TEXTURE_POOL.nb_bytes,
+            "cache_bytes": cache_nb_bytes,
+            "pool_nb_textures": len(TEXTURE_POOL.lru),
+            "pool_bytes": TEXTURE_POOL.nb_bytes,
+            "figure_cache_size": len(imgui_fig._FIGURE_CACHE),
+        },
+    }
+
+
+def reset_stats():
+    """
+    Resets the counters of stats() (the gauges are not affected)
+    """
+    global _FRAME_METRICS, LAST_FRAME_METRICS, _TOTAL_METRICS
+    _FRAME_METRICS = CvMetrics()
+    LAST_FRAME_METRICS = CvMetrics()
+    _TOTAL_METRICS = CvMetrics()
 
 
 def _image_viewport_size(image, width=None, height=None):
@@ -277,16 +1195,19 @@ def _image_viewport_size(image, width=None, height=None):
 @static_vars(
     zoomed_status={},
     zoom_click_times={},
-    last_shown_image=None)
+    last_shown_image=None,
+    last_shown_size=SizePixel())
 def _image_impl(
     image_and_ajustments,
     width=None, height=None, title="",
     always_refresh = False,
-    linked_user_image_address: ImageAddress = 0
+    linked_user_image_address: ImageAddress = 0,
+    image_owner = None
     ):
 
     statics = _image_impl.statics
     statics.last_shown_image = image_and_ajustments
+    statics.last_shown_size = SizePixel.from_image(image_and_ajustments.image)
     zoom_key = imgui_ext.make_unique_label(title)
     if zoom_key not in statics.zoomed_status:
         statics.zoom_click_times[zoom_key] = 0
@@ -300,17 +1221,35 @@ def _image_impl(
         statics.zoomed_status[zoom_key] = False
         statics.zoom_click_times[zoom_key] = timer()
 
-    texture_id = _image_to_texture(
-        image_and_ajustments,
-        always_refresh = always_refresh,
-        linked_user_image_address=linked_user_image_address
-        )
+    image_size = SizePixel.from_image(image_and_ajustments.image)
+    is_thumbnail = viewport_size.width <= image_size.width and viewport_size.height <= image_size.height \
+        and viewport_size.as_tuple_width_height() != image_size.as_tuple_width_height()
+    if DOWNSCALE_THUMBNAILS and is_thumbnail and viewport_size.width > 0 and viewport_size.height > 0:
+        target_size = viewport_size
+    else:
+        target_size = None
+
+    def show_image():
+        if _needs_texture_tiles(target_size if target_size is not None else image_size):
+            _draw_tiled_image(image_and_ajustments, viewport_size,
+                              always_refresh=always_refresh, linked_user_image_address=linked_user_image_address,
+                              image_owner=image_owner)
+        else:
+            texture_id = _image_to_texture(
+                image_and_ajustments,
+                always_refresh = always_refresh,
+                linked_user_image_address=linked_user_image_address,
+                target_size=target_size,
+                image_owner=image_owner
+                )
+            imgui.image_button(texture_id, viewport_size.width, viewport_size.height, frame_padding=0)
+
     if title == "":
-        imgui.image_button(texture_id, viewport_size.width, viewport_size.height, frame_padding=0)
+        show_image()
         is_mouse_hovering = imgui.is_item_hovered()
     else:
         imgui.begin_group()
-        imgui.image_button(texture_id, viewport_size.width, viewport_size.height, frame_padding=0)
+        show_image()
         is_mouse_hovering = imgui.is_item_hovered()
         imgui.text(title)
         imgui.end_group()
@@ -332,12 +1271,19 @@ def image(
     title="",
     image_adjustments=None,
     always_refresh = False,
-    linked_user_image_address: ImageAddress = 0
+    linked_user_image_address: ImageAddress = 0,
+    hash_strategy: Optional[HashStrategy] = None,
+    version: Optional[Hashable] = None
     ):
-
+    """
+    :param hash_strategy: how to detect whether the image changed (@see HashStrategy).
+                          If None, this depends on imgui_cv.USE_FAST_HASH
+    :param version: optional version of the image content (for example a frame counter).
+                    If provided, the image is not hashed: it is transferred to the GPU only when the version changes
+    """
     if image_adjustments is None:
         image_adjustments = ImageAdjustments()
-    image_and_ajustments = ImageAndAdjustments(img, image_adjustments)
+    image_and_ajustments = ImageAndAdjustments(img, image_adjustments, hash_strategy, version)
     return _image_impl(
         image_and_ajustments,
         width=width, height=height,
@@ -347,6 +1293,37 @@ def image(
         )
 
 
+def _image_uv(
+    image_and_ajustments: ImageAndAdjustments,
+    viewport_size: SizePixel,
+    uv0, uv1,
+    always_refresh = False,
+    linked_user_image_address: ImageAddress = 0
+    ):
+    """
+    Displays the [uv0, uv1] part of an image inside viewport_size:
+    the image is transferred once to the GPU, and the zoom is performed by the GPU
+    (for images bigger than MAX_TEXTURE_SIZE, only the visible tiles are transferred).
+    Used by image_explorer (@see ImageWithZoomInfo.zoom_uv())
+    """
+    statics = _image_impl.statics
+    statics.last_shown_image = image_and_ajustments
+    statics.last_shown_size = viewport_size
+    if _needs_texture_tiles(SizePixel.from_image(image_and_ajustments.image)):
+        _draw_tiled_image(image_and_ajustments, viewport_size, uv0, uv1,
+                          always_refresh=always_refresh, linked_user_image_address=linked_user_image_address,
+                          zoom_sampling=True)
+        return mouse_position_last_image()
+    texture_id = _image_to_texture(
+        image_and_ajustments,
+        always_refresh = always_refresh,
+        linked_user_image_address=linked_user_image_address,
+        zoom_sampling=True
+        )
+    imgui.image_button(texture_id, viewport_size.width, viewport_size.height, uv0=uv0, uv1=uv1, frame_padding=0)
+    return mouse_position_last_image()
+
+
 def _is_in_image(pixel, image_shape):
     # type : (imgui.Vec2, shape) -> Bool
     w = image_shape[1]
@@ -357,8 +1334,8 @@ def _is_in_image(pixel, image_shape):
 
 
 def _is_in_last_image(pixel):
-    last_image_shape = _image_impl.statics.last_shown_image.image.shape
-    return _is_in_image(pixel, last_image_shape)
+    last_shown_size = _image_impl.statics.last_shown_size
+    return _is_in_image(pixel, (last_shown_size.height, last_shown_size.width))
 
 
 def mouse_position_last_image():
@@ -384,12 +1361,16 @@ def is_mouse_hovering_last_image():  # only works if the image was presented in
 
 def image_explorer(image, width=None, height=None, title="", zoom_key="", hide_buttons=False,
                    image_adjustments=None,
-                   always_refresh = False
+                   always_refresh = False,
+                   hash_strategy: Optional[HashStrategy] = None,
+                   version: Optional[Hashable] = None
                    ):
     """
+    :param hash_strategy: how to detect whether the image changed (@see HashStrategy)
+    :param version: optional version of the image content (@see imgui_cv.image())
     :param image_adjustments:
     :param hide_buttons:
-    :param image: opencv / np image.
+    :param image: opencv / np image, or a TileProvider (for images that do not fit in memory, @see MemmapTileProvider)
     :param width:
     :param height:
     :param title: an optional title
@@ -398,6 +1379,12 @@ def image_explorer(image, width=None, height=None, title="", zoom_key="", hide_b
     """
     if image_adjustments is None:
         image_adjustments = ImageAdjustments()
+    if isinstance(image, TileProvider) and width is None and height is None:
+        # a tiled image is usually huge: do not use its size as the viewport size
+        if image.shape[1] >= image.shape[0]:
+            width = min(image.shape[1], TILED_IMAGE_VIEWPORT_MAX_SIZE)
+        else:
+            height = min(image.shape[0], TILED_IMAGE_VIEWPORT_MAX_SIZE)
     from ._imgui_cv_zoom import image_explorer_autostore_zoominfo
     viewport_size = _image_viewport_size(image, width, height)
     imgui.begin_group()
@@ -408,7 +1395,9 @@ def image_explorer(image, width=None, height=None, title="", zoom_key="", hide_b
         zoom_key,
         image_adjustments,
         hide_buttons=hide_buttons,
-        always_refresh = always_refresh
+        always_refresh = always_refresh,
+        hash_strategy = hash_strategy,
+        version = version
         )
     imgui.end_group()
     return mouse_location_original_image
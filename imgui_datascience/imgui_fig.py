@@ -1,30 +1,308 @@
+import itertools
+import logging
+import multiprocessing
+import pickle
+import sys
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import *
 import numpy
 import cv2
-import matplotlib
+import imgui
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from . import imgui_cv
+from . import imgui_profiler
+from . import _invalidation
 from .static_vars import static_vars
 
+_LOGGER = logging.getLogger(__name__)
 
-@static_vars(fig_cache=dict())
-def _fig_to_image(figure):
-    statics = _fig_to_image.statics
+# Maximum number of figures whose image is cached (the least recently displayed figures are evicted).
+# The entry of a figure is also removed as soon as the figure is garbage collected.
+FIGURE_CACHE_MAX_SIZE = 64
+
+# If True, fig() renders the figures in the background, so that the gui never waits for matplotlib:
+# the previous image of a figure is displayed (with a "rendering..." badge) until the new one is ready.
+# The figures are drawn by a thread (they shall then not be modified while they are being drawn).
+# A failed rendering is logged once, and is not retried until the figure changes.
+FIGURE_RENDER_IN_BACKGROUND = False
+# If True, the background renderings (of fig() and fig_factory()) are performed by a process pool:
+# the figures that can be pickled are pickled in the gui thread (which is much faster than drawing them),
+# and drawn in parallel, without holding the GIL of the gui. The workers are started with "spawn",
+# which imports the main script again in each worker: its entry point shall then be protected
+# by `if __name__ == "__main__":` (otherwise each worker runs the gui again)
+FIGURE_RENDER_WITH_PROCESSES = False
+FIGURE_RENDER_NB_PROCESSES = 2
+# Size of the placeholder displayed by fig_factory() before the first image of a figure is ready
+FIGURE_PLACEHOLDER_SIZE = (320, 240)
+
+
+@dataclass
+class _CachedFigure:
+    """
+    The image of a figure, which is rendered again when the figure changes, i.e when it is stale
+    (an artist was modified) or when its canvas was drawn by someone else (e.g. an interactive backend)
+    """
+    figure_ref: weakref.ref
+    canvas_ref: weakref.ref
+    draw_event_id: int
+    nb_draws: int = 0 # number of draws of the canvas (by _fig_to_image or by matplotlib)
+    nb_draws_at_grab: int = -1
+    image: Optional[numpy.ndarray] = None
+    version: int = 0
+    future: Optional[Future] = None # the background rendering in progress
+    picklable: bool = True
+    error: Optional[Exception] = None # the error of the last background rendering
+
+
+# id(figure) -> _CachedFigure, in LRU order
+_FIGURE_CACHE: "OrderedDict[int, _CachedFigure]" = OrderedDict()
+_IMAGE_VERSIONS = itertools.count(1)
+
+
+def _forget_figure(fig_id: int):
+    entry = _FIGURE_CACHE.pop(fig_id, None)
+    if entry is None:
+        return
+    canvas = entry.canvas_ref()
+    if canvas is not None:
+        canvas.mpl_disconnect(entry.draw_event_id)
+
+
+def _figure_cache_entry(figure) -> _CachedFigure:
     fig_id = id(figure)
-    if fig_id not in statics.fig_cache:
-        # draw the renderer
-        figure.canvas.draw()
-        # Get the RGBA buffer from the figure
-        w, h = figure.canvas.get_width_height()
-        buf = numpy.fromstring(figure.canvas.tostring_rgb(), dtype=numpy.uint8)
-        buf.shape = (h, w, 3)
-        img_rgb = cv2.cvtColor(buf, cv2.COLOR_RGB2BGR)
-        matplotlib.pyplot.close(figure)
-        statics.fig_cache[fig_id] = img_rgb
-    return statics.fig_cache[fig_id]
+    entry = _FIGURE_CACHE.get(fig_id)
+    if entry is not None and (entry.figure_ref() is not figure or entry.canvas_ref() is not figure.canvas):
+        # (the id was reused by another figure, or the canvas of the figure was replaced)
+        _forget_figure(fig_id)
+        entry = None
+
+    if entry is None:
+        if not hasattr(figure.canvas, "buffer_rgba"):
+            # e.g. a matplotlib.figure.Figure() created without pyplot: render it with Agg
+            FigureCanvasAgg(figure)
+        entry = _CachedFigure(
+            figure_ref=weakref.ref(figure, lambda _: _forget_figure(fig_id)),
+            canvas_ref=weakref.ref(figure.canvas),
+            draw_event_id=0)
+
+        def on_draw(_event):
+            entry.nb_draws += 1
+        entry.draw_event_id = figure.canvas.mpl_connect("draw_event", on_draw)
+        _FIGURE_CACHE[fig_id] = entry
+
+    _FIGURE_CACHE.move_to_end(fig_id)
+    while len(_FIGURE_CACHE) > FIGURE_CACHE_MAX_SIZE:
+        _forget_figure(next(iter(_FIGURE_CACHE)))
+    return entry
+
+
+def _grab_image(figure) -> numpy.ndarray:
+    # (buffer_rgba() is a view on the Agg buffer: the only copy is the conversion to BGR)
+    rgba = numpy.asarray(figure.canvas.buffer_rgba())
+    return cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)
+
+
+def _draw_figure(figure) -> numpy.ndarray:
+    figure.canvas.draw()
+    return _grab_image(figure)
+
+
+def _fig_to_image_and_version(figure) -> Tuple[numpy.ndarray, int]:
+    """
+    Returns the BGR image of a figure, and a version number that changes whenever the image is rendered again
+    """
+    entry = _figure_cache_entry(figure)
+    if entry.image is None or figure.stale or entry.nb_draws != entry.nb_draws_at_grab:
+        with imgui_profiler.scope("fig_to_image"):
+            if entry.image is None or figure.stale:
+                figure.canvas.draw()
+            entry.image = _grab_image(figure)
+        entry.nb_draws_at_grab = entry.nb_draws
+        entry.version = next(_IMAGE_VERSIONS)
+    return entry.image, entry.version
+
+
+def _fig_to_image(figure) -> numpy.ndarray:
+    image, _ = _fig_to_image_and_version(figure)
+    return image
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _render_figure_in_worker(pickled_figure: Optional[bytes] = None, factory: Optional[Callable] = None) \
+        -> numpy.ndarray:
+    """
+    Renders a pickled figure, or the figure returned by factory (in a worker process, or in a thread)
+    """
+    figure = pickle.loads(pickled_figure) if pickled_figure is not None else factory()
+    FigureCanvasAgg(figure)
+    image = _draw_figure(figure)
+    if "matplotlib.pyplot" in sys.modules:
+        sys.modules["matplotlib.pyplot"].close(figure)
+    return image
 
 
-def fig(figure, width=None, height=None, title=""):
+@static_vars(thread_pool=None, process_pool=None)
+def _executor(use_processes: bool):
+    statics = _executor.statics
+    if use_processes:
+        if statics.process_pool is None:
+            # (spawn: a forked worker would inherit the window and GL state of the gui process)
+            statics.process_pool = ProcessPoolExecutor(
+                FIGURE_RENDER_NB_PROCESSES, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker)
+        return statics.process_pool
+    if statics.thread_pool is None:
+        statics.thread_pool = ThreadPoolExecutor(1)
+    return statics.thread_pool
+
+
+def _submit_rendering(use_processes: bool, function, *args, **kwargs) -> Future:
+    future = _executor(use_processes).submit(function, *args, **kwargs)
+    future.add_done_callback(lambda _: _invalidation.invalidate())
+    return future
+
+
+def _harvest_rendering(entry) -> bool:
+    """
+    Stores the image of a finished background rendering; returns False if it failed
+    (the error is then stored in entry.error, and logged)
+    """
+    future, entry.future = entry.future, None
+    try:
+        image = future.result()
+    except Exception as e:
+        _LOGGER.warning("imgui_fig: background rendering failed: %s", e)
+        entry.error = e
+        return False
+    entry.image = image
+    entry.error = None
+    entry.version = next(_IMAGE_VERSIONS)
+    return True
+
+
+def _fig_to_image_in_background(figure) -> Tuple[Optional[numpy.ndarray], int, bool]:
+    """
+    Returns the last image of a figure (None if it was never rendered), its version, and whether a newer image
+    is being rendered. At most one rendering per figure is in progress: the changes made in the meantime
+    are coalesced into the next one.
+    """
+    entry = _figure_cache_entry(figure)
+    if entry.future is not None and entry.future.done():
+        if not _harvest_rendering(entry):
+            if entry.picklable and FIGURE_RENDER_WITH_PROCESSES:
+                # (e.g. the process pool is broken): render it again, with a thread
+                entry.picklable = False
+                figure.stale = True
+            else:
+                # it will be rendered again when it is modified
+                figure.stale = False
+        entry.nb_draws_at_grab = entry.nb_draws
+
+    never_rendered = entry.image is None and entry.error is None
+    if entry.future is None and (never_rendered or figure.stale or entry.nb_draws != entry.nb_draws_at_grab):
+        if entry.image is not None and not figure.stale:
+            # the canvas was drawn by matplotlib: its buffer is up to date
+            with imgui_profiler.scope("fig_to_image"):
+                entry.image = _grab_image(figure)
+            entry.version = next(_IMAGE_VERSIONS)
+            entry.nb_draws_at_grab = entry.nb_draws
+        else:
+            pickled_figure = None
+            if entry.picklable and FIGURE_RENDER_WITH_PROCESSES:
+                with imgui_profiler.scope("fig_pickle"):
+                    try:
+                        pickled_figure = pickle.dumps(figure)
+                    except Exception:
+                        entry.picklable = False
+            if pickled_figure is not None:
+                entry.future = _submit_rendering(True, _render_figure_in_worker, pickled_figure)
+                # (the changes made from now on will be rendered next time)
+                figure.stale = False
+            else:
+                entry.future = _submit_rendering(False, _draw_figure, figure)
+    return entry.image, entry.version, entry.future is not None
+
+
+@dataclass
+class _CachedFactoryFigure:
+    factory_version: Hashable
+    image: Optional[numpy.ndarray] = None
+    version: int = 0
+    future: Optional[Future] = None
+    pending_factory_version: Hashable = None
+    # the factory_version whose rendering failed: it is not rendered again
+    failed_factory_version: Hashable = field(default_factory=object)
+    error: Optional[Exception] = None
+
+
+# key -> _CachedFactoryFigure, in LRU order
+_FACTORY_FIGURE_CACHE: "OrderedDict[Hashable, _CachedFactoryFigure]" = OrderedDict()
+
+
+def _factory_to_image_in_background(factory: Callable, factory_version: Hashable, key: Hashable) \
+        -> Tuple[Optional[numpy.ndarray], int, bool]:
+    entry = _FACTORY_FIGURE_CACHE.get(key)
+    if entry is None:
+        entry = _CachedFactoryFigure(factory_version=object()) # (never rendered)
+        _FACTORY_FIGURE_CACHE[key] = entry
+    _FACTORY_FIGURE_CACHE.move_to_end(key)
+    while len(_FACTORY_FIGURE_CACHE) > FIGURE_CACHE_MAX_SIZE:
+        _FACTORY_FIGURE_CACHE.popitem(last=False)
+
+    if entry.future is not None and entry.future.done():
+        if _harvest_rendering(entry):
+            entry.factory_version = entry.pending_factory_version
+        else:
+            entry.failed_factory_version = entry.pending_factory_version
+    if entry.future is None and factory_version not in (entry.factory_version, entry.failed_factory_version):
+        entry.future = _submit_rendering(FIGURE_RENDER_WITH_PROCESSES, _render_figure_in_worker, factory=factory)
+        entry.pending_factory_version = factory_version
+    return entry.image, entry.version, entry.future is not None
+
+
+def _draw_rendering_badge(failed: bool = False):
+    rect_min = imgui.get_item_rect_min()
+    draw_list = imgui.get_window_draw_list()
+    text = "rendering failed" if failed else "rendering..."
+    text_color = imgui.get_color_u32_rgba(1., 0.3, 0.3, 1.) if failed else imgui.get_color_u32_rgba(1., 1., 0., 1.)
+    text_size = imgui.calc_text_size(text)
+    draw_list.add_rect_filled(rect_min.x, rect_min.y, rect_min.x + text_size.x + 8, rect_min.y + text_size.y + 4,
+                              imgui.get_color_u32_rgba(0., 0., 0., 0.6))
+    draw_list.add_text(rect_min.x + 4, rect_min.y + 2, text_color, text)
+
+
+def _show_figure_image(image, version, rendering, failed, image_size, width, height, title):
+    if image is None:
+        # not rendered yet: a placeholder of the size of the figure
+        placeholder_shape = numpy.empty((image_size[1], image_size[0], 0), numpy.uint8)
+        viewport_size = imgui_cv._image_viewport_size(placeholder_shape, width, height)
+        imgui.begin_group()
+        imgui.dummy(viewport_size.width, viewport_size.height)
+        if title != "":
+            imgui.text(title)
+        imgui.end_group()
+        _draw_rendering_badge(failed and not rendering)
+        return None
+    mouse_position = imgui_cv.image(image, width=width, height=height, title=title, version=version)
+    if rendering or failed:
+        _draw_rendering_badge(failed and not rendering)
+    return mouse_position
+
+
+def fig(figure, width=None, height=None, title="", background: Optional[bool] = None):
     """
-    imgui_fig.fig will display a matplotlib figure
+    imgui_fig.fig will display a matplotlib figure.
+    The figure is rendered again whenever it changes, so that it can be updated between frames
+    (the figure is not closed: call matplotlib.pyplot.close() when it is not needed anymore)
+
+    :param background: if True, the figure is rendered in the background (@see FIGURE_RENDER_IN_BACKGROUND);
+                       if False, it is rendered at once; if None, FIGURE_RENDER_IN_BACKGROUND is used
 
     Note: this might fail on OSX, with the following message ::
 
@@ -36,5 +314,35 @@ def fig(figure, width=None, height=None, title=""):
         matplotlib.use('TkAgg')  # this has to be done *before* importing pyplot
         import matplotlib.pyplot
     """
-    image = _fig_to_image(figure)
-    return imgui_cv.image(image, width=width, height=height, title=title)
+    if background is None:
+        background = FIGURE_RENDER_IN_BACKGROUND
+    if not background:
+        image, version = _fig_to_image_and_version(figure)
+        return imgui_cv.image(image, width=width, height=height, title=title, version=version)
+    image, version, rendering = _fig_to_image_in_background(figure)
+    failed = _FIGURE_CACHE[id(figure)].error is not None
+    return _show_figure_image(image, version, rendering, failed, figure.canvas.get_width_height(),
+                              width, height, title)
+
+
+def fig_factory(factory: Callable, factory_version: Hashable = 0, width=None, height=None, title="",
+                key: Optional[Hashable] = None):
+    """
+    Displays the figure returned by factory(), which is called and rendered in the background
+    (by a thread, or by a process pool if FIGURE_RENDER_WITH_PROCESSES is True): the gui never waits for matplotlib.
+    factory shall create a matplotlib.figure.Figure (not a pyplot figure, which may not be created by a thread),
+    and, with processes, it shall be picklable (e.g. a module level function, or a functools.partial of it).
+    It is called again whenever factory_version changes, while the previous image is displayed. If factory fails, the error is logged once, and factory
+    is not called again until factory_version changes.
+
+    :param key: identifies the figure between the frames (by default: the title). It is required
+                when title is empty: the factory itself would not be a stable key, since
+                a functools.partial built at each frame is a new object.
+    """
+    if key is None:
+        if title == "":
+            raise ValueError("fig_factory: a key is required when the title is empty")
+        key = title
+    image, version, rendering = _factory_to_image_in_background(factory, factory_version, key)
+    failed = _FACTORY_FIGURE_CACHE[key].error is not None
+    return _show_figure_image(image, version, rendering, failed, FIGURE_PLACEHOLDER_SIZE, width, height, title)
@@ -3,6 +3,7 @@ import imgui
 from . import imgui_cv
 from . import imgui_ext
 from . import imgui_fig
+from . import _invalidation
 
 
 def image_size_fit_in_gui(image_size, gui_size, can_make_bigger=False):
@@ -58,6 +59,8 @@ class _ImguiImageLister:
         else:
             as_image = image
         self.images_info[name] = _ImguiImageInfo(as_image, additional_legend, image_adjustments)
+        # (images may be pushed from another thread while the runner is idle)
+        _invalidation.invalidate()
 
     def clear_all_images(self):
         self.images_info = OrderedDict()
@@ -0,0 +1,470 @@
+"""
+Line plots of very long series (tens of millions of samples) and of streaming series,
+drawn with the imgui draw list.
+
+DecimatedSeries keeps the min and max of blocks of samples (blocks of BASE_BLOCK_SIZE * 2^k samples, for each
+level k): each frame, plot_lines() sends at most two points per horizontal pixel to the draw list
+(the min and the max of the samples of each pixel column). Zooming and panning thus cost O(pixels)
+instead of O(samples), and no spike is ever dropped.
+
+StreamingSeries does the same for live data (e.g. training metrics or telemetry): the samples and the block
+mins / maxs are kept in preallocated ring buffers, which append() updates incrementally.
+"""
+import math
+import threading
+from collections import OrderedDict
+from typing import *
+import numpy as np
+import imgui
+from . import imgui_ext
+from . import imgui_profiler
+from . import _invalidation
+from .static_vars import static_vars
+
+# Zoom factor for one step of the mouse wheel
+PLOT_WHEEL_ZOOM_RATIO = 1.25
+
+
+class Envelope(NamedTuple):
+    """
+    The samples of a range split into columns: column i starts at the sample starts[i],
+    and its samples are between mins[i] and maxs[i]
+    """
+    starts: np.ndarray
+    mins: np.ndarray
+    maxs: np.ndarray
+
+
+def _pairwise_reduce(values: np.ndarray, function) -> np.ndarray:
+    """
+    Reduces the pairs of consecutive values (the last value is kept as is if their number is odd)
+    """
+    nb_pairs = len(values) // 2
+    reduced = function(values[0:2 * nb_pairs:2], values[1:2 * nb_pairs:2])
+    if len(values) % 2 == 1:
+        reduced = np.concatenate([reduced, values[-1:]])
+    return reduced
+
+
+def _column_envelope(block_mins: np.ndarray, block_maxs: np.ndarray, block_size: int, start: int, end: int,
+                     nb_columns: int) -> Envelope:
+    """
+    Splits the samples [start, end) into nb_columns columns whose boundaries are aligned on the blocks.
+    block_mins[i] and block_maxs[i] are the min and max of the block (first_block + i), i.e. of the samples
+    [(first_block + i) * block_size, (first_block + i + 1) * block_size), with first_block = start // block_size
+    """
+    samples_per_column = (end - start) / nb_columns
+    first_block = start // block_size
+    last_block = (end + block_size - 1) // block_size
+    boundaries = np.floor((start + np.arange(nb_columns) * samples_per_column) / block_size).astype(np.int64)
+    # (the blocks are smaller than a column: the boundaries are increasing)
+    boundaries = np.unique(np.clip(boundaries, first_block, last_block - 1))
+    offsets = boundaries - first_block
+    return Envelope(
+        starts=np.maximum(boundaries * block_size, start),
+        # (fmin / fmax ignore the NaN values)
+        mins=np.fmin.reduceat(block_mins, offsets),
+        maxs=np.fmax.reduceat(block_maxs, offsets))
+
+
+class DecimatedSeries:
+    """
+    A 1D series of samples, with a min/max pyramid that gives the envelope of any range in O(nb_columns)
+    """
+    BASE_BLOCK_SIZE = 16
+
+    def __init__(self, values):
+        self.values = np.asarray(values)
+        if self.values.ndim != 1:
+            raise ValueError("DecimatedSeries: values shall be a 1D array")
+        # level_mins[k][i]: min of the samples of the block i of size block_size(k)
+        self.level_mins: List[np.ndarray] = []
+        self.level_maxs: List[np.ndarray] = []
+        if len(self.values) > self.BASE_BLOCK_SIZE:
+            block_starts = np.arange(0, len(self.values), self.BASE_BLOCK_SIZE)
+            mins = np.fmin.reduceat(self.values, block_starts)
+            maxs = np.fmax.reduceat(self.values, block_starts)
+            while True:
+                self.level_mins.append(mins)
+                self.level_maxs.append(maxs)
+                if len(mins) <= 1:
+                    break
+                mins = _pairwise_reduce(mins, np.fmin)
+                maxs = _pairwise_reduce(maxs, np.fmax)
+
+    def __len__(self):
+        return len(self.values)
+
+    def block_size(self, level: int) -> int:
+        return self.BASE_BLOCK_SIZE * (2 ** level)
+
+    def envelope(self, start: int, end: int, nb_columns: int) -> Envelope:
+        """
+        Returns the envelope of the samples [start, end) split into at most nb_columns columns.
+        When there are fewer samples than columns, each sample is a column.
+        """
+        start = max(int(start), 0)
+        end = min(int(end), len(self.values))
+        if end <= start or nb_columns <= 0:
+            empty = np.zeros((0,), self.values.dtype)
+            return Envelope(np.zeros((0,), np.int64), empty, empty)
+        samples_per_column = (end - start) / nb_columns
+        if samples_per_column <= 1.:
+            samples = self.values[start:end]
+            return Envelope(np.arange(start, end), samples, samples)
+        # the coarsest level whose blocks are at most half a column (otherwise, the samples)
+        mins, maxs, block_size = self.values, self.values, 1
+        for level in range(len(self.level_mins)):
+            if self.block_size(level) > samples_per_column / 2.:
+                break
+            mins, maxs, block_size = self.level_mins[level], self.level_maxs[level], self.block_size(level)
+        first_block = start // block_size
+        last_block = (end + block_size - 1) // block_size
+        return _column_envelope(mins[first_block:last_block], maxs[first_block:last_block], block_size, start, end,
+                                nb_columns)
+
+
+class _PlotState:
+    def __init__(self, series):
+        self.series = series
+        self.x_start = 0.
+        self.x_end = float(max(len(series), 1))
+        self.last_drag_delta = 0.
+
+    def set_full_view(self):
+        self.x_start = 0.
+        self.x_end = float(max(len(self.series), 1))
+
+    def zoom(self, ratio: float, center: float):
+        min_width = 2.
+        width = max((self.x_end - self.x_start) / ratio, min_width)
+        k = (center - self.x_start) / (self.x_end - self.x_start)
+        self.x_start = center - k * width
+        self.x_end = self.x_start + width
+
+
+def _envelope_points(envelope: Envelope, x_start: float, samples_per_pixel: float, y_min: float, y_max: float,
+                     origin: imgui.Vec2, height: int) -> List[Tuple[float, float]]:
+    """
+    The polyline of the envelope, in screen coordinates (two points per column, or one per sample)
+    """
+    px = origin.x + (envelope.starts - x_start) / samples_per_pixel
+    y_scale = (height - 1) / (y_max - y_min)
+    py_min = origin.y + (y_max - envelope.mins) * y_scale
+    py_max = origin.y + (y_max - envelope.maxs) * y_scale
+    if envelope.mins is envelope.maxs:
+        points = np.stack([px, py_min], axis=1)
+    else:
+        points = np.stack([np.repeat(px, 2), np.stack([py_min, py_max], axis=1).ravel()], axis=1)
+    points = points[np.isfinite(points).all(axis=1)]
+    return [tuple(point) for point in points.tolist()]
+
+
+_TEXT_COLOR = (0., 0., 0., 1.)
+_FRAME_COLOR = (0.5, 0.5, 0.5, 1.)
+
+
+def _y_range(envelopes: List[Envelope]) -> Tuple[float, float]:
+    """
+    The range of the envelopes, with a 5% margin
+    """
+    y_min, y_max = math.inf, -math.inf
+    for envelope in envelopes:
+        if len(envelope.mins) > 0 and np.isfinite(envelope.mins).any():
+            y_min = min(y_min, float(np.nanmin(envelope.mins)))
+            y_max = max(y_max, float(np.nanmax(envelope.maxs)))
+    if y_min > y_max:
+        y_min, y_max = 0., 1.
+    if y_max - y_min <= 0.:
+        y_min, y_max = y_min - 0.5, y_max + 0.5
+    margin = (y_max - y_min) * 0.05
+    return y_min - margin, y_max + margin
+
+
+def _begin_plot_area(origin: imgui.Vec2, width: int, height: int):
+    draw_list = imgui.get_window_draw_list()
+    draw_list.push_clip_rect(origin.x, origin.y, origin.x + width, origin.y + height, True)
+    draw_list.add_rect_filled(origin.x, origin.y, origin.x + width, origin.y + height,
+                              imgui.get_color_u32_rgba(1., 1., 1., 1.))
+    return draw_list
+
+
+def _end_plot_area(draw_list, origin: imgui.Vec2, width: int, height: int):
+    draw_list.add_rect(origin.x, origin.y, origin.x + width, origin.y + height,
+                       imgui.get_color_u32_rgba(*_FRAME_COLOR))
+    draw_list.pop_clip_rect()
+
+
+def _draw_envelope(draw_list, envelope: Envelope, color, x_start: float, samples_per_pixel: float,
+                   y_min: float, y_max: float, origin: imgui.Vec2, height: int):
+    points = _envelope_points(envelope, x_start, samples_per_pixel, y_min, y_max, origin, height)
+    if len(points) >= 2:
+        draw_list.add_polyline(points, imgui.get_color_u32_rgba(*color), thickness=1.)
+
+
+@static_vars(all_states={})
+def plot_lines(series, width: int = 600, height: int = 200, title: str = "",
+               color: Tuple[float, float, float, float] = (0.2, 0.4, 0.9, 1.)) -> Optional[int]:
+    """
+    Displays a line plot of series (a DecimatedSeries): drag with the mouse to pan,
+    use the mouse wheel to zoom, double click to see the whole series.
+    :return: the index of the sample under the mouse (or None)
+    """
+    statics = plot_lines.statics
+    label = imgui_ext.make_unique_label(title)
+    state = statics.all_states.get(label)
+    if state is None or state.series is not series:
+        state = _PlotState(series)
+        statics.all_states[label] = state
+
+    imgui.invisible_button(label, width, height)
+    origin = imgui.get_item_rect_min()
+    is_hovered = imgui.is_item_hovered()
+    io = imgui.get_io()
+    samples_per_pixel = (state.x_end - state.x_start) / width
+
+    if is_hovered:
+        mouse_sample = state.x_start + (io.mouse_pos.x - origin.x) * samples_per_pixel
+        if imgui.is_mouse_double_clicked(0):
+            state.set_full_view()
+        elif imgui.is_item_active() and imgui.is_mouse_dragging(0):
+            drag_delta = imgui.get_mouse_drag_delta(0).x
+            shift = (drag_delta - state.last_drag_delta) * samples_per_pixel
+            state.x_start -= shift
+            state.x_end -= shift
+            state.last_drag_delta = drag_delta
+        if io.mouse_wheel != 0.:
+            state.zoom(PLOT_WHEEL_ZOOM_RATIO ** io.mouse_wheel, mouse_sample)
+        samples_per_pixel = (state.x_end - state.x_start) / width
+    if not imgui.is_mouse_dragging(0):
+        state.last_drag_delta = 0.
+
+    with imgui_profiler.scope("plot_envelope"):
+        envelope = series.envelope(math.floor(state.x_start), math.ceil(state.x_end), width)
+    y_min, y_max = _y_range([envelope])
+
+    draw_list = _begin_plot_area(origin, width, height)
+    _draw_envelope(draw_list, envelope, color, state.x_start, samples_per_pixel, y_min, y_max, origin, height)
+    draw_list.add_text(origin.x + 4, origin.y + 2, imgui.get_color_u32_rgba(*_TEXT_COLOR),
+                       "{0}  [{1:.0f}, {2:.0f}]  y: [{3:.4g}, {4:.4g}]".format(
+                           title, state.x_start, state.x_end, y_min, y_max))
+
+    hovered_sample = None
+    if is_hovered:
+        sample = int(math.floor(state.x_start + (io.mouse_pos.x - origin.x) * samples_per_pixel))
+        if 0 <= sample < len(series):
+            hovered_sample = sample
+            draw_list.add_line(io.mouse_pos.x, origin.y, io.mouse_pos.x, origin.y + height,
+                               imgui.get_color_u32_rgba(*_FRAME_COLOR))
+            column = series.envelope(sample, sample + max(int(math.ceil(samples_per_pixel)), 1), 1)
+            if samples_per_pixel <= 1.:
+                imgui.set_tooltip("[{0}] {1:.6g}".format(sample, column.mins[0]))
+            else:
+                imgui.set_tooltip("[{0}] min {1:.6g} max {2:.6g}".format(sample, column.mins[0], column.maxs[0]))
+    _end_plot_area(draw_list, origin, width, height)
+    return hovered_sample
+
+
+# Colors of the series of a StreamingPlot (cycled)
+PLOT_COLORS = [
+    (0.12, 0.47, 0.71, 1.), (1., 0.5, 0.05, 1.), (0.17, 0.63, 0.17, 1.), (0.84, 0.15, 0.16, 1.),
+    (0.58, 0.4, 0.74, 1.), (0.55, 0.34, 0.29, 1.), (0.89, 0.47, 0.76, 1.), (0.5, 0.5, 0.5, 1.),
+]
+
+
+def _ring_write(ring: np.ndarray, index: int, values: np.ndarray):
+    """
+    Writes values into ring, starting at the absolute index (len(values) <= len(ring))
+    """
+    position = index % len(ring)
+    nb_first = min(len(values), len(ring) - position)
+    ring[position:position + nb_first] = values[:nb_first]
+    ring[:len(values) - nb_first] = values[nb_first:]
+
+
+def _ring_read(ring: np.ndarray, begin: int, end: int) -> np.ndarray:
+    """
+    Reads the items of ring between the absolute indices [begin, end) (a view when they are contiguous)
+    """
+    position = begin % len(ring)
+    count = end - begin
+    if position + count <= len(ring):
+        return ring[position:position + count]
+    return np.concatenate([ring[position:], ring[:position + count - len(ring)]])
+
+
+class StreamingSeries:
+    """
+    The last `capacity` samples of a series, in a preallocated ring buffer.
+    As for DecimatedSeries, the min and max of blocks of BASE_BLOCK_SIZE * 2^k samples are kept for each level k
+    (also in ring buffers); they are updated incrementally by append(), whose cost is proportional
+    to the number of appended samples (not to the capacity).
+
+    The samples are identified by their absolute index (the number of samples appended before them):
+    the retained samples are [first_index, nb_appended).
+    The oldest block of each level may still include samples that were overwritten: the envelope of the oldest
+    samples is conservative.
+    append() and envelope() may be called from different threads.
+    """
+    BASE_BLOCK_SIZE = 16
+
+    def __init__(self, capacity: int, dtype=np.float64):
+        self.capacity = capacity
+        self.values = np.zeros((capacity,), dtype)
+        self.nb_appended = 0
+        self.level_mins: List[np.ndarray] = []
+        self.level_maxs: List[np.ndarray] = []
+        level = 0
+        while self.block_size(level) <= capacity:
+            # (+2: the partial blocks at both ends of the history)
+            nb_blocks = capacity // self.block_size(level) + 2
+            self.level_mins.append(np.zeros((nb_blocks,), dtype))
+            self.level_maxs.append(np.zeros((nb_blocks,), dtype))
+            level += 1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.nb_appended, self.capacity)
+
+    @property
+    def first_index(self) -> int:
+        return self.nb_appended - len(self)
+
+    def block_size(self, level: int) -> int:
+        return self.BASE_BLOCK_SIZE * (2 ** level)
+
+    def last_value(self):
+        with self._lock:
+            return self.values[(self.nb_appended - 1) % self.capacity] if self.nb_appended > 0 else None
+
+    def append(self, values):
+        values = np.asarray(values, self.values.dtype).ravel()
+        if len(values) == 0:
+            return
+        with self._lock:
+            if len(values) > self.capacity:
+                self.nb_appended += len(values) - self.capacity
+                values = values[-self.capacity:]
+            begin = self.nb_appended
+            _ring_write(self.values, begin, values)
+            self.nb_appended += len(values)
+            self._update_levels(begin, self.nb_appended)
+
+    def _update_levels(self, begin: int, end: int):
+        """
+        Updates the blocks that contain the samples [begin, end)
+        """
+        # the changed items of the source (the samples, then the blocks of the previous level),
+        # and the range of the source items that are available
+        changed_begin, changed_end = begin, end
+        source_begin, source_end = self.first_index, self.nb_appended
+        for level in range(len(self.level_mins)):
+            factor = self.BASE_BLOCK_SIZE if level == 0 else 2
+            block_begin = changed_begin // factor
+            block_end = (changed_end - 1) // factor + 1
+            read_begin = max(block_begin * factor, source_begin)
+            read_end = min(block_end * factor, source_end)
+            if level == 0:
+                source_mins = source_maxs = _ring_read(self.values, read_begin, read_end)
+            else:
+                source_mins = _ring_read(self.level_mins[level - 1], read_begin, read_end)
+                source_maxs = _ring_read(self.level_maxs[level - 1], read_begin, read_end)
+            offsets = np.maximum(np.arange(block_begin, block_end) * factor, read_begin) - read_begin
+            _ring_write(self.level_mins[level], block_begin, np.fmin.reduceat(source_mins, offsets))
+            _ring_write(self.level_maxs[level], block_begin, np.fmax.reduceat(source_maxs, offsets))
+            changed_begin, changed_end = block_begin, block_end
+            source_begin = self.first_index // self.block_size(level)
+            source_end = (self.nb_appended - 1) // self.block_size(level) + 1
+
+    def envelope(self, start: int, end: int, nb_columns: int) -> Envelope:
+        """
+        Returns the envelope of the samples [start, end) (absolute indices) split into at most nb_columns columns
+        (@see DecimatedSeries.envelope()). The size of the arrays that are read is O(nb_columns).
+        """
+        with self._lock:
+            start = max(int(start), self.first_index)
+            end = min(int(end), self.nb_appended)
+            if end <= start or nb_columns <= 0:
+                empty = np.zeros((0,), self.values.dtype)
+                return Envelope(np.zeros((0,), np.int64), empty, empty)
+            samples_per_column = (end - start) / nb_columns
+            if samples_per_column <= 1.:
+                samples = np.array(_ring_read(self.values, start, end))
+                return Envelope(np.arange(start, end), samples, samples)
+            level = -1
+            while level + 1 < len(self.level_mins) and self.block_size(level + 1) <= samples_per_column / 2.:
+                level += 1
+            if level < 0:
+                block_size = 1
+                block_mins = block_maxs = _ring_read(self.values, start, end)
+            else:
+                block_size = self.block_size(level)
+                first_block = start // block_size
+                last_block = (end + block_size - 1) // block_size
+                block_mins = _ring_read(self.level_mins[level], first_block, last_block)
+                block_maxs = _ring_read(self.level_maxs[level], first_block, last_block)
+            return _column_envelope(block_mins, block_maxs, block_size, start, end, nb_columns)
+
+
+class StreamingPlot:
+    """
+    Several streaming series, displayed together by plot_streaming():
+        plot = StreamingPlot(capacity=100000)
+        plot.append({"loss": loss, "accuracy": accuracy})  # e.g. from a training thread
+        ...
+        imgui_plot.plot_streaming(plot)                     # in the gui loop
+
+    :param capacity: number of samples kept for each series
+    :param window: number of samples displayed (the latest ones); the mouse wheel changes it
+    """
+    def __init__(self, capacity: int = 100000, window: Optional[int] = None, dtype=np.float64):
+        self.capacity = capacity
+        self.window = window if window is not None else capacity
+        self.dtype = dtype
+        self.series: "OrderedDict[str, StreamingSeries]" = OrderedDict()
+
+    def append(self, values: Dict[str, Any]):
+        """
+        Appends a value (or an array of values) to each of the given series (the series are created when needed)
+        """
+        for name, series_values in values.items():
+            if name not in self.series:
+                self.series[name] = StreamingSeries(self.capacity, self.dtype)
+            self.series[name].append(series_values)
+        _invalidation.invalidate()
+
+
+def plot_streaming(plot: StreamingPlot, width: int = 600, height: int = 200, title: str = ""):
+    """
+    Displays the latest `plot.window` samples of each series of plot (aligned on their latest sample);
+    use the mouse wheel to change the window
+    """
+    label = imgui_ext.make_unique_label(title)
+    imgui.invisible_button(label, width, height)
+    origin = imgui.get_item_rect_min()
+    io = imgui.get_io()
+    if imgui.is_item_hovered() and io.mouse_wheel != 0.:
+        window = int(round(plot.window / (PLOT_WHEEL_ZOOM_RATIO ** io.mouse_wheel)))
+        plot.window = max(2, min(window, plot.capacity))
+
+    samples_per_pixel = plot.window / width
+    envelopes = []
+    with imgui_profiler.scope("plot_envelope"):
+        for series in list(plot.series.values()):
+            nb_appended = series.nb_appended
+            envelopes.append((nb_appended - plot.window, series.envelope(nb_appended - plot.window, nb_appended, width)))
+    y_min, y_max = _y_range([envelope for _, envelope in envelopes])
+
+    draw_list = _begin_plot_area(origin, width, height)
+    for i, (x_start, envelope) in enumerate(envelopes):
+        _draw_envelope(draw_list, envelope, PLOT_COLORS[i % len(PLOT_COLORS)], x_start, samples_per_pixel,
+                       y_min, y_max, origin, height)
+    legend_x = origin.x + 4
+    draw_list.add_text(legend_x, origin.y + 2, imgui.get_color_u32_rgba(*_TEXT_COLOR),
+                       "{0}  last {1} samples  y: [{2:.4g}, {3:.4g}]".format(title, plot.window, y_min, y_max))
+    for i, (name, series) in enumerate(list(plot.series.items())):
+        last_value = series.last_value()
+        draw_list.add_text(legend_x, origin.y + 2 + (i + 1) * imgui.get_text_line_height(),
+                           imgui.get_color_u32_rgba(*PLOT_COLORS[i % len(PLOT_COLORS)]),
+                           "{0}: {1:.6g}".format(name, last_value) if last_value is not None else name)
+    _end_plot_area(draw_list, origin, width, height)
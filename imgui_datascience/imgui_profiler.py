@@ -0,0 +1,213 @@
+"""
+An optional frame profiler:
+  - the stages of the imgui_runner loop and some library internals (hash, conversion, warp, upload...)
+    are timed via `with imgui_profiler.scope("name"):`
+  - show_overlay() displays the p50 / p95 / p99 duration of each stage (per frame)
+  - export_chrome_trace() writes the recorded events in the Chrome trace-event format
+    (open it with chrome://tracing or https://ui.perfetto.dev)
+
+The profiler is disabled by default (the scopes then cost almost nothing).
+Enable it with imgui_profiler.ENABLED = True, or with imgui_runner.Params(profile=True)
+"""
+import functools
+import json
+import os
+import threading
+from collections import deque, OrderedDict
+from timeit import default_timer
+from typing import *
+import numpy as np
+import imgui
+from . import imgui_ext
+from .static_vars import static_vars
+
+ENABLED = False
+
+# Number of frames used for the percentiles of each stage
+HISTORY_NB_FRAMES = 300
+# Number of events kept for export_chrome_trace() (the oldest ones are dropped)
+TRACE_MAX_EVENTS = 200000
+
+
+class _ProfilerEvent(NamedTuple):
+    name: str
+    start: float # seconds
+    duration: float # seconds
+    thread_id: int
+
+
+# Events of the current frame (all threads), and the events kept for the trace
+_FRAME_EVENTS: List[_ProfilerEvent] = []
+_TRACE_EVENTS: deque = deque(maxlen=TRACE_MAX_EVENTS)
+# stage name -> duration of this stage in the last frames (the sum of its scopes in each frame)
+_STAGE_HISTORY: "OrderedDict[str, deque]" = OrderedDict()
+_LAST_FRAME_DURATIONS: Dict[str, float] = {}
+_frame_start: Optional[float] = None
+_lock = threading.Lock()
+
+
+class _Scope:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = default_timer()
+        event = _ProfilerEvent(self.name, self.start, end - self.start, threading.get_ident())
+        with _lock:
+            _FRAME_EVENTS.append(event)
+        return False
+
+
+class _NullScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+def scope(name: str):
+    """
+    Times a block of code:
+        with imgui_profiler.scope("my stage"):
+            ...
+    """
+    if ENABLED:
+        return _Scope(name)
+    return _NULL_SCOPE
+
+
+def profiled(name: str):
+    """
+    Decorator that times each call of a function (@see scope())
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with _Scope(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def begin_frame():
+    global _frame_start
+    if ENABLED:
+        _frame_start = default_timer()
+
+
+def end_frame():
+    """
+    Adds the durations of the stages of this frame to their history (called once per frame by imgui_runner)
+    """
+    global _FRAME_EVENTS, _frame_start, _LAST_FRAME_DURATIONS, _TRACE_EVENTS
+    if not ENABLED or _frame_start is None:
+        return
+    frame_end = default_timer()
+    with _lock:
+        events = _FRAME_EVENTS
+        _FRAME_EVENTS = []
+    events.append(_ProfilerEvent("frame", _frame_start, frame_end - _frame_start, threading.get_ident()))
+    _frame_start = None
+
+    durations: Dict[str, float] = {}
+    for event in events:
+        durations[event.name] = durations.get(event.name, 0.) + event.duration
+    # (a stage that did not occur during this frame has a duration of 0)
+    for name in list(_STAGE_HISTORY.keys()) + [name for name in durations if name not in _STAGE_HISTORY]:
+        if name not in _STAGE_HISTORY:
+            _STAGE_HISTORY[name] = deque(maxlen=HISTORY_NB_FRAMES)
+        _STAGE_HISTORY[name].append(durations.get(name, 0.))
+    _LAST_FRAME_DURATIONS = durations
+    if _TRACE_EVENTS.maxlen != TRACE_MAX_EVENTS:
+        _TRACE_EVENTS = deque(_TRACE_EVENTS, maxlen=TRACE_MAX_EVENTS)
+    _TRACE_EVENTS.extend(events)
+
+
+def reset():
+    global _FRAME_EVENTS, _LAST_FRAME_DURATIONS
+    with _lock:
+        _FRAME_EVENTS = []
+    _TRACE_EVENTS.clear()
+    _STAGE_HISTORY.clear()
+    _LAST_FRAME_DURATIONS = {}
+
+
+def stage_stats() -> "OrderedDict[str, Dict[str, float]]":
+    """
+    Returns the last / p50 / p95 / p99 / max duration (in seconds) of each stage, over the last frames
+    """
+    result = OrderedDict()
+    for name, history in _STAGE_HISTORY.items():
+        durations = np.array(history)
+        p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+        result[name] = {
+            "last": _LAST_FRAME_DURATIONS.get(name, 0.),
+            "p50": float(p50), "p95": float(p95), "p99": float(p99),
+            "max": float(durations.max()),
+        }
+    return result
+
+
+def export_chrome_trace(filename: str):
+    """
+    Writes the recorded events (at most TRACE_MAX_EVENTS) in the Chrome trace-event json format
+    """
+    pid = os.getpid()
+    trace_events = [
+        {"name": event.name, "cat": "imgui_datascience", "ph": "X",
+         "ts": event.start * 1E6, "dur": event.duration * 1E6, "pid": pid, "tid": event.thread_id}
+        for event in list(_TRACE_EVENTS)]
+    with open(filename, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+@static_vars(trace_filename="imgui_trace.json", export_message="")
+def show_overlay():
+    """
+    Displays the duration of each stage (in ms) in a window, with a button that exports the trace
+    """
+    statics = show_overlay.statics
+    imgui.set_next_window_size(460, 320, imgui.FIRST_USE_EVER)
+    imgui.begin("Profiler")
+    if not ENABLED:
+        imgui.text("The profiler is disabled (imgui_profiler.ENABLED)")
+    else:
+        imgui.text(f"Last {HISTORY_NB_FRAMES} frames, durations in ms (nested stages are included in their parent)")
+        imgui.columns(6, imgui_ext.make_unique_label("profiler_columns"))
+        for header in ["stage", "last", "p50", "p95", "p99", "max"]:
+            imgui.text(header)
+            imgui.next_column()
+        imgui.separator()
+        for name, stats in stage_stats().items():
+            imgui.text(name)
+            imgui.next_column()
+            for key in ["last", "p50", "p95", "p99", "max"]:
+                imgui.text("{0:.2f}".format(stats[key] * 1000.))
+                imgui.next_column()
+        imgui.columns(1)
+        imgui.separator()
+        imgui.push_item_width(200)
+        _, statics.trace_filename = imgui.input_text(
+            imgui_ext.make_unique_label("trace file"), statics.trace_filename, 1000)
+        imgui.pop_item_width()
+        imgui.same_line()
+        if imgui.button(imgui_ext.make_unique_label("Export trace")):
+            export_chrome_trace(statics.trace_filename)
+            statics.export_message = f"{len(_TRACE_EVENTS)} events exported"
+        imgui.text(statics.export_message)
+    imgui.end()
@@ -1,12 +1,21 @@
+import asyncio
+import inspect
 import sys
 import imgui
 import time
 from . import imgui_ext
 from .imgui_image_lister import ImGuiImageLister
 from . import imgui_cv
+from . import _imgui_cv_zoom
+from . import _invalidation
 from .static_vars import static_vars
+from .gl_backend import GlBackend, RecordingGlBackend
+from . import imgui_profiler
 from collections import deque
 from timeit import default_timer
+from dataclasses import dataclass, field
+from typing import *
+import numpy as np
 
 import os
 
@@ -32,7 +41,8 @@ def compute_fps():
 
 class Params:
     def __init__(self, win_size=(800, 600), win_title="Imgui - Title", windowed_full_screen=False,
-                 provide_default_window=True):
+                 provide_default_window=True, profile=False, idle_rendering=False, idle_extra_frames=3,
+                 idle_max_wait=None, max_fps=None):
         self.win_size = win_size
         self.win_title = win_title
         self.windowed_full_screen = windowed_full_screen  # "Full screen", but with a window title bar + close button
@@ -41,17 +51,135 @@ class Params:
         self.window_title_height = 32
         self.windowed_full_screen_x_margin = 20
         self.provide_default_window = provide_default_window
+        self.profile = profile # if True, the stages of each frame are timed and displayed (@see imgui_profiler)
+        # If idle_rendering is True, run() only renders a frame when a pygame event is received
+        # (mouse, keyboard, window...) or when invalidate() is called (for example by a thread that produces new data).
+        # After each event, idle_extra_frames additional frames are rendered, so that imgui can settle
+        # (hover state, button releases, scrolling...).
+        # idle_max_wait (in seconds, None = wait forever) forces a frame at least every idle_max_wait seconds
+        self.idle_rendering = idle_rendering
+        self.idle_extra_frames = idle_extra_frames
+        self.idle_max_wait = idle_max_wait
+        self.max_fps = max_fps # if not None, run() renders at most max_fps frames per second
 
 
 _g_Imgui_extensions_root_window_size = (640, 480)
 
+# Set by invalidate() (from any thread): the next frame shall be rendered, even in idle mode
+_INVALIDATED = _invalidation.INVALIDATED
+_WAKEUP_EVENT = pygame.USEREVENT + 1
 
-def run(
-    gui_loop_function, 
-    params=Params(), 
-    on_init = None,
-    on_exit = None):
+# Requests a new frame when Params.idle_rendering is True (this is thread safe, @see _invalidation)
+invalidate = _invalidation.invalidate
+
+
+def _post_wakeup_event():
+    """
+    Wakes up _wait_events() after invalidate()
+    """
+    if pygame.display.get_init():
+        try:
+            pygame.event.post(pygame.event.Event(_WAKEUP_EVENT))
+        except pygame.error:
+            pass # (the event queue is full: a frame will be rendered anyhow)
+
+
+_invalidation.set_wakeup_function(_post_wakeup_event)
+
+
+def _wait_events(params, nb_remaining_frames: int) -> List:
+    """
+    Returns the pending pygame events. In idle mode, blocks until an event is received or invalidate() is called,
+    unless some frames still need to be rendered
+    """
+    if not params.idle_rendering or nb_remaining_frames > 0 or _INVALIDATED.is_set():
+        return pygame.event.get()
+    timeout_ms = int(params.idle_max_wait * 1000) if params.idle_max_wait is not None else 0
+    first_event = pygame.event.wait(timeout_ms)
+    events = [] if first_event.type == pygame.NOEVENT else [first_event]
+    return events + pygame.event.get()
+
+
+class _FramePacer:
+    """
+    Waits between the frames so that there are at most max_fps frames per second.
+    time.sleep() is used for most of the wait, and a busy wait for the last SPIN_DURATION seconds,
+    since sleep() may oversleep by a millisecond or more
+    """
+    SPIN_DURATION = 0.002
+
+    def __init__(self, max_fps: Optional[float]):
+        self.period = 1. / max_fps if max_fps else 0.
+        self.next_frame_time: Optional[float] = None
+
+    def _schedule_next_frame(self) -> float:
+        """
+        Returns the time of the next frame, and schedules the following one
+        """
+        now = default_timer()
+        if self.next_frame_time is None or now > self.next_frame_time + self.period:
+            # first frame, or late by more than a frame (e.g. after an idle wait): restart the schedule
+            self.next_frame_time = now
+        frame_time = self.next_frame_time
+        self.next_frame_time += self.period
+        return frame_time
+
+    def wait(self):
+        if self.period <= 0.:
+            return
+        frame_time = self._schedule_next_frame()
+        remaining = frame_time - default_timer()
+        if remaining > self.SPIN_DURATION:
+            time.sleep(remaining - self.SPIN_DURATION)
+        while default_timer() < frame_time:
+            pass
+
+    async def wait_async(self):
+        """
+        Same as wait(), but yields to the asyncio event loop (even if there is no frame rate cap)
+        """
+        if self.period <= 0.:
+            await asyncio.sleep(0)
+            return
+        frame_time = self._schedule_next_frame()
+        await asyncio.sleep(max(frame_time - default_timer(), 0.))
+
+
+def _begin_gui_frame(params, win_size):
+    imgui.new_frame()
+    if params.provide_default_window:
+        imgui.set_next_window_position(0, 0)
+        imgui.set_next_window_size(win_size[0], win_size[1])
+        imgui.begin("Default window")
+
+
+def _end_gui_frame(params):
+    if params.provide_default_window:
+        imgui.end()
+    with imgui_profiler.scope("image_lister"):
+        ImGuiImageLister._heartbeat()
+    if params.profile:
+        imgui_profiler.show_overlay()
 
+
+def _gui_frame(gui_loop_function, params, win_size):
+    _begin_gui_frame(params, win_size)
+    with imgui_profiler.scope("gui_loop_function"):
+        gui_loop_function()
+    _end_gui_frame(params)
+
+
+def _end_frame():
+    with imgui_profiler.scope("texture_cleanup"):
+        imgui_cv._clear_all_cv_textures()
+        imgui_ext.__clear_all_unique_labels()
+    imgui_profiler.end_frame()
+
+
+def _init_window(params):
+    """
+    Creates the imgui context and the pygame window; returns the window size and the renderer
+    """
     if params.windowed_full_screen:
         os.environ['SDL_VIDEO_WINDOW_POS'] = "%d,%d" % (
             params.windowed_full_screen_x_margin / 2, params.window_title_height)
@@ -72,47 +200,249 @@ def run(
     io.display_size = win_size
 
     pygame_renderer = PygameRenderer()
-    # if on_exit:
-    #     pygame.register_quit(on_exit)
+    if params.profile:
+        imgui_profiler.ENABLED = True
+    return win_size, pygame_renderer
 
-    if on_init:
-        on_init()
 
-    while 1:
-        for event in pygame.event.get():
+def _process_events(events, pygame_renderer) -> bool:
+    """
+    Sends the events to imgui; returns True if the window was closed
+    """
+    with imgui_profiler.scope("events"):
+        for event in events:
             if event.type == pygame.QUIT:
-                if on_exit:
-                    on_exit()
-                try:
-                    sys.exit()
-                except SystemExit as e:
-                    time.sleep(0.5)
-                    # sys.exit()
-                    # sys.terminate()
-                    os._exit(1)
-
+                return True
             pygame_renderer.process_event(event)
+    return False
 
-        imgui.new_frame()
-        if params.provide_default_window:
-            imgui.set_next_window_position(0, 0)
-            imgui.set_next_window_size(win_size[0], win_size[1])
-            imgui.begin("Default window")
-        gui_loop_function()
-        if params.provide_default_window:
-            imgui.end()
-        ImGuiImageLister._heartbeat()
 
+def _render(pygame_renderer):
+    with imgui_profiler.scope("render"):
         # note: cannot use screen.fill((1, 1, 1)) because pygame's screen
         #       does not support fill() on OpenGL surfaces
         gl.glClearColor(1, 1, 1, 1)
         gl.glClear(gl.GL_COLOR_BUFFER_BIT)
         imgui.render()
         pygame_renderer.render(imgui.get_draw_data())
+    with imgui_profiler.scope("flip"):
         pygame.display.flip()
 
-        imgui_cv._clear_all_cv_textures()
-        imgui_ext.__clear_all_unique_labels()
+
+def _nb_frames_to_render(events, params, nb_remaining_frames: int) -> int:
+    if len(events) > 0 or _INVALIDATED.is_set():
+        nb_remaining_frames = max(nb_remaining_frames, 1 + params.idle_extra_frames)
+    _INVALIDATED.clear()
+    return nb_remaining_frames
+
+
+def run(
+    gui_loop_function, 
+    params=Params(), 
+    on_init = None,
+    on_exit = None):
+
+    win_size, pygame_renderer = _init_window(params)
+    # if on_exit:
+    #     pygame.register_quit(on_exit)
+
+    if on_init:
+        on_init()
+
+    frame_pacer = _FramePacer(params.max_fps)
+    nb_remaining_frames = 1
+    while 1:
+        events = _wait_events(params, nb_remaining_frames)
+        nb_remaining_frames = _nb_frames_to_render(events, params, nb_remaining_frames)
+        frame_pacer.wait()
+
+        imgui_profiler.begin_frame()
+        if _process_events(events, pygame_renderer):
+            if on_exit:
+                on_exit()
+            _imgui_cv_zoom.shutdown_pyramid_builds()
+            try:
+                sys.exit()
+            except SystemExit as e:
+                time.sleep(0.5)
+                # sys.exit()
+                # sys.terminate()
+                os._exit(1)
+
+        _gui_frame(gui_loop_function, params, win_size)
+        _render(pygame_renderer)
+        _end_frame()
+        nb_remaining_frames = max(nb_remaining_frames - 1, 0)
+
+
+# In idle mode, run_async() polls the pygame events with this period (it cannot block the asyncio event loop)
+ASYNC_IDLE_POLL_PERIOD = 0.02
+
+
+async def _call_maybe_async(function, *args):
+    result = function(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def run_async(
+    gui_loop_function,
+    params=Params(),
+    on_init = None,
+    on_exit = None):
+    """
+    Same as run(), as a coroutine that yields to the asyncio event loop between the frames,
+    so that other tasks (file reads, sockets, decoding...) run concurrently with the gui:
+        asyncio.run(imgui_runner.run_async(gui_loop))
+
+    gui_loop_function, on_init and on_exit may be functions or coroutine functions.
+    The other tasks run while gui_loop_function awaits, or between the frames: they shall not call imgui.
+    The coroutine returns when the window is closed.
+    """
+    win_size, pygame_renderer = _init_window(params)
+    try:
+        if on_init:
+            await _call_maybe_async(on_init)
+
+        frame_pacer = _FramePacer(params.max_fps)
+        nb_remaining_frames = 1
+        while True:
+            events = pygame.event.get()
+            while params.idle_rendering and nb_remaining_frames == 0 and len(events) == 0 \
+                    and not _INVALIDATED.is_set():
+                await asyncio.sleep(ASYNC_IDLE_POLL_PERIOD)
+                events = pygame.event.get()
+            nb_remaining_frames = _nb_frames_to_render(events, params, nb_remaining_frames)
+            await frame_pacer.wait_async()
+
+            imgui_profiler.begin_frame()
+            if _process_events(events, pygame_renderer):
+                break
+            _begin_gui_frame(params, win_size)
+            with imgui_profiler.scope("gui_loop_function"):
+                await _call_maybe_async(gui_loop_function)
+            _end_gui_frame(params)
+            _render(pygame_renderer)
+            _end_frame()
+            nb_remaining_frames = max(nb_remaining_frames - 1, 0)
+
+        if on_exit:
+            await _call_maybe_async(on_exit)
+    finally:
+        _imgui_cv_zoom.shutdown_pyramid_builds()
+        imgui_cv._release_all_textures()
+        pygame.quit()
+        imgui.destroy_context()
+
+
+@dataclass
+class FrameTimingStats:
+    """
+    Statistics of the frames run by run_headless(). Durations are in seconds, and include
+    gui_loop_function, the image lister and imgui.render() (but no actual rendering)
+    """
+    frame_durations: List[float] = field(default_factory=list)
+    frame_bytes_uploaded: List[int] = field(default_factory=list) # bytes transferred to the GL backend per frame
+
+    @property
+    def nb_frames(self) -> int:
+        return len(self.frame_durations)
+
+    @property
+    def total_duration(self) -> float:
+        return float(sum(self.frame_durations))
+
+    def percentile(self, p: float) -> float:
+        if self.nb_frames == 0:
+            return 0.
+        return float(np.percentile(self.frame_durations, p))
+
+    @property
+    def mean(self) -> float:
+        return self.total_duration / self.nb_frames if self.nb_frames > 0 else 0.
+
+    @property
+    def fps(self) -> float:
+        return self.nb_frames / self.total_duration if self.total_duration > 0. else 0.
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "nb_frames": self.nb_frames,
+            "total_duration": self.total_duration,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": max(self.frame_durations) if self.nb_frames > 0 else 0.,
+            "fps": self.fps,
+            "bytes_uploaded": int(sum(self.frame_bytes_uploaded)),
+        }
+
+
+def run_headless(
+    gui_loop_function,
+    params=Params(),
+    nb_frames: Optional[int] = None,
+    max_duration: Optional[float] = None,
+    on_init = None,
+    on_exit = None,
+    gl_backend: Optional[GlBackend] = None,
+    delta_time: float = 1. / 60.
+    ) -> FrameTimingStats:
+    """
+    Runs gui_loop_function without window: no display or GPU is needed (e.g. in order to benchmark a gui).
+    The textures are sent to gl_backend (a RecordingGlBackend by default) instead of the GPU.
+    :param nb_frames: number of frames to run
+    :param max_duration: time budget in seconds (the run stops after the first frame that exceeds it)
+    :param delta_time: the time step between two frames, as seen by imgui
+    :return: the timing of each frame
+    """
+    if nb_frames is None and max_duration is None:
+        raise ValueError("run_headless: nb_frames or max_duration is required")
+    if gl_backend is None:
+        gl_backend = RecordingGlBackend()
+
+    context = imgui.create_context()
+    io = imgui.get_io()
+    io.ini_file_name = None # (no window settings are saved into the current directory)
+    imgui_ext._load_fonts()
+    io.display_size = params.win_size
+    io.delta_time = delta_time
+    io.fonts.get_tex_data_as_rgba32()
+
+    previous_gl_backend = imgui_cv.GL_BACKEND
+    imgui_cv._release_all_textures()
+    imgui_cv.GL_BACKEND = gl_backend
+
+    previous_profiler_enabled = imgui_profiler.ENABLED
+    if params.profile:
+        imgui_profiler.ENABLED = True
+    stats = FrameTimingStats()
+    try:
+        if on_init:
+            on_init()
+        start = default_timer()
+        while (nb_frames is None or stats.nb_frames < nb_frames) \
+                and (max_duration is None or default_timer() - start < max_duration):
+            imgui_profiler.begin_frame()
+            frame_start = default_timer()
+            _gui_frame(gui_loop_function, params, params.win_size)
+            with imgui_profiler.scope("render"):
+                imgui.render()
+            frame_end = default_timer()
+            stats.frame_durations.append(frame_end - frame_start)
+            stats.frame_bytes_uploaded.append(imgui_cv._FRAME_METRICS.bytes_uploaded)
+            _end_frame()
+        if on_exit:
+            on_exit()
+    finally:
+        _imgui_cv_zoom.shutdown_pyramid_builds()
+        imgui_cv._release_all_textures()
+        imgui_cv.GL_BACKEND = previous_gl_backend
+        imgui_profiler.ENABLED = previous_profiler_enabled
+        imgui.destroy_context(context)
+    return stats
 
 
 def _none_gui_loop():
@@ -125,4 +455,4 @@ def ImGuiLister_ShowStandalone():
     ImGuiImageLister.opened = True
     ImGuiImageLister.max_size = True
 
-    run(_none_gui_loop, Params(win_title="ImGuiLister", windowed_full_screen=True))
+    run(_none_gui_loop, Params(win_title="ImGuiLister", windowed_full_screen=True, idle_rendering=True))
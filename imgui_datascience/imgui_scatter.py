@@ -0,0 +1,326 @@
+"""
+Scatter plots of large point sets (millions of points), without matplotlib:
+the points are rasterized with numpy (np.bincount) into a density image (number of points per pixel),
+which is colorized and displayed via imgui_cv.
+
+ScatterData indexes the points once (this takes a second or two for 10M points):
+  - the points are sorted by the cells of a grid (column by column), so that the points of the visible columns
+    are a contiguous slice, and the points near the mouse are found quickly
+  - coarser grids (each 2x coarser) store the number of points per cell: when zoomed out, a coarse grid
+    whose cells are smaller than a pixel is rasterized instead of the points
+  - when the cells of the grid are slightly larger than a pixel (up to MAX_CELL_PIXELS), the number of points
+    per cell is warped to the viewport: the points are only rasterized when zoomed in, i.e. when few are visible
+"""
+import math
+from typing import *
+import numpy as np
+import cv2
+import imgui
+from . import imgui_cv
+from . import imgui_ext
+from . import imgui_profiler
+from ._imgui_cv_zoom import ZoomInfo, compute_zoom_matrix
+from .imgui_cv import SizePixel
+from .static_vars import static_vars
+
+# Colormap of the density (an OpenCV colormap); the empty pixels are displayed with SCATTER_BACKGROUND_COLOR (BGR)
+SCATTER_COLORMAP = cv2.COLORMAP_VIRIDIS
+SCATTER_BACKGROUND_COLOR = (255, 255, 255)
+# Max distance (in pixels) between the mouse and the hovered point
+SCATTER_HOVER_MAX_DISTANCE = 8.
+
+
+class _GridLevel:
+    """
+    The non empty cells of a grid of size x size cells: their center and their number of points,
+    sorted by column (column_starts[i] is the index of the first cell of column i)
+    """
+    def __init__(self, counts: np.ndarray, bounds):
+        self.size = counts.shape[0]
+        x_min, x_max, y_min, y_max = bounds
+        columns, rows = np.nonzero(counts)
+        self.x = x_min + (columns + 0.5) * ((x_max - x_min) / self.size)
+        self.y = y_min + (rows + 0.5) * ((y_max - y_min) / self.size)
+        self.weights = counts[columns, rows].astype(np.float64)
+        self.column_starts = np.searchsorted(columns, np.arange(self.size + 1))
+
+
+class ScatterData:
+    """
+    Points indexed for scatter(): x and y are 1D arrays of the same length
+    """
+    MIN_GRID_SIZE = 16
+    MAX_CELL_PIXELS = 4.
+
+    def __init__(self, x, y, grid_size: int = 2048):
+        x = np.asarray(x)
+        y = np.asarray(y)
+        if x.shape != y.shape or x.ndim != 1:
+            raise ValueError("ScatterData: x and y shall be 1D arrays of the same length")
+        if grid_size & (grid_size - 1) != 0:
+            raise ValueError("ScatterData: grid_size shall be a power of 2")
+        self.nb_points = x.shape[0]
+        self.grid_size = grid_size
+        if self.nb_points > 0:
+            x_min, x_max, y_min, y_max = float(x.min()), float(x.max()), float(y.min()), float(y.max())
+        else:
+            x_min, x_max, y_min, y_max = 0., 1., 0., 1.
+        # (an empty range is widened, so that the cells are not empty)
+        if x_max - x_min <= 0.:
+            x_min, x_max = x_min - 0.5, x_max + 0.5
+        if y_max - y_min <= 0.:
+            y_min, y_max = y_min - 0.5, y_max + 0.5
+        self.bounds = (x_min, x_max, y_min, y_max)
+
+        columns = self.grid_columns(x)
+        rows = self.grid_rows(y)
+        cells = columns * grid_size + rows
+        # (a stable sort of integers is a radix sort)
+        self.order = np.argsort(cells, kind="stable")
+        self.x = x[self.order]
+        self.y = y[self.order]
+        counts = np.bincount(cells, minlength=grid_size * grid_size)
+        self.cell_starts = np.concatenate([[0], np.cumsum(counts)])
+        self.column_starts = self.cell_starts[::grid_size]
+
+        # counts[column, row]: number of points per cell
+        self.counts = counts.reshape((grid_size, grid_size)).astype(np.float32)
+
+        # the coarse levels, from the finest to the coarsest
+        self.levels: List[_GridLevel] = []
+        counts = counts.reshape((grid_size, grid_size))
+        while counts.shape[0] >= self.MIN_GRID_SIZE:
+            self.levels.append(_GridLevel(counts, self.bounds))
+            half = counts.shape[0] // 2
+            counts = counts.reshape((half, 2, half, 2)).sum(axis=(1, 3))
+
+    def _grid_index(self, values, v_min, v_max, size):
+        index = np.floor((values - v_min) * (size / (v_max - v_min))).astype(np.int64)
+        return np.clip(index, 0, size - 1)
+
+    def grid_columns(self, x, size=None):
+        return self._grid_index(x, self.bounds[0], self.bounds[1], size or self.grid_size)
+
+    def grid_rows(self, y, size=None):
+        return self._grid_index(y, self.bounds[2], self.bounds[3], size or self.grid_size)
+
+    def full_view(self, viewport_size: SizePixel) -> np.ndarray:
+        """
+        The transform from the data to the viewport that shows all the points (with the y axis upwards)
+        """
+        x_min, x_max, y_min, y_max = self.bounds
+        scale_x = (viewport_size.width - 1) / (x_max - x_min)
+        scale_y = (viewport_size.height - 1) / (y_max - y_min)
+        return np.array([[scale_x, 0., -x_min * scale_x + 0.5],
+                         [0., -scale_y, y_max * scale_y + 0.5],
+                         [0., 0., 1.]])
+
+
+def _visible_columns(data: ScatterData, affine_transform: np.ndarray, viewport_size: SizePixel, size: int):
+    x0 = (0. - affine_transform[0, 2]) / affine_transform[0, 0]
+    x1 = (viewport_size.width - affine_transform[0, 2]) / affine_transform[0, 0]
+    x_min, x_max = data.bounds[0], data.bounds[1]
+    if max(x0, x1) < x_min or min(x0, x1) > x_max:
+        return 0, 0
+    columns = data.grid_columns(np.array([min(x0, x1), max(x0, x1)]), size)
+    return int(columns[0]), int(columns[1]) + 1
+
+
+def _cell_size_pixels(data: ScatterData, affine_transform: np.ndarray, grid_size: int) -> float:
+    x_min, x_max, y_min, y_max = data.bounds
+    cell_width_pixels = math.fabs((x_max - x_min) / grid_size * affine_transform[0, 0])
+    cell_height_pixels = math.fabs((y_max - y_min) / grid_size * affine_transform[1, 1])
+    return max(cell_width_pixels, cell_height_pixels)
+
+
+def _select_level(data: ScatterData, affine_transform: np.ndarray) -> Optional[_GridLevel]:
+    """
+    The coarsest level whose cells are smaller than a pixel (None if there is none)
+    """
+    for level in reversed(data.levels):
+        if _cell_size_pixels(data, affine_transform, level.size) <= 1.:
+            return level
+    return None
+
+
+def _warped_counts(data: ScatterData, affine_transform: np.ndarray, viewport_size: SizePixel) -> np.ndarray:
+    """
+    The density of the visible cells of the grid, warped to the viewport (each cell covers several pixels)
+    """
+    w, h = viewport_size.width, viewport_size.height
+    inv = np.linalg.inv(affine_transform)
+    corners = np.dot(inv, np.array([[0., w, 0., w], [0., 0., h, h], [1., 1., 1., 1.]]))
+    column_begin, column_end = data.grid_columns(np.array([corners[0].min(), corners[0].max()]))
+    row_begin, row_end = data.grid_rows(np.array([corners[1].min(), corners[1].max()]))
+    # block[row, column]
+    block = np.ascontiguousarray(data.counts[column_begin:column_end + 1, row_begin:row_end + 1].T)
+
+    x_min, x_max, y_min, y_max = data.bounds
+    cell_width = (x_max - x_min) / data.grid_size
+    cell_height = (y_max - y_min) / data.grid_size
+    a, tx = affine_transform[0, 0], affine_transform[0, 2]
+    d, ty = affine_transform[1, 1], affine_transform[1, 2]
+    # (the center of the viewport pixel i is at i + 0.5 for the rasterization, and at i for warpAffine)
+    block_to_viewport = np.array([
+        [a * cell_width, 0., a * (x_min + (column_begin + 0.5) * cell_width) + tx - 0.5],
+        [0., d * cell_height, d * (y_min + (row_begin + 0.5) * cell_height) + ty - 0.5]])
+    warped = cv2.warpAffine(block, block_to_viewport, (w, h), flags=cv2.INTER_NEAREST,
+                            borderMode=cv2.BORDER_CONSTANT, borderValue=0.)
+    return warped.astype(np.float64) / math.fabs(a * cell_width * d * cell_height)
+
+
+@imgui_profiler.profiled("scatter_density")
+def density_image(data: ScatterData, affine_transform: np.ndarray, viewport_size: SizePixel) -> np.ndarray:
+    """
+    Returns the number of points per pixel of the viewport (float64 image);
+    affine_transform maps the data to the viewport (without rotation).
+    (when the grid cells are larger than a pixel, the density is averaged over each cell)
+    """
+    w, h = viewport_size.width, viewport_size.height
+    level = _select_level(data, affine_transform)
+    if level is None and _cell_size_pixels(data, affine_transform, data.grid_size) <= ScatterData.MAX_CELL_PIXELS:
+        return _warped_counts(data, affine_transform, viewport_size)
+    if level is not None:
+        column_begin, column_end = _visible_columns(data, affine_transform, viewport_size, level.size)
+        begin, end = level.column_starts[column_begin], level.column_starts[column_end]
+        x, y, weights = level.x[begin:end], level.y[begin:end], level.weights[begin:end]
+    else:
+        column_begin, column_end = _visible_columns(data, affine_transform, viewport_size, data.grid_size)
+        begin, end = data.column_starts[column_begin], data.column_starts[column_end]
+        x, y, weights = data.x[begin:end], data.y[begin:end], None
+
+    px = x * affine_transform[0, 0] + affine_transform[0, 2]
+    py = y * affine_transform[1, 1] + affine_transform[1, 2]
+    inside = (px >= 0.) & (px < w) & (py >= 0.) & (py < h)
+    pixel_indices = py[inside].astype(np.int64) * w + px[inside].astype(np.int64)
+    weights = weights[inside] if weights is not None else None
+    density = np.bincount(pixel_indices, weights=weights, minlength=w * h)
+    return density.reshape((h, w)).astype(np.float64)
+
+
+def colorize_density(density: np.ndarray) -> np.ndarray:
+    """
+    Applies SCATTER_COLORMAP to log(1 + density), normalized by its max; returns a BGR image
+    """
+    log_density = np.log1p(density)
+    max_value = log_density.max()
+    normalized = (log_density * (255. / max_value)).astype(np.uint8) if max_value > 0. \
+        else np.zeros(density.shape, np.uint8)
+    image = cv2.applyColorMap(normalized, SCATTER_COLORMAP)
+    image[density == 0.] = SCATTER_BACKGROUND_COLOR
+    return image
+
+
+def _nearest_sorted_point(data: ScatterData, affine_transform: np.ndarray, position: imgui.Vec2,
+                          max_distance: float) -> Optional[int]:
+    """
+    Returns the index (in data.x and data.y) of the nearest point from position (in viewport pixels),
+    or None if no point is within max_distance pixels
+    """
+    if data.nb_points == 0:
+        return None
+    scale_x, scale_y = affine_transform[0, 0], affine_transform[1, 1]
+    mouse_x = (position.x - affine_transform[0, 2]) / scale_x
+    mouse_y = (position.y - affine_transform[1, 2]) / scale_y
+    radius_x = max_distance / math.fabs(scale_x)
+    radius_y = max_distance / math.fabs(scale_y)
+    x_min, x_max, y_min, y_max = data.bounds
+    if mouse_x + radius_x < x_min or mouse_x - radius_x > x_max \
+            or mouse_y + radius_y < y_min or mouse_y - radius_y > y_max:
+        return None
+    columns = data.grid_columns(np.array([mouse_x - radius_x, mouse_x + radius_x]))
+    rows = data.grid_rows(np.array([mouse_y - radius_y, mouse_y + radius_y]))
+    # (the points of the cells [row0, row1] of a column are contiguous)
+    cell_begins = np.arange(columns[0], columns[1] + 1) * data.grid_size + rows[0]
+    cell_ends = cell_begins + (rows[1] - rows[0] + 1)
+    candidates = np.concatenate([np.arange(data.cell_starts[begin], data.cell_starts[end])
+                                 for begin, end in zip(cell_begins, cell_ends)])
+    if len(candidates) == 0:
+        return None
+    distances2 = ((data.x[candidates] - mouse_x) * scale_x) ** 2 + ((data.y[candidates] - mouse_y) * scale_y) ** 2
+    best = np.argmin(distances2)
+    if distances2[best] > max_distance ** 2:
+        return None
+    return int(candidates[best])
+
+
+def nearest_point(data: ScatterData, affine_transform: np.ndarray, position: imgui.Vec2,
+                  max_distance: float = SCATTER_HOVER_MAX_DISTANCE) -> Optional[int]:
+    """
+    Returns the index (in the original x and y arrays) of the nearest point from position (in viewport pixels),
+    or None if no point is within max_distance pixels
+    """
+    sorted_index = _nearest_sorted_point(data, affine_transform, position, max_distance)
+    return int(data.order[sorted_index]) if sorted_index is not None else None
+
+
+class _ScatterState:
+    def __init__(self, data: ScatterData, viewport_size: SizePixel):
+        self.data = data
+        self.viewport_size = viewport_size
+        self.zoom_info = ZoomInfo()
+        self.zoom_info.affine_transform = data.full_view(viewport_size)
+        # (the image is updated in place, so that it keeps its entry in the texture cache)
+        self.image = np.empty((viewport_size.height, viewport_size.width, 3), np.uint8)
+        self.image_version = 0
+        self.image_key = None
+
+
+@static_vars(all_states={})
+def scatter(data: ScatterData, width: int = 400, height: int = 300, title: str = "") -> Optional[int]:
+    """
+    Displays a density scatter plot of data: drag with the mouse to pan, use the mouse wheel to zoom.
+    :return: the index of the point under the mouse (or None)
+    """
+    statics = scatter.statics
+    viewport_size = SizePixel(width, height)
+    state_key = imgui_ext.make_unique_label(title)
+    state = statics.all_states.get(state_key)
+    if state is None or state.data is not data \
+            or state.viewport_size.as_tuple_width_height() != viewport_size.as_tuple_width_height():
+        state = _ScatterState(data, viewport_size)
+        statics.all_states[state_key] = state
+    zoom_info = state.zoom_info
+
+    image_key = (zoom_info.affine_transform.tobytes(), viewport_size.as_tuple_width_height())
+    if image_key != state.image_key:
+        state.image[...] = colorize_density(density_image(data, zoom_info.affine_transform, viewport_size))
+        state.image_version += 1
+        state.image_key = image_key
+    mouse_location = imgui_cv.image(state.image, title=title, version=state.image_version)
+    is_hovered = imgui.is_item_hovered()
+    image_origin = imgui.get_item_rect_min()
+
+    hovered_index = None
+    if is_hovered and mouse_location is not None:
+        io = imgui.get_io()
+        if imgui.is_mouse_dragging(0):
+            drag_delta = imgui.get_mouse_drag_delta(0)
+            pan = np.eye(3)
+            pan[0, 2] = drag_delta.x - zoom_info.last_delta.x
+            pan[1, 2] = drag_delta.y - zoom_info.last_delta.y
+            zoom_info.affine_transform = np.dot(pan, zoom_info.affine_transform)
+            zoom_info.last_delta = drag_delta
+        else:
+            zoom_info.last_delta = imgui.Vec2(0., 0.)
+        if io.mouse_wheel != 0.:
+            zoom_ratio = 1.25 if io.mouse_wheel > 0. else 1. / 1.25
+            zoom_info.affine_transform = np.dot(compute_zoom_matrix(mouse_location, zoom_ratio),
+                                                zoom_info.affine_transform)
+
+        sorted_index = _nearest_sorted_point(data, zoom_info.affine_transform, mouse_location,
+                                             SCATTER_HOVER_MAX_DISTANCE)
+        if sorted_index is not None:
+            hovered_index = int(data.order[sorted_index])
+            x, y = data.x[sorted_index], data.y[sorted_index]
+            point_x = image_origin.x + x * zoom_info.affine_transform[0, 0] + zoom_info.affine_transform[0, 2]
+            point_y = image_origin.y + y * zoom_info.affine_transform[1, 1] + zoom_info.affine_transform[1, 2]
+            imgui.get_window_draw_list().add_circle(point_x, point_y, 5., imgui.get_color_u32_rgba(1., 0., 0., 1.),
+                                                    thickness=2.)
+            imgui.set_tooltip(f"#{hovered_index}: ({x:.4g}, {y:.4g})")
+
+    if imgui.small_button(imgui_ext.make_unique_label("full view")):
+        zoom_info.affine_transform = data.full_view(viewport_size)
+    imgui.same_line()
+    imgui.text(f"{data.nb_points} points")
+    return hovered_index
@@ -1,2 +1,4 @@
 from imgui_datascience.example import example
-example()
+
+if __name__ == "__main__":
+    example()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the image pyramid of image_explorer (zoomed-out gigapixel images)."""
+
+import concurrent.futures
+import math
+import cv2
+import numpy as np
+import pytest
+
+from imgui_datascience import imgui_cv, imgui_runner
+from imgui_datascience import _imgui_cv_zoom
+from imgui_datascience._imgui_cv_zoom import ImagePyramid
+from imgui_datascience.gl_backend import RecordingGlBackend
+
+
+def build(pyramid):
+    pyramid._start_build()
+    pyramid._future.result()
+
+
+@pytest.fixture
+def image():
+    return np.random.RandomState(0).randint(0, 255, (2048, 2048)).astype(np.uint8)
+
+
+def test_kept_levels_fit_in_budget(image):
+    pyramid = ImagePyramid(image, 0, max_bytes=400 * 1000)
+    assert [size.width for size in pyramid.level_sizes] == [2048, 1024, 512, 256]
+    # (levels 3 and 2 use 64 kB + 256 kB; level 1 would need 1 MB more)
+    assert pyramid.kept_levels == {2, 3}
+    assert ImagePyramid(image, 0, max_bytes=10).kept_levels == set()
+
+
+def test_build_skips_the_levels_that_are_not_kept(image, monkeypatch):
+    resized_sizes = []
+    original_resize = cv2.resize
+
+    def resize(source, size, *args, **kwargs):
+        resized_sizes.append(size)
+        return original_resize(source, size, *args, **kwargs)
+
+    monkeypatch.setattr(cv2, "resize", resize)
+    pyramid = ImagePyramid(image, 0, max_bytes=400 * 1000)
+    build(pyramid)
+    assert resized_sizes == [(512, 512), (256, 256)]
+    assert pyramid.levels[1] is None
+    # the finest kept level is an area downsampling of the image
+    expected = image.reshape(512, 4, 512, 4).mean(axis=(1, 3))
+    assert np.abs(pyramid.levels[2].astype(np.float64) - expected).max() <= 1.
+
+
+def test_level_for_zoom(image):
+    pyramid = ImagePyramid(image, 0, max_bytes=400 * 1000)
+    assert pyramid.level_for_zoom(0.8) == 0
+    build(pyramid)
+    assert pyramid.level_for_zoom(0.25) == 2
+    assert pyramid.level_for_zoom(math.sqrt(0.125 * 0.125 * (1. - 1E-15))) == 3
+    assert pyramid.level_for_zoom(0.01) == 3
+    # level 1 is not kept: the next finer level (the image) is used, so that the image is not undersampled
+    assert pyramid.level_for_zoom(0.5) == 0
+    assert pyramid.level_for_zoom(0.45) == 0
+
+
+def test_level_for_zoom_while_building(image):
+    pyramid = ImagePyramid(image, 0, max_bytes=400 * 1000)
+    pyramid._future = object() # (the build never ends)
+    assert pyramid.level_for_zoom(0.01) == 0
+
+
+def test_explorer_displays_a_pyramid_level(image, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "PYRAMID_MIN_PIXELS", 1000 * 1000)
+    nb_hashes = []
+    original_hash_image = imgui_cv._hash_image
+
+    def hash_image(*args, **kwargs):
+        nb_hashes[-1] += 1
+        return original_hash_image(*args, **kwargs)
+
+    monkeypatch.setattr(imgui_cv, "_hash_image", hash_image)
+
+    def gui():
+        nb_hashes.append(0)
+        imgui_cv.image_explorer(image, width=256, height=256, title="pyramid")
+        wait_for_pyramid_builds()
+
+    nb_frames = imgui_cv.PYRAMID_STABLE_FRAMES + 1
+    gl_backend = RecordingGlBackend(keep_calls=True)
+    imgui_runner.run_headless(gui, nb_frames=nb_frames, gl_backend=gl_backend)
+    # the image is hashed once per frame (for the pyramid and the texture cache)
+    assert nb_hashes == [1] * nb_frames
+    # once the pyramid is built, its coarsest level (256 x 256) is displayed
+    assert [call[1:3] for call in gl_backend.calls_to("tex_image_2d")][-1] == (256, 256)
+
+
+def wait_for_pyramid_builds():
+    statics = _imgui_cv_zoom.image_explorer_autostore_zoominfo.statics
+    for image_with_zoom_info in statics.all_ImageWithZoomInfo.values():
+        if image_with_zoom_info.pyramid is not None and image_with_zoom_info.pyramid._future is not None:
+            concurrent.futures.wait([image_with_zoom_info.pyramid._future])
+
+
+def test_streamed_images_are_not_downsampled(image, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "PYRAMID_MIN_PIXELS", 1000 * 1000)
+    nb_builds = [0]
+    original_build = ImagePyramid._build
+
+    def count_build(pyramid):
+        nb_builds[0] += 1
+        original_build(pyramid)
+
+    monkeypatch.setattr(ImagePyramid, "_build", count_build)
+    frames = [image, np.roll(image, 1, axis=1)]
+
+    def gui(frame):
+        imgui_cv.image_explorer(frame, width=256, height=256, title="stream")
+
+    # a new image at each frame: no pyramid is built
+    frame_index = iter(range(30))
+    imgui_runner.run_headless(lambda: gui(frames[next(frame_index) % 2].copy()), nb_frames=30)
+    assert nb_builds[0] == 0
+    # a stable content (even in new arrays) is downsampled once
+    imgui_runner.run_headless(lambda: [gui(image.copy()), wait_for_pyramid_builds()], nb_frames=10)
+    assert nb_builds[0] == 1
+    assert not _imgui_cv_zoom._PYRAMIDS_BEING_BUILT
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the figure cache of `imgui_fig`."""
+
+import concurrent.futures
+import gc
+import threading
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot
+from matplotlib.figure import Figure
+import numpy as np
+
+from imgui_datascience import imgui_fig
+
+
+def make_figure():
+    figure = Figure(figsize=(3, 2), dpi=50)
+    ax = figure.add_subplot(111)
+    line, = ax.plot(np.arange(10), np.arange(10))
+    return figure, line
+
+
+def test_unchanged_figure_is_not_rendered_again():
+    figure, _ = make_figure()
+    image, version = imgui_fig._fig_to_image_and_version(figure)
+    assert image.shape == (100, 150, 3)
+    image2, version2 = imgui_fig._fig_to_image_and_version(figure)
+    assert image2 is image
+    assert version2 == version
+
+
+def test_modified_figure_is_rendered_again():
+    figure, line = make_figure()
+    image, version = imgui_fig._fig_to_image_and_version(figure)
+    line.set_ydata(np.arange(10)[::-1])
+    image2, version2 = imgui_fig._fig_to_image_and_version(figure)
+    assert version2 != version
+    assert not np.array_equal(image, image2)
+    # a draw by matplotlib itself is also detected
+    line.set_color("red")
+    figure.canvas.draw()
+    _, version3 = imgui_fig._fig_to_image_and_version(figure)
+    assert version3 != version2
+
+
+def test_figure_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(imgui_fig, "FIGURE_CACHE_MAX_SIZE", 3)
+    figures = [make_figure()[0] for _ in range(5)]
+    for figure in figures:
+        imgui_fig._fig_to_image(figure)
+    assert len(imgui_fig._FIGURE_CACHE) == 3
+    assert list(imgui_fig._FIGURE_CACHE.keys()) == [id(figure) for figure in figures[2:]]
+
+
+def test_deleted_figure_leaves_the_cache():
+    figure, line = make_figure()
+    imgui_fig._fig_to_image(figure)
+    fig_id = id(figure)
+    assert fig_id in imgui_fig._FIGURE_CACHE
+    del figure, line
+    gc.collect()
+    assert fig_id not in imgui_fig._FIGURE_CACHE
+
+
+def test_pyplot_figure_is_not_closed():
+    figure = matplotlib.pyplot.figure()
+    imgui_fig._fig_to_image(figure)
+    assert matplotlib.pyplot.fignum_exists(figure.number)
+    matplotlib.pyplot.close(figure)
+
+
+def wait_for_background_rendering(cache, key):
+    future = cache[key].future
+    if future is not None:
+        concurrent.futures.wait([future], timeout=120)
+
+
+def make_factory_figure():
+    figure = Figure(figsize=(3, 2), dpi=50)
+    figure.add_subplot(111).plot(np.arange(10), np.arange(10))
+    return figure
+
+
+def test_background_rendering_with_a_thread():
+    figure, line = make_figure()
+    figure.unpicklable = threading.Lock() # rendered by a thread
+    image, _, rendering = imgui_fig._fig_to_image_in_background(figure)
+    assert image is None and rendering
+    wait_for_background_rendering(imgui_fig._FIGURE_CACHE, id(figure))
+    image, version, rendering = imgui_fig._fig_to_image_in_background(figure)
+    assert image.shape == (100, 150, 3) and not rendering
+
+    line.set_ydata(np.arange(10)[::-1])
+    image2, version2, rendering = imgui_fig._fig_to_image_in_background(figure)
+    # the previous image is displayed while the figure is being rendered
+    assert image2 is image and version2 == version and rendering
+    wait_for_background_rendering(imgui_fig._FIGURE_CACHE, id(figure))
+    image3, version3, rendering = imgui_fig._fig_to_image_in_background(figure)
+    assert version3 != version and not np.array_equal(image3, image) and not rendering
+
+
+def test_background_rendering_uses_threads_by_default(monkeypatch):
+    executors = []
+    original_submit_rendering = imgui_fig._submit_rendering
+
+    def submit_rendering(use_processes, *args, **kwargs):
+        executors.append(use_processes)
+        return original_submit_rendering(use_processes, *args, **kwargs)
+
+    monkeypatch.setattr(imgui_fig, "_submit_rendering", submit_rendering)
+    figure, _ = make_figure()
+    imgui_fig._fig_to_image_in_background(figure)
+    wait_for_background_rendering(imgui_fig._FIGURE_CACHE, id(figure))
+    imgui_fig._factory_to_image_in_background(make_factory_figure, 1, "thread factory")
+    wait_for_background_rendering(imgui_fig._FACTORY_FIGURE_CACHE, "thread factory")
+    image, _, rendering = imgui_fig._factory_to_image_in_background(make_factory_figure, 1, "thread factory")
+    # (no process is spawned: they would run the main script again)
+    assert executors == [False, False]
+    assert image.shape == (100, 150, 3) and not rendering
+
+
+def test_background_rendering_with_a_process(monkeypatch):
+    monkeypatch.setattr(imgui_fig, "FIGURE_RENDER_WITH_PROCESSES", True)
+    figure, _ = make_figure()
+    imgui_fig._fig_to_image_in_background(figure)
+    assert imgui_fig._FIGURE_CACHE[id(figure)].picklable
+    wait_for_background_rendering(imgui_fig._FIGURE_CACHE, id(figure))
+    image, _, rendering = imgui_fig._fig_to_image_in_background(figure)
+    assert np.array_equal(image, imgui_fig._draw_figure(figure)) and not rendering
+
+    imgui_fig._factory_to_image_in_background(make_factory_figure, 1, "factory")
+    wait_for_background_rendering(imgui_fig._FACTORY_FIGURE_CACHE, "factory")
+    image2, _, rendering = imgui_fig._factory_to_image_in_background(make_factory_figure, 1, "factory")
+    assert np.array_equal(image2, image) and not rendering
+
+
+def failing_factory():
+    raise RuntimeError("no data")
+
+
+def test_failed_factory_is_not_called_again(monkeypatch):
+    nb_submissions = [0]
+    original_submit_rendering = imgui_fig._submit_rendering
+
+    def submit_rendering(*args, **kwargs):
+        nb_submissions[0] += 1
+        return original_submit_rendering(*args, **kwargs)
+
+    monkeypatch.setattr(imgui_fig, "_submit_rendering", submit_rendering)
+    for _ in range(3):
+        image, _, _ = imgui_fig._factory_to_image_in_background(failing_factory, 1, "failing")
+        wait_for_background_rendering(imgui_fig._FACTORY_FIGURE_CACHE, "failing")
+    assert image is None and nb_submissions[0] == 1
+    assert isinstance(imgui_fig._FACTORY_FIGURE_CACHE["failing"].error, RuntimeError)
+    # a new factory_version is rendered
+    imgui_fig._factory_to_image_in_background(make_factory_figure, 2, "failing")
+    wait_for_background_rendering(imgui_fig._FACTORY_FIGURE_CACHE, "failing")
+    image, _, rendering = imgui_fig._factory_to_image_in_background(make_factory_figure, 2, "failing")
+    assert image is not None and not rendering and nb_submissions[0] == 2
+    assert imgui_fig._FACTORY_FIGURE_CACHE["failing"].error is None
+
+
+def test_failed_figure_is_rendered_again_when_modified(monkeypatch):
+    nb_draws = [0]
+
+    def draw_figure(figure):
+        nb_draws[0] += 1
+        raise RuntimeError("draw failed")
+
+    monkeypatch.setattr(imgui_fig, "_draw_figure", draw_figure)
+    figure, line = make_figure()
+    figure.unpicklable = threading.Lock() # rendered by a thread
+    for _ in range(3):
+        imgui_fig._fig_to_image_in_background(figure)
+        wait_for_background_rendering(imgui_fig._FIGURE_CACHE, id(figure))
+    image, _, rendering = imgui_fig._fig_to_image_in_background(figure)
+    assert image is None and not rendering and nb_draws[0] == 1
+    line.set_ydata(np.arange(10)[::-1])
+    imgui_fig._fig_to_image_in_background(figure)
+    wait_for_background_rendering(imgui_fig._FIGURE_CACHE, id(figure))
+    assert nb_draws[0] == 2
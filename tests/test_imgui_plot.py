@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `imgui_plot`."""
+
+import numpy as np
+import pytest
+
+from imgui_datascience import imgui_plot, imgui_runner
+
+
+@pytest.fixture(scope="module")
+def values():
+    values = np.random.RandomState(0).randn(1000003)
+    values[123457] = 100.
+    values[765431] = -100.
+    return values
+
+
+@pytest.mark.parametrize("start, end", [(0, 1000003), (100000, 200000), (123000, 124000), (123400, 123500)])
+def test_envelope(values, start, end):
+    series = imgui_plot.DecimatedSeries(values)
+    envelope = series.envelope(start, end, 300)
+    assert len(envelope.starts) <= 300
+    assert envelope.starts[0] == start and np.all(np.diff(envelope.starts) > 0)
+    column_ends = np.append(envelope.starts[1:], end)
+    for i in range(len(envelope.starts)):
+        column = values[envelope.starts[i]:column_ends[i]]
+        assert envelope.mins[i] <= column.min() and envelope.maxs[i] >= column.max()
+    # the envelope is exact: no spike is dropped, and no spike is added
+    assert envelope.maxs.max() == values[start:end].max()
+    assert envelope.mins.min() == values[start:end].min()
+
+
+def test_envelope_with_fewer_samples_than_columns(values):
+    series = imgui_plot.DecimatedSeries(values)
+    envelope = series.envelope(1000, 1100, 300)
+    assert np.array_equal(envelope.starts, np.arange(1000, 1100))
+    assert np.array_equal(envelope.mins, values[1000:1100])
+    assert len(series.envelope(2000000, 3000000, 300).starts) == 0
+
+
+def test_envelope_ignores_nan():
+    values = np.arange(1000.)
+    values[500:600] = np.nan
+    envelope = imgui_plot.DecimatedSeries(values).envelope(0, 1000, 10)
+    assert envelope.mins[0] == 0. and envelope.maxs[-1] == 999.
+
+
+def test_plot_lines_widget(values):
+    series = imgui_plot.DecimatedSeries(values)
+    stats = imgui_runner.run_headless(lambda: imgui_plot.plot_lines(series, 600, 200, "series"), nb_frames=3)
+    assert stats.nb_frames == 3
+
+
+def test_streaming_envelope():
+    values = np.random.RandomState(0).randn(456789)
+    values[400001] = 100.
+    values[412345] = -100.
+    series = imgui_plot.StreamingSeries(100000)
+    random_state = np.random.RandomState(1)
+    nb_appended = 0
+    while nb_appended < len(values):
+        chunk_size = random_state.randint(1, 5000)
+        series.append(values[nb_appended:nb_appended + chunk_size])
+        nb_appended = min(nb_appended + chunk_size, len(values))
+    assert len(series) == 100000 and series.first_index == len(values) - 100000
+    # the ring buffers wrapped several times
+    for start, end in [(0, len(values)), (400000, 420000), (412000, 413000)]:
+        envelope = series.envelope(start, end, 300)
+        start = max(start, series.first_index)
+        assert len(envelope.starts) <= 300 and envelope.starts[0] == start
+        column_ends = np.append(envelope.starts[1:], end)
+        for i in range(len(envelope.starts)):
+            column = values[envelope.starts[i]:column_ends[i]]
+            assert envelope.mins[i] <= column.min() and envelope.maxs[i] >= column.max()
+        assert envelope.mins.min() == -100.
+        # the oldest column may include overwritten samples, the others are exact
+        assert envelope.maxs[1:].max() == values[envelope.starts[1]:end].max()
+
+
+def test_streaming_append_more_than_capacity():
+    series = imgui_plot.StreamingSeries(1000)
+    series.append(np.arange(2500.))
+    assert len(series) == 1000 and series.first_index == 1500 and series.last_value() == 2499.
+    envelope = series.envelope(0, 2500, 1000)
+    assert np.array_equal(envelope.mins, np.arange(1500., 2500.))
+
+
+def test_plot_streaming_widget():
+    plot = imgui_plot.StreamingPlot(capacity=10000, window=5000)
+
+    def gui():
+        plot.append({"loss": np.random.rand(100), "accuracy": np.random.rand(100)})
+        imgui_plot.plot_streaming(plot, 600, 200, "metrics")
+
+    stats = imgui_runner.run_headless(gui, nb_frames=3)
+    assert stats.nb_frames == 3
+    assert list(plot.series.keys()) == ["loss", "accuracy"] and len(plot.series["loss"]) == 300
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `imgui_profiler`."""
+
+import json
+
+import numpy as np
+
+from imgui_datascience import imgui_cv, imgui_profiler, imgui_runner
+
+
+def test_profiler_stages_and_trace(tmp_path):
+    imgui_profiler.reset()
+    images = [np.random.RandomState(seed).randint(0, 255, (240, 320, 3)).astype(np.uint8) for seed in range(3)]
+    frame_index = [0]
+
+    def gui():
+        imgui_cv.image(images[frame_index[0] % len(images)])
+        frame_index[0] += 1
+
+    imgui_runner.run_headless(gui, params=imgui_runner.Params(profile=True), nb_frames=10)
+    assert not imgui_profiler.ENABLED
+
+    stats = imgui_profiler.stage_stats()
+    for stage in ["frame", "gui_loop_function", "image_lister", "render", "texture_cleanup", "hash", "upload"]:
+        assert stage in stats
+    assert stats["frame"]["p50"] >= stats["gui_loop_function"]["p50"]
+    assert stats["upload"]["max"] > 0.
+
+    trace_file = tmp_path / "trace.json"
+    imgui_profiler.export_chrome_trace(str(trace_file))
+    trace = json.loads(trace_file.read_text())
+    frames = [event for event in trace["traceEvents"] if event["name"] == "frame"]
+    assert len(frames) == 10
+    assert all(event["ph"] == "X" and event["dur"] >= 0. for event in trace["traceEvents"])
+    imgui_profiler.reset()
+
+
+def test_scope_is_a_no_op_when_disabled():
+    imgui_profiler.reset()
+    with imgui_profiler.scope("not recorded"):
+        pass
+    imgui_profiler.begin_frame()
+    imgui_profiler.end_frame()
+    assert len(imgui_profiler.stage_stats()) == 0
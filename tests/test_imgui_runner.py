@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `imgui_runner` (headless mode, frame pacing)."""
+
+import asyncio
+from timeit import default_timer
+
+import numpy as np
+import pytest
+
+from imgui_datascience import imgui_cv, imgui_fig, imgui_image_lister, imgui_plot, imgui_runner
+from imgui_datascience import _imgui_cv_tiles, _invalidation
+from imgui_datascience.gl_backend import RecordingGlBackend
+
+
+def test_run_headless_nb_frames():
+    image = np.random.RandomState(0).randint(0, 255, (480, 640, 3)).astype(np.uint8)
+    gl_backend = RecordingGlBackend()
+    stats = imgui_runner.run_headless(lambda: imgui_cv.image(image), nb_frames=5, gl_backend=gl_backend)
+    assert stats.nb_frames == 5
+    assert stats.frame_bytes_uploaded == [image.nbytes, 0, 0, 0, 0]
+    assert stats.percentile(50) <= stats.summary()["max"]
+    # the textures are released at the end of the run
+    assert gl_backend.nb_live_textures == 0
+
+
+def test_run_headless_max_duration():
+    stats = imgui_runner.run_headless(lambda: None, max_duration=0.05)
+    assert stats.nb_frames > 0
+    assert stats.total_duration <= 0.05 + max(stats.frame_durations)
+
+
+def test_run_headless_requires_a_stop_condition():
+    with pytest.raises(ValueError):
+        imgui_runner.run_headless(lambda: None)
+
+
+def test_frame_pacer_caps_the_frame_rate():
+    frame_pacer = imgui_runner._FramePacer(max_fps=100)
+    start = default_timer()
+    for _ in range(11):
+        frame_pacer.wait()
+    # the first frame is not delayed
+    assert 0.1 <= default_timer() - start < 0.2
+
+
+def test_invalidate_without_display():
+    imgui_runner._INVALIDATED.clear()
+    imgui_runner.invalidate()
+    assert imgui_runner._INVALIDATED.is_set()
+    imgui_runner._INVALIDATED.clear()
+
+
+def test_data_modules_invalidate_without_the_runner(monkeypatch):
+    nb_wakeups = [0]
+
+    def wakeup():
+        nb_wakeups[0] += 1
+
+    monkeypatch.setattr(_invalidation, "_WAKEUP_FUNCTION", wakeup)
+    _invalidation.INVALIDATED.clear()
+    plot = imgui_plot.StreamingPlot(capacity=10)
+    plot.append({"loss": 1.})
+    plot.append({"loss": 2.})
+    # (a single wakeup, until the runner renders the requested frame)
+    assert imgui_runner._INVALIDATED.is_set() and nb_wakeups[0] == 1
+    _invalidation.INVALIDATED.clear()
+    for module in [imgui_plot, imgui_fig, _imgui_cv_tiles, imgui_image_lister]:
+        assert not hasattr(module, "imgui_runner")
+
+
+def test_frame_pacer_async_lets_other_tasks_run():
+    async def main():
+        frame_pacer = imgui_runner._FramePacer(max_fps=100)
+        nb_ticks = 0
+
+        async def background_task():
+            nonlocal nb_ticks
+            while True:
+                nb_ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.ensure_future(background_task())
+        start = default_timer()
+        for _ in range(11):
+            await frame_pacer.wait_async()
+        duration = default_timer() - start
+        task.cancel()
+        return duration, nb_ticks
+
+    duration, nb_ticks = asyncio.run(main())
+    assert 0.1 <= duration < 0.2
+    assert nb_ticks > 10
+
+
+def test_call_maybe_async():
+    async def coroutine_function(x):
+        await asyncio.sleep(0)
+        return x + 1
+    assert asyncio.run(imgui_runner._call_maybe_async(coroutine_function, 1)) == 2
+    assert asyncio.run(imgui_runner._call_maybe_async(lambda x: x + 2, 1)) == 3
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `imgui_scatter`."""
+
+import imgui
+import numpy as np
+import pytest
+
+from imgui_datascience import imgui_cv, imgui_runner, imgui_scatter
+from imgui_datascience._imgui_cv_zoom import compute_zoom_matrix
+from imgui_datascience.gl_backend import RecordingGlBackend
+from imgui_datascience.imgui_cv import SizePixel
+
+VIEWPORT_SIZE = SizePixel(200, 150)
+
+
+@pytest.fixture(scope="module")
+def points():
+    random_state = np.random.RandomState(0)
+    x = random_state.randn(100000)
+    y = random_state.randn(100000) * 0.5 + x * 0.3
+    return x, y, imgui_scatter.ScatterData(x, y, grid_size=256)
+
+
+def zoomed_transform(data, zoom):
+    zoom_matrix = compute_zoom_matrix(imgui.Vec2(VIEWPORT_SIZE.width / 2, VIEWPORT_SIZE.height / 2), zoom)
+    return np.dot(zoom_matrix, data.full_view(VIEWPORT_SIZE))
+
+
+def brute_force_density(x, y, affine_transform):
+    px = x * affine_transform[0, 0] + affine_transform[0, 2]
+    py = y * affine_transform[1, 1] + affine_transform[1, 2]
+    density, _, _ = np.histogram2d(py, px, bins=(VIEWPORT_SIZE.height, VIEWPORT_SIZE.width),
+                                   range=((0, VIEWPORT_SIZE.height), (0, VIEWPORT_SIZE.width)))
+    return density
+
+
+@pytest.mark.parametrize("zoom", [0.5, 1., 2., 4., 16.])
+def test_density_image(points, zoom):
+    x, y, data = points
+    affine_transform = zoomed_transform(data, zoom)
+    density = imgui_scatter.density_image(data, affine_transform, VIEWPORT_SIZE)
+    expected = brute_force_density(x, y, affine_transform)
+    assert density.shape == expected.shape
+    # (the density of the coarse levels and of the warped grid is approximate)
+    assert density.sum() == pytest.approx(expected.sum(), rel=0.02)
+    if zoom >= 16.:
+        assert np.array_equal(density, expected)
+
+
+def test_colorize_density():
+    density = np.zeros((10, 20))
+    density[5, 5] = 3.
+    image = imgui_scatter.colorize_density(density)
+    assert image.shape == (10, 20, 3) and image.dtype == np.uint8
+    assert tuple(image[0, 0]) == imgui_scatter.SCATTER_BACKGROUND_COLOR
+    assert tuple(image[5, 5]) != imgui_scatter.SCATTER_BACKGROUND_COLOR
+
+
+@pytest.mark.parametrize("zoom", [1., 8.])
+def test_nearest_point(points, zoom):
+    x, y, data = points
+    affine_transform = zoomed_transform(data, zoom)
+    for position in [imgui.Vec2(100, 75), imgui.Vec2(20, 30), imgui.Vec2(-100, -100)]:
+        px = x * affine_transform[0, 0] + affine_transform[0, 2]
+        py = y * affine_transform[1, 1] + affine_transform[1, 2]
+        distances = np.hypot(px - position.x, py - position.y)
+        expected = int(np.argmin(distances)) if distances.min() <= imgui_scatter.SCATTER_HOVER_MAX_DISTANCE else None
+        assert imgui_scatter.nearest_point(data, affine_transform, position) == expected
+
+
+def test_scatter_widget(points):
+    _, _, data = points
+    all_states = imgui_scatter.scatter.statics.all_states
+    all_states.clear()
+    frame_states = []
+
+    def gui():
+        imgui_scatter.scatter(data, 200, 150, "scatter")
+        frame_states.extend(all_states.values())
+    stats = imgui_runner.run_headless(gui, nb_frames=3)
+    # the state of the plot (zoom, image) is kept between the frames
+    assert len(frame_states) == 3 and all(state is frame_states[0] for state in frame_states)
+    # the density image is uploaded once
+    assert stats.frame_bytes_uploaded[0] == 200 * 150 * 3
+    assert stats.frame_bytes_uploaded[1:] == [0, 0]
+
+
+def test_scatter_reuses_its_texture_when_panned(points):
+    _, _, data = points
+    all_states = imgui_scatter.scatter.statics.all_states
+    all_states.clear()
+    nb_cache_entries = []
+
+    def gui():
+        for state in all_states.values():
+            state.zoom_info.affine_transform = np.dot(zoomed_transform(data, 1.25), state.zoom_info.affine_transform)
+        imgui_scatter.scatter(data, 200, 150, "scatter")
+        nb_cache_entries.append(len(imgui_cv.ALL_TEXTURES))
+    gl_backend = RecordingGlBackend()
+    imgui_runner.run_headless(gui, nb_frames=4, gl_backend=gl_backend)
+    # the density image is computed again at each frame, but it keeps one cache entry and one texture
+    assert len(set(nb_cache_entries)) == 1
+    assert gl_backend.nb_calls["gen_texture"] == 1
+    assert gl_backend.nb_calls["tex_image_2d"] == 1
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Regression tests for the texture cache of imgui_cv (without GPU, via RecordingGlBackend)."""
+
+import gc
+import weakref
+import numpy as np
+import imgui
+import pytest
+
+from imgui_datascience import imgui_cv, imgui_ext
+from imgui_datascience.imgui_image_lister import _ImguiImageLister
+from imgui_datascience.gl_backend import GlBackend, RecordingGlBackend
+
+
+@pytest.fixture
+def gl_backend(monkeypatch):
+    backend = RecordingGlBackend(keep_calls=True)
+    monkeypatch.setattr(imgui_cv, "GL_BACKEND", backend)
+    context = imgui.create_context()
+    io = imgui.get_io()
+    io.ini_file_name = None
+    io.display_size = 1600, 1200
+    io.fonts.get_tex_data_as_rgba32()
+    yield backend
+    imgui_cv._release_all_textures()
+    assert backend.nb_live_textures == 0
+    imgui.destroy_context(context)
+
+
+def run_frame(gui_function):
+    imgui.get_io().delta_time = 1. / 60.
+    imgui.new_frame()
+    imgui.begin("test")
+    gui_function()
+    imgui.end()
+    imgui.render()
+    imgui_cv._clear_all_cv_textures()
+    getattr(imgui_ext, "__clear_all_unique_labels")()
+
+
+def random_image(seed, width=640, height=480):
+    return np.random.RandomState(seed).randint(0, 255, (height, width, 3)).astype(np.uint8)
+
+
+def test_unchanged_image_is_uploaded_once(gl_backend):
+    image = random_image(0)
+    for _ in range(10):
+        run_frame(lambda: imgui_cv.image(image))
+    assert gl_backend.nb_calls["tex_image_2d"] == 1
+    assert gl_backend.nb_calls["tex_sub_image_2d"] == 0
+    assert gl_backend.bytes_uploaded == image.nbytes
+
+
+def test_small_change_uploads_dirty_tiles_only(gl_backend):
+    image = random_image(0)
+    run_frame(lambda: imgui_cv.image(image, hash_strategy=imgui_cv.HashStrategy.Full))
+    gl_backend.reset_counters()
+    image[10, 10] = (image[10, 10] + 1) % 255
+    run_frame(lambda: imgui_cv.image(image, hash_strategy=imgui_cv.HashStrategy.Full))
+    assert gl_backend.nb_calls["tex_sub_image_2d"] == 1
+    assert gl_backend.bytes_uploaded == imgui_cv.DIRTY_TILE_SIZE * imgui_cv.DIRTY_TILE_SIZE * 3
+
+
+def test_vram_budget_is_respected(gl_backend, monkeypatch):
+    image_nb_bytes = random_image(0).nbytes
+    monkeypatch.setattr(imgui_cv, "TEXTURE_CACHE_MAX_BYTES", 5 * image_nb_bytes)
+    images = [random_image(seed) for seed in range(20)]
+    for image in images:
+        run_frame(lambda: imgui_cv.image(image))
+        assert gl_backend.live_texture_bytes <= 5 * image_nb_bytes
+    assert gl_backend.nb_live_textures <= 5
+
+
+def test_scrolling_the_lister_uploads_at_most_one_image_per_frame(gl_backend):
+    lister = _ImguiImageLister()
+    lister.opened = True
+    images = [random_image(seed) for seed in range(30)]
+    for i, image in enumerate(images):
+        lister.push_image(f"image {i}", image)
+    nb_uploads = 0
+    for i in range(len(images)):
+        lister.current_image = f"image {i}"
+        gl_backend.reset_counters()
+        run_frame(lister._heartbeat)
+        assert gl_backend.bytes_uploaded <= images[0].nbytes
+        nb_uploads += gl_backend.nb_calls["tex_image_2d"] + gl_backend.nb_calls["tex_sub_image_2d"]
+    assert nb_uploads == len(images)
+
+
+def test_stats(gl_backend):
+    imgui_cv.reset_stats()
+    images = [random_image(seed) for seed in range(3)]
+    for _ in range(4):
+        run_frame(lambda: [imgui_cv.image(image) for image in images])
+    stats = imgui_cv.stats()
+    assert stats["total"]["nb_uploads"] == 3
+    assert stats["total"]["bytes_uploaded"] == sum(image.nbytes for image in images)
+    assert stats["total"]["nb_cache_misses"] == 3
+    assert stats["total"]["nb_cache_hits"] == 9
+    assert stats["total"]["nb_textures_created"] == gl_backend.nb_calls["gen_texture"]
+    assert stats["total"]["hash_duration"] > 0.
+    assert stats["last_frame"]["nb_uploads"] == 0
+    assert stats["last_frame"]["nb_cache_hits"] == 3
+    assert stats["gauges"]["nb_live_textures"] == gl_backend.nb_live_textures
+    assert stats["gauges"]["live_texture_bytes"] == gl_backend.live_texture_bytes
+
+    imgui_cv.reset_stats()
+    assert imgui_cv.stats()["total"]["nb_uploads"] == 0
+    assert imgui_cv.stats()["gauges"]["nb_live_textures"] == gl_backend.nb_live_textures
+
+
+def test_zoom_sampling_is_set_once(gl_backend):
+    image = random_image(0)
+    run_frame(lambda: imgui_cv.image_explorer(image, width=320, height=240))
+    assert gl_backend.nb_calls["tex_parameter_i"] == 4
+    # zoom & pan are performed via the uv coordinates: the texture parameters are not set again
+    gl_backend.reset_counters()
+    for _ in range(5):
+        run_frame(lambda: imgui_cv.image_explorer(image, width=320, height=240))
+    assert gl_backend.nb_calls["tex_parameter_i"] == 0
+    assert gl_backend.nb_calls["tex_parameter_fv"] == 0
+
+
+def test_image_and_explorer_use_their_own_sampling(gl_backend):
+    image = random_image(0)
+
+    def gui():
+        imgui_cv.image(image)
+        imgui_cv.image_explorer(image, width=320, height=240)
+    run_frame(gui)
+    assert gl_backend.nb_live_textures == 2
+    linear_texture = imgui_cv.ALL_TEXTURES[id(image)].gpu_texture
+    zoom_texture = imgui_cv.ALL_TEXTURES[(id(image), "zoom")].gpu_texture
+    assert linear_texture.zoom_sampling is False and zoom_texture.zoom_sampling is True
+    # the sampling of each texture is set once
+    gl_backend.reset_counters()
+    for _ in range(3):
+        run_frame(gui)
+    assert gl_backend.nb_calls["tex_parameter_i"] == 0
+
+
+def test_full_upload_without_dirty_tiles(gl_backend, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "USE_DIRTY_TILES", False)
+    image = random_image(0)
+    run_frame(lambda: imgui_cv.image(image, hash_strategy=imgui_cv.HashStrategy.Full))
+    image[10, 10] = (image[10, 10] + 1) % 255
+    gl_backend.reset_counters()
+    run_frame(lambda: imgui_cv.image(image, hash_strategy=imgui_cv.HashStrategy.Full))
+    assert gl_backend.nb_calls["tex_image_2d"] == 0
+    assert gl_backend.nb_calls["tex_sub_image_2d"] == 1
+    assert gl_backend.bytes_uploaded == image.nbytes
+
+
+def test_size_change_reallocates_the_storage(gl_backend):
+    # (same linked address: both images use the same cache entry)
+    run_frame(lambda: imgui_cv.image(random_image(0), linked_user_image_address=1))
+    run_frame(lambda: imgui_cv.image(random_image(1, 320, 240), linked_user_image_address=1))
+    assert [call[1:3] for call in gl_backend.calls_to("tex_image_2d")] == [(640, 480), (320, 240)]
+    assert gl_backend.nb_calls["tex_sub_image_2d"] == 0
+
+
+def test_texture_pool(gl_backend, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "TEXTURE_POOL_MAX_BYTES", 2000)
+    pool = imgui_cv._TexturePool()
+    texture_ids = [imgui_cv._generate_texture_id() for _ in range(3)]
+    pool.release(texture_ids[0], (10, 10, 1), 300)
+    pool.release(texture_ids[1], (20, 20, 1), 1200)
+    # the textures are recycled by size and format
+    assert pool.acquire((10, 10, 2)) is None
+    assert pool.acquire((10, 10, 1)) == texture_ids[0]
+    pool.release(texture_ids[0], (10, 10, 1), 300)
+    # over budget: the least recently released texture is deleted
+    pool.release(texture_ids[2], (30, 30, 1), 1000)
+    assert texture_ids[1] not in gl_backend.live_textures
+    assert pool.nb_bytes == 1300 and pool.acquire((20, 20, 1)) is None
+    pool.clear()
+    assert gl_backend.nb_live_textures == 0
+
+
+def test_size_change_recycles_pooled_textures(gl_backend):
+    images = [random_image(0), random_image(1, 320, 240)]
+    for i in range(6):
+        run_frame(lambda: imgui_cv.image(images[i % 2], linked_user_image_address=1))
+    # (one texture per size: the other one waits in the pool)
+    assert gl_backend.nb_calls["gen_texture"] == 2
+    assert gl_backend.nb_calls["tex_image_2d"] == 2
+
+
+def test_textures_of_dead_images_are_recycled(gl_backend):
+    # a new image per frame (e.g. a video): the textures of the former frames are recycled
+    for seed in range(200):
+        run_frame(lambda: imgui_cv.image(random_image(seed % 7)))
+        assert len(imgui_cv.ALL_TEXTURES) <= 2
+    assert gl_backend.nb_live_textures <= 2
+    assert gl_backend.nb_calls["gen_texture"] <= 2
+
+
+def test_hidden_image_is_not_uploaded_again(gl_backend, monkeypatch):
+    image = random_image(0)
+    run_frame(lambda: imgui_cv.image(image))
+    for _ in range(100):
+        run_frame(lambda: imgui_cv.image(random_image(1)))
+    monkeypatch.setattr(imgui_cv, "timer", lambda: 1E9) # (a long frame)
+    run_frame(lambda: None)
+    gl_backend.reset_counters()
+    run_frame(lambda: imgui_cv.image(image))
+    assert gl_backend.bytes_uploaded == 0
+
+
+def test_zoomed_images_entry_lives_as_long_as_the_explorer(gl_backend, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "USE_GPU_ZOOM", False)
+    image = random_image(0)
+    for _ in range(3):
+        run_frame(lambda: imgui_cv.image_explorer(np.rot90(image), width=320, height=240))
+    # (one entry for the texture of the current explorer)
+    assert len(imgui_cv.ALL_TEXTURES) == 1
+
+
+def test_cache_does_not_retain_images(gl_backend):
+    image, other_image = random_image(0), random_image(1)
+    image_ref = weakref.ref(image)
+    run_frame(lambda: [imgui_cv.image(image), imgui_cv.image(other_image)])
+    del image
+    gc.collect()
+    assert image_ref() is None
+    assert len(imgui_cv.ALL_TEXTURES) == 2
+
+
+@pytest.mark.parametrize("image, texture_format, nb_bytes_per_pixel", [
+    (np.zeros((48, 64), np.uint8), imgui_cv.TEXTURE_FORMAT_GREY, 1),
+    (np.zeros((48, 64), np.float64), imgui_cv.TEXTURE_FORMAT_GREY_FLOAT, 4),
+    (np.zeros((48, 64, 4), np.uint8), imgui_cv.TEXTURE_FORMAT_BGRA, 4),
+    (np.zeros((48, 64, 3), np.uint8), imgui_cv.TEXTURE_FORMAT_BGR, 3),
+])
+def test_native_texture_formats(gl_backend, image, texture_format, nb_bytes_per_pixel):
+    run_frame(lambda: imgui_cv.image(image))
+    internal_format, width, height, pixel_format, pixel_type, nb_bytes = gl_backend.calls_to("tex_image_2d")[0]
+    assert (internal_format, pixel_format, pixel_type) == \
+        (texture_format.internal_format, texture_format.pixel_format, texture_format.pixel_type)
+    assert nb_bytes == 64 * 48 * nb_bytes_per_pixel
+    swizzle = gl_backend.calls_to("tex_parameter_iv")[0][1]
+    assert (swizzle[0] == swizzle[1] == swizzle[2]) == texture_format.swizzle_grey
+
+
+def test_rgb_conversion_without_native_formats(gl_backend, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "USE_NATIVE_TEXTURE_FORMATS", False)
+    run_frame(lambda: imgui_cv.image(np.zeros((48, 64), np.float32)))
+    upload = gl_backend.calls_to("tex_image_2d")[0]
+    assert upload[0] == imgui_cv.TEXTURE_FORMAT_BGR.internal_format and upload[-1] == 64 * 48 * 3
+
+
+def test_refresh_does_not_copy_the_image():
+    image = random_image(0)
+    img_upload, _ = imgui_cv._image_for_upload(imgui_cv.ImageAndAdjustments(image, imgui_cv.ImageAdjustments()))
+    assert img_upload is image
+    # with adjustments, a single buffer is allocated, and uint8 results are saturated
+    adjusted, _ = imgui_cv._image_for_upload(
+        imgui_cv.ImageAndAdjustments(image, imgui_cv.ImageAdjustments(factor=2., delta=10.)))
+    assert not np.shares_memory(adjusted, image)
+    expected = np.clip((image.astype(np.float64) + 10.) * 2., 0, 255).astype(np.uint8)
+    assert np.array_equal(adjusted, expected)
+
+
+def test_hash_strategies():
+    image = random_image(0)
+    changed_image = image.copy()
+    changed_image[0, 5] = (changed_image[0, 5] + 1) % 255
+    for hash_strategy in [imgui_cv.HashStrategy.StridedRows, imgui_cv.HashStrategy.Full]:
+        assert imgui_cv._hash_image(image, hash_strategy) == imgui_cv._hash_image(image.copy(), hash_strategy)
+        assert imgui_cv._hash_image(image, hash_strategy) != imgui_cv._hash_image(changed_image, hash_strategy)
+    assert imgui_cv._hash_image(image, imgui_cv.HashStrategy.SampledPixels) == \
+        imgui_cv._hash_image(image.copy(), imgui_cv.HashStrategy.SampledPixels)
+
+
+def test_sample_indices_cache_is_bounded():
+    for image_size in range(1000, 1000 + 2 * imgui_cv.SAMPLE_INDICES_CACHE_SIZE):
+        imgui_cv._sample_indices(image_size)
+    assert len(imgui_cv._sample_indices.statics.sample_indices) == imgui_cv.SAMPLE_INDICES_CACHE_SIZE
+    assert np.array_equal(imgui_cv._sample_indices(10000), imgui_cv._sample_indices(10000))
+
+
+def test_version_skips_hashing(gl_backend, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("the image shall not be hashed")
+    monkeypatch.setattr(imgui_cv, "_hash_image", fail)
+    image = random_image(0)
+    for version in [0, 0, 1]:
+        image[:] = random_image(version)
+        run_frame(lambda: imgui_cv.image(image, version=version))
+        run_frame(lambda: imgui_cv.image_explorer(image, width=320, height=240, version=version))
+    # (one upload per version for imgui_cv.image, and one for the explorer, which samples its texture differently)
+    assert gl_backend.nb_calls["tex_image_2d"] + gl_backend.nb_calls["tex_sub_image_2d"] == 4
+
+
+def test_reused_version_is_reported(gl_backend, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "DEBUG_CHECK_IMAGE_VERSIONS", True)
+    monkeypatch.setattr(imgui_cv, "NB_VERSION_MISMATCHES", 0)
+    image = random_image(0)
+    run_frame(lambda: imgui_cv.image(image, version=1))
+    image[:] = random_image(1)
+    # the version was not changed: the texture is not refreshed, but the mistake is reported
+    run_frame(lambda: imgui_cv.image(image, version=1))
+    assert gl_backend.nb_calls["tex_image_2d"] + gl_backend.nb_calls["tex_sub_image_2d"] == 1
+    assert imgui_cv.NB_VERSION_MISMATCHES == 1
+    run_frame(lambda: imgui_cv.image(image, version=2))
+    assert gl_backend.nb_calls["tex_image_2d"] + gl_backend.nb_calls["tex_sub_image_2d"] == 2
+    assert imgui_cv.NB_VERSION_MISMATCHES == 1
+
+
+def test_identical_images_share_a_texture(gl_backend):
+    image, image_copy = random_image(0), random_image(0)
+    run_frame(lambda: [imgui_cv.image(image), imgui_cv.image(image_copy)])
+    assert gl_backend.nb_calls["tex_image_2d"] == 1 and gl_backend.nb_live_textures == 1
+    assert imgui_cv.LAST_FRAME_METRICS.nb_shared_textures == 1
+    # when one of the images changes, it gets a texture of its own
+    image_copy[:] = random_image(1)
+    run_frame(lambda: [imgui_cv.image(image), imgui_cv.image(image_copy)])
+    assert gl_backend.nb_calls["tex_image_2d"] == 2 and gl_backend.nb_live_textures == 2
+    assert imgui_cv.ALL_TEXTURES[id(image)].texture_id != imgui_cv.ALL_TEXTURES[id(image_copy)].texture_id
+
+
+def test_no_sharing_without_shared_textures(gl_backend, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "USE_SHARED_TEXTURES", False)
+    image, image_copy = random_image(0), random_image(0)
+    run_frame(lambda: [imgui_cv.image(image), imgui_cv.image(image_copy)])
+    assert gl_backend.nb_calls["tex_image_2d"] == 2
+
+
+def test_thumbnails_are_downscaled_before_upload(gl_backend):
+    image = random_image(0)
+    run_frame(lambda: imgui_cv.image(image, width=160))
+    assert [call[1:3] for call in gl_backend.calls_to("tex_image_2d")] == [(160, 120)]
+    assert gl_backend.bytes_uploaded == 160 * 120 * 3
+    # the original size uses its own texture
+    run_frame(lambda: imgui_cv.image(image))
+    assert [call[1:3] for call in gl_backend.calls_to("tex_image_2d")] == [(160, 120), (640, 480)]
+
+
+def test_thumbnails_without_downscale(gl_backend, monkeypatch):
+    monkeypatch.setattr(imgui_cv, "DOWNSCALE_THUMBNAILS", False)
+    run_frame(lambda: imgui_cv.image(random_image(0), width=160))
+    assert [call[1:3] for call in gl_backend.calls_to("tex_image_2d")] == [(640, 480)]
+
+
+def test_incomplete_gl_backend_fails_at_construction():
+    class IncompleteGlBackend(GlBackend):
+        def gen_texture(self):
+            return 1
+    with pytest.raises(TypeError):
+        IncompleteGlBackend()
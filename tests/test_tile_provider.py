@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the tile providers of image_explorer (out-of-core images)."""
+
+import time
+import numpy as np
+import pytest
+
+from imgui_datascience import _imgui_cv_tiles
+from imgui_datascience._imgui_cv_tiles import TileProvider, MemmapTileProvider, compose_tiles, visible_tiles
+from imgui_datascience.imgui_cv import SizePixel
+
+
+class ArrayTileProvider(TileProvider):
+    """
+    An in-memory TileProvider, which counts the tiles that are read
+    """
+    def __init__(self, array, tile_size=64, fail=False):
+        super().__init__(array.shape, array.dtype, tile_size, nb_threads=2)
+        self.array = array
+        self.fail = fail
+        self.nb_reads = 0
+
+    def read_tile(self, level, tile_y, tile_x):
+        self.nb_reads += 1
+        if self.fail:
+            raise IOError("unreadable tile")
+        step = 2 ** level
+        span = self.tile_span(level)
+        return np.ascontiguousarray(self.array[tile_y * span:(tile_y + 1) * span:step,
+                                               tile_x * span:(tile_x + 1) * span:step])
+
+    def read_pixel(self, y, x):
+        return self.array[y, x]
+
+
+def wait_for_tiles(provider):
+    while provider.has_pending_tiles():
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def array():
+    return np.random.RandomState(0).randint(0, 255, (200, 300)).astype(np.uint8)
+
+
+def test_provider_shall_implement_read_tile():
+    class IncompleteProvider(TileProvider):
+        def read_pixel(self, y, x):
+            return 0
+    with pytest.raises(TypeError):
+        IncompleteProvider((10, 10), np.uint8)
+
+
+def test_tiles_are_read_asynchronously(array):
+    with ArrayTileProvider(array) as provider:
+        assert provider.nb_levels() == 4
+        assert provider.get_tile(0, 1, 2) is None and provider.get_tile(1, 0, 0) is None
+        wait_for_tiles(provider)
+        assert np.array_equal(provider.get_tile(0, 1, 2), array[64:128, 128:192])
+        assert np.array_equal(provider.get_tile(1, 0, 0), array[0:128:2, 0:128:2])
+        assert provider.nb_reads == 2
+        assert provider[10, 20] == array[10, 20]
+
+
+def test_tiles_are_not_read_after_close(array):
+    provider = ArrayTileProvider(array)
+    provider.close()
+    assert provider.get_tile(0, 0, 0) is None
+    assert not provider.has_pending_tiles() and provider.nb_reads == 0
+
+
+def test_read_errors_are_reported_once(array):
+    with ArrayTileProvider(array, fail=True) as provider:
+        for _ in range(3):
+            assert provider.get_tile(0, 0, 0) is None
+            wait_for_tiles(provider)
+        assert provider.nb_reads == 1
+        assert list(provider.read_errors.keys()) == [(0, 0, 0)]
+
+
+def test_visible_tiles(array):
+    with ArrayTileProvider(array) as provider:
+        identity = np.eye(3)
+        assert visible_tiles(provider, identity, SizePixel(100, 70), 0) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+        # the viewport shows the pixels [150, 250[ x [100, 150[ of the image
+        translation = np.array([[1., 0., -150.], [0., 1., -100.], [0., 0., 1.]])
+        assert visible_tiles(provider, translation, SizePixel(100, 50), 0) == [(1, 2), (1, 3), (2, 2), (2, 3)]
+        assert visible_tiles(provider, translation, SizePixel(100, 50), 1) == [(0, 1), (1, 1)]
+        outside = np.array([[1., 0., 1000.], [0., 1., 0.], [0., 0., 1.]])
+        assert visible_tiles(provider, outside, SizePixel(100, 50), 0) == []
+
+
+def test_compose_tiles(array, monkeypatch):
+    nb_drawn_tiles = [0]
+    original_draw_tile = _imgui_cv_tiles._draw_tile
+
+    def draw_tile(*args):
+        nb_drawn_tiles[0] += 1
+        original_draw_tile(*args)
+
+    monkeypatch.setattr(_imgui_cv_tiles, "_draw_tile", draw_tile)
+    with ArrayTileProvider(array) as provider:
+        translation = np.array([[1., 0., -150.], [0., 1., -100.], [0., 0., 1.]])
+        canvas, level = compose_tiles(provider, translation, SizePixel(100, 50))
+        wait_for_tiles(provider)
+        canvas, level = compose_tiles(provider, translation, SizePixel(100, 50))
+        assert level == 0
+        assert np.array_equal(canvas, array[100:150, 150:250])
+        # nothing changed: the canvas is not composed again
+        nb_drawn_tiles[0] = 0
+        assert compose_tiles(provider, translation, SizePixel(100, 50))[0] is canvas
+        assert nb_drawn_tiles[0] == 0
+        # zoom out: the tiles of level 1 are read, and meanwhile the coarsest level is displayed
+        zoom_out = np.diag([0.5, 0.5, 1.])
+        _, level = compose_tiles(provider, zoom_out, SizePixel(150, 100))
+        assert level == 1
+        wait_for_tiles(provider)
+        canvas, _ = compose_tiles(provider, zoom_out, SizePixel(150, 100))
+        assert np.array_equal(canvas, array[::2, ::2])
+
+
+def test_memmap_tile_provider(array, tmp_path):
+    filename = str(tmp_path / "image.npy")
+    np.save(filename, array)
+    with MemmapTileProvider(filename, tile_size=64) as provider:
+        assert provider.shape == array.shape and provider.dtype == array.dtype
+        assert provider.get_tile(1, 0, 1) is None
+        wait_for_tiles(provider)
+        assert np.array_equal(provider.get_tile(1, 0, 1), array[0:128:2, 128:256:2])
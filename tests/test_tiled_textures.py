@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the textures of images bigger than MAX_TEXTURE_SIZE (grid split and culling)."""
+
+import numpy as np
+import pytest
+
+from imgui_datascience import imgui_cv
+from imgui_datascience.imgui_cv import SizePixel
+from imgui_datascience.gl_backend import RecordingGlBackend
+
+
+@pytest.fixture
+def fake_gl(monkeypatch):
+    gl_backend = RecordingGlBackend(max_texture_size=1000, keep_calls=True)
+    monkeypatch.setattr(imgui_cv, "GL_BACKEND", gl_backend)
+    monkeypatch.setattr(imgui_cv, "TEXTURE_TILE_SIZE", 512)
+    yield gl_backend
+    imgui_cv._release_all_textures()
+    assert gl_backend.nb_live_textures == 0
+
+
+def test_grid_split_covers_image():
+    tiles = imgui_cv._visible_texture_tiles(SizePixel(10000, 5000), 4096, SizePixel(1000, 500))
+    assert [(tile.tile_y, tile.tile_x) for tile in tiles] == [(y, x) for y in range(2) for x in range(3)]
+    assert tiles[-1].slice_x == slice(8192, 10000)
+    assert tiles[-1].slice_y == slice(4096, 5000)
+    # the tiles are drawn side by side, and fill the viewport
+    assert tiles[0].viewport_p0 == (0., 0.)
+    assert tiles[0].viewport_p1 == pytest.approx((409.6, 409.6))
+    assert tiles[1].viewport_p0 == pytest.approx((409.6, 0.))
+    assert tiles[-1].viewport_p1 == pytest.approx((1000., 500.))
+    for tile in tiles:
+        assert tile.uv0 == (0., 0.)
+        assert tile.uv1 == (1., 1.)
+
+
+def test_culling_keeps_only_visible_tiles():
+    image_size = SizePixel(4000, 4000)
+    # display the [1500, 2500] x [100, 600] part of the image
+    uv0 = (1500. / 4000., 100. / 4000.)
+    uv1 = (2500. / 4000., 600. / 4000.)
+    tiles = imgui_cv._visible_texture_tiles(image_size, 1024, SizePixel(500, 250), uv0, uv1)
+    assert [(tile.tile_y, tile.tile_x) for tile in tiles] == [(0, 1), (0, 2)]
+    left, right = tiles
+    assert left.uv0 == pytest.approx(((1500. - 1024.) / 1024., 100. / 1024.))
+    assert left.uv1 == pytest.approx((1., 600. / 1024.))
+    assert left.viewport_p1[0] == pytest.approx(right.viewport_p0[0])
+    assert right.viewport_p1 == pytest.approx((500., 250.))
+
+
+def test_culling_outside_of_image():
+    tiles = imgui_cv._visible_texture_tiles(SizePixel(4000, 4000), 1024, SizePixel(100, 100), (1.5, 1.5), (2., 2.))
+    assert tiles == []
+
+
+def test_needs_texture_tiles(fake_gl):
+    assert not imgui_cv._needs_texture_tiles(SizePixel(1000, 1000))
+    assert imgui_cv._needs_texture_tiles(SizePixel(1001, 10))
+
+
+def test_only_visible_tiles_are_uploaded(fake_gl):
+    # (distinct tile contents: identical tiles would share a texture, @see USE_SHARED_TEXTURES)
+    image = np.random.RandomState(0).randint(0, 255, (2000, 3000)).astype(np.uint8)
+    image_and_adjustments = imgui_cv.ImageAndAdjustments(image, imgui_cv.ImageAdjustments())
+    uv0, uv1 = (0.4, 0.4), (0.6, 0.6) # pixels [1200, 1800] x [800, 1200]: tiles x in [2, 3], y in [1, 2]
+    tiles_and_textures = imgui_cv._tiled_image_to_textures(
+        image_and_adjustments, SizePixel(600, 400), uv0, uv1,
+        always_refresh=False, linked_user_image_address=0, zoom_sampling=True)
+    assert sorted((tile.tile_y, tile.tile_x) for tile, _ in tiles_and_textures) == [(1, 2), (1, 3), (2, 2), (2, 3)]
+    uploads = fake_gl.calls_to("tex_image_2d")
+    assert len(uploads) == 4
+    for upload in uploads:
+        width, height = upload[1], upload[2]
+        assert width <= 512 and height <= 512
+    assert len(set(texture_id for _, texture_id in tiles_and_textures)) == 4
+
+    # nothing is transferred when the image did not change
+    imgui_cv._tiled_image_to_textures(
+        image_and_adjustments, SizePixel(600, 400), uv0, uv1,
+        always_refresh=False, linked_user_image_address=0, zoom_sampling=True)
+    assert len(fake_gl.calls_to("tex_image_2d")) == 4
+    assert len(fake_gl.calls_to("tex_sub_image_2d")) == 0
+
+    # panning transfers only the tiles that become visible
+    imgui_cv._tiled_image_to_textures(
+        image_and_adjustments, SizePixel(600, 400), (0.5, 0.4), (0.7, 0.6),
+        always_refresh=False, linked_user_image_address=0, zoom_sampling=True)
+    assert len(fake_gl.calls_to("tex_image_2d")) == 6